@@ -0,0 +1,57 @@
+"""Micro-benchmark: log inserts per second, one connection per insert vs. the pooled, batched repository.
+
+Run from the repository root:
+    python -m benchmarks.db_inserts [--rows 5000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import dashboard.repository.sqlite.db as db
+
+
+def legacy_save_log(db_path, timestamp, level, message):
+    # What save_log used to do: a fresh connection and a commit per row
+    with sqlite3.connect(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("insert into logs (timestamp, level, message) values (?, ?, ?)", (timestamp, level, message))
+
+
+def bench_legacy(db_path, rows):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("create table if not exists logs (timestamp, level, message)")
+    start = time.perf_counter()
+    for i in range(rows):
+        legacy_save_log(db_path, f"2025-01-01T00:00:{i:06d}", "info", f"message {i}")
+    return rows / (time.perf_counter() - start)
+
+
+def bench_batched(db_path, rows):
+    db.path = db_path
+    db.create_tables()
+    start = time.perf_counter()
+    for i in range(rows):
+        db.save_log(f"2025-01-01T00:00:{i:06d}", "info", f"message {i}")
+    db.flush_logs()
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = bench_legacy(os.path.join(tmp, "legacy.db"), args.rows)
+        batched = bench_batched(os.path.join(tmp, "batched.db"), args.rows)
+        db.close_connection()
+
+    print(f"legacy  (connect + commit per row): {legacy:12,.0f} inserts/s")
+    print(f"batched (WAL, pooled, background):  {batched:12,.0f} inserts/s")
+    print(f"speedup: {batched / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
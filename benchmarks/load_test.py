@@ -0,0 +1,158 @@
+"""Load test: concurrent streaming prompts against a node, reporting requests per second and latency percentiles.
+
+Starts the stub Ollama server and main.py (dashboard role, from a temporary directory so the repository database is
+left alone) once per server, creates instances and has every client send prompts to the streaming endpoint one after
+another, reading each reply to its end.
+    python -m benchmarks.load_test --servers waitress,werkzeug --clients 32 --requests 400
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from benchmarks.stub_ollama import serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 11504
+NODE_PORT = 5091
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    env["OLLAMA_HOST"] = f"http://127.0.0.1:{PORT}"
+    return env
+
+
+def _get(path: str) -> bytes:
+    with urllib.request.urlopen(f"http://127.0.0.1:{NODE_PORT}{path}", timeout=5) as res:
+        return res.read()
+
+
+def _wait_ready(proc: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            return json.loads(_get("/instance/presets"))
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"node did not start (exit code {proc.poll()})")
+
+
+def stream_prompt(instance_id: int, prompt: str) -> tuple[float, float]:
+    """Send one prompt to the streaming endpoint and read the reply. Returns (seconds to first token, total seconds)."""
+    start = time.perf_counter()
+    first = None
+    conn = http.client.HTTPConnection("127.0.0.1", NODE_PORT, timeout=60)
+    try:
+        conn.request("POST", f"/instance/prompt/{instance_id}/stream", json.dumps({"prompt": prompt}),
+                     {"Content-Type": "application/json"})
+        res = conn.getresponse()
+        if res.status != 200:
+            raise RuntimeError(f"status {res.status}")
+        for line in res:
+            if first is None and line.startswith(b"data: {\"token\""):
+                first = time.perf_counter() - start
+            elif line.startswith(b"event: done"):
+                data = json.loads(res.readline()[len(b"data: "):])
+                if data["status"] != "done":
+                    raise RuntimeError(f"job {data['status']}: {data['error']}")
+                break
+        else:
+            raise RuntimeError("stream ended without a done event")
+    finally:
+        conn.close()
+    total = time.perf_counter() - start
+    return first if first is not None else total, total
+
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else float("nan")
+
+
+def run(server: str, clients: int, requests: int, instances: int, timeout: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py"), "--role", "dashboard", "--port",
+                                 str(NODE_PORT), "--server", server], cwd=tmp, env=_env(),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            preset = _wait_ready(proc, timeout)[0]
+            ids = []
+            for _ in range(instances):
+                # "Instance created with preset X and ID N"
+                ids.append(int(_get(f"/instance/create/{preset}").decode().rsplit(" ", 1)[1]))
+
+            latencies, first_tokens, errors = [], [], []
+            lock = threading.Lock()
+            counter = iter(range(requests))
+
+            def client():
+                while True:
+                    with lock:
+                        n = next(counter, None)
+                    if n is None:
+                        return
+                    try:
+                        # Unique prompts, so the response cache does not answer them
+                        first, total = stream_prompt(ids[n % len(ids)], f"Request {n}: what time is it?")
+                    except (OSError, RuntimeError, ValueError) as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    with lock:
+                        first_tokens.append(first)
+                        latencies.append(total)
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+    return {
+        "server": server,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+        "rps": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "ttft_p95": _percentile(first_tokens, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="waitress,werkzeug", help="Comma-separated servers of main.py")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=400, help="Prompts per server")
+    parser.add_argument("--instances", type=int, default=16)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Generation speed of the stub")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the node to start")
+    args = parser.parse_args()
+
+    server, _ = serve(PORT, load_ms=0, tokens_per_second=args.tokens_per_second)
+    try:
+        print(f"{args.clients} clients, {args.requests} streamed prompts over {args.instances} instances")
+        print(f"{'server':>10} {'ok':>5} {'errors':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'ttft p95 s':>11}")
+        for name in args.servers.split(","):
+            r = run(name, args.clients, args.requests, args.instances, args.timeout)
+            print(f"{name:>10} {r['ok']:>5} {r['errors']:>6} {r['rps']:>7.1f} {r['p50']:>7.3f} {r['p95']:>7.3f} "
+                  f"{r['ttft_p95']:>11.3f}  {r['first_error']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
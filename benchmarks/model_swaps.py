@@ -0,0 +1,52 @@
+"""Model swap benchmark against the stub Ollama server: FIFO scheduling vs. residency-aware scheduling.
+
+Instances on two models share a server that keeps one model loaded, so every switch costs a load.
+    python -m benchmarks.model_swaps [--jobs 24] [--load-ms 300]
+"""
+import argparse
+import os
+import time
+
+PORT = 11501
+os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{PORT}"
+
+from benchmarks.stub_ollama import serve
+from dashboard.services.model.model_manager import ModelManager
+from dashboard.services.model.preset import Preset
+from dashboard.services.scheduler import JobScheduler
+
+
+def run(stub, jobs, affinity):
+    stub.loaded.clear()
+    stub.loads.clear()
+    manager = ModelManager()
+    manager.preload_presets([Preset("a", "model-a")], background=False)
+    scheduler = JobScheduler(max_workers=4, default_model_limit=2,
+                             resident_models=manager.resident_models if affinity else None)
+    instances = [Preset(f"p{i}", "model-a" if i % 2 == 0 else "model-b") for i in range(8)]
+
+    start = time.perf_counter()
+    submitted = [scheduler.submit(i % len(instances), instances[i % len(instances)], f"question {i}") for i in range(jobs)]
+    for job in submitted:
+        job.wait()
+    return time.perf_counter() - start, sum(stub.loads.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--load-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    server, stub = serve(PORT, load_ms=args.load_ms, tokens_per_second=200, max_loaded=1)
+    try:
+        for affinity in (False, True):
+            elapsed, loads = run(stub, args.jobs, affinity)
+            label = "residency-aware" if affinity else "fifo"
+            print(f"{label:16} {args.jobs} jobs in {elapsed:6.2f} s, {loads} model loads")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Startup benchmark: import time and time/memory until each node role serves requests and has its models loaded.
+
+Every measurement runs in a fresh process. Roles are started from a temporary directory (with the models/ directory
+linked in), so the repository database is left alone. Ollama is replaced by the stub server.
+    python -m benchmarks.startup --roles dashboard,all,voice
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.stub_ollama import serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 11503
+NODE_PORT = 5090
+# What main.py imported before the audio stack was loaded lazily
+EAGER_IMPORTS = ["dashboard.services.pipeline.transcription", "dashboard.services.pipeline.speech",
+                 "dashboard.services.pipeline.wake", "dashboard.services.pipeline.barge_in",
+                 "dashboard.services.pipeline.recorder"]
+HEAVY_PACKAGES = ["faster_whisper", "ctranslate2", "piper", "onnxruntime", "openwakeword", "webrtcvad", "sounddevice",
+                  "numpy", "ollama", "flask"]
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    env["OLLAMA_HOST"] = f"http://127.0.0.1:{PORT}"
+    return env
+
+
+def import_time(modules: list[str]) -> dict:
+    """Import modules in a fresh interpreter with -X importtime. Returns total ms and ms per heavy package."""
+    code = "; ".join(f"import {m}" for m in modules)
+    start = time.perf_counter()
+    # Importing reads user_settings.cfg from the working directory; an empty one measures the defaults
+    with tempfile.TemporaryDirectory() as tmp:
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=tmp, env=_env(),
+                             capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if res.returncode:
+        return {"error": res.stderr.strip().splitlines()[-1]}
+    # "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    packages = {}
+    for line in res.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if match and match.group(3) in HEAVY_PACKAGES:
+            packages[match.group(3)] = int(match.group(1)) / 1000
+    return {"wall_ms": wall_ms, "packages": packages}
+
+
+def _rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        return kb / 1024
+    except (OSError, StopIteration):
+        return None
+
+
+def _get_json(path: str):
+    with urllib.request.urlopen(f"http://127.0.0.1:{NODE_PORT}{path}", timeout=1) as res:
+        return json.loads(res.read())
+
+
+def start_role(role: str, timeout: float) -> dict:
+    """Start main.py with a role, wait until it answers and until its voice models are loaded (if it has any)."""
+    result = {"role": role}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(ROOT, "models"), os.path.join(tmp, "models"))
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py"), "--role", role, "--port", str(NODE_PORT)],
+                                cwd=tmp, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = start + timeout
+            status = None
+            while time.perf_counter() < deadline and proc.poll() is None:
+                try:
+                    status = _get_json("/conversation/models")
+                except OSError:
+                    time.sleep(0.02)
+                    continue
+                if "ready_s" not in result:
+                    result["ready_s"] = time.perf_counter() - start
+                    result["ready_mb"] = _rss_mb(proc.pid)
+                if not status["configured"] or status["loaded"] or status["error"]:
+                    break
+                time.sleep(0.05)
+            if status and status["loaded"]:
+                result["voice_s"] = time.perf_counter() - start
+                result["voice_mb"] = _rss_mb(proc.pid)
+            elif status and status["error"]:
+                result["error"] = status["error"]
+            elif proc.poll() is not None:
+                result["error"] = f"exited with {proc.returncode}"
+        finally:
+            proc.terminate()
+            proc.wait()
+    return result
+
+
+def _fmt(value, digits=0):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roles", default="dashboard,all,voice", help="Comma-separated roles of main.py")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for a role to load its models")
+    args = parser.parse_args()
+
+    server, _ = serve(PORT, load_ms=0)
+    try:
+        print("Import time (fresh interpreter, ms; packages cumulative)")
+        for label, modules in [("main", ["main"]), ("main + audio stack (eager, as before)", ["main"] + EAGER_IMPORTS),
+                               ("worker", ["worker", "dashboard.routes.instance_routes"])]:
+            res = import_time(modules)
+            if "error" in res:
+                print(f"  {label:<40} failed: {res['error']}")
+                continue
+            packages = ", ".join(f"{name} {ms:.0f}" for name, ms in sorted(res["packages"].items(), key=lambda p: -p[1]))
+            print(f"  {label:<40} {res['wall_ms']:>7.0f}   {packages}")
+
+        print()
+        print(f"{'role':>10} {'ready s':>8} {'RSS MB':>7} {'voice s':>8} {'RSS MB':>7}")
+        for role in args.roles.split(","):
+            r = start_role(role, args.timeout)
+            print(f"{role:>10} {_fmt(r.get('ready_s'), 2):>8} {_fmt(r.get('ready_mb')):>7} "
+                  f"{_fmt(r.get('voice_s'), 2):>8} {_fmt(r.get('voice_mb')):>7}  {r.get('error', '')}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""A stub Ollama server for benchmarks and local testing without models or a GPU.
+
+Implements /api/chat (streaming and not), /api/generate, /api/ps and /api/embed. Models "load" after a
+configurable delay and only --max-loaded models stay resident, so model swaps cost time like the real thing.
+
+    python -m benchmarks.stub_ollama --port 11500 --load-ms 800 --max-loaded 1
+    OLLAMA_HOST=http://127.0.0.1:11500 python main.py
+"""
+import argparse
+import collections
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 64
+
+
+class StubOllama:
+    def __init__(self, load_ms=500.0, tokens_per_second=100.0, max_loaded=1, reply=None):
+        self.load_ms = load_ms
+        self.tokens_per_second = tokens_per_second
+        self.max_loaded = max_loaded
+        self.reply = reply
+        self.loaded: collections.OrderedDict[str, float] = collections.OrderedDict()
+        self.loads = collections.Counter()
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, model: str) -> float:
+        """Load the model if needed, evicting the least recently used one. Returns load seconds."""
+        model = model if ":" in model else f"{model}:latest"
+        with self._lock:
+            if model in self.loaded:
+                self.loaded.move_to_end(model)
+                return 0.0
+            time.sleep(self.load_ms / 1000)
+            self.loads[model] += 1
+            self.loaded[model] = time.time()
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+            return self.load_ms / 1000
+
+    def reply_tokens(self, messages) -> list[str]:
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        text = self.reply or f"This is a stub reply to: {last}"
+        return [w + " " for w in text.split()]
+
+    def embed(self, text: str) -> list[float]:
+        # Hashed bag of words: similar texts get similar vectors, deterministic across runs
+        vec = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in text.lower().split():
+            h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little")
+            vec[h % EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+
+def _make_handler(stub: StubOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, obj, status=200):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/api/ps":
+                expires = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+                self._json({"models": [{"name": m, "model": m, "size": 0, "digest": "", "expires_at": expires}
+                                       for m in stub.loaded]})
+            elif self.path in ("/", "/api/version"):
+                self._json({"version": "stub"})
+            else:
+                self._json({"error": "not found"}, 404)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.end_headers()
+
+        def do_POST(self):
+            req = self._body()
+            model = req.get("model", "")
+            if self.path == "/api/embed":
+                inputs = req.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                load = stub.ensure_loaded(model)
+                self._json({"model": model, "embeddings": [stub.embed(t) for t in inputs],
+                            "load_duration": int(load * 1e9), "total_duration": int(load * 1e9)})
+                return
+            if self.path not in ("/api/chat", "/api/generate"):
+                self._json({"error": "not found"}, 404)
+                return
+
+            start = time.perf_counter()
+            load = stub.ensure_loaded(model)
+            if self.path == "/api/generate":
+                messages = [{"role": "user", "content": req.get("prompt") or ""}]
+                tokens = stub.reply_tokens(messages) if req.get("prompt") else []
+            else:
+                messages = req.get("messages") or []
+                tokens = stub.reply_tokens(messages)
+            key = "response" if self.path == "/api/generate" else "message"
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 4 for m in messages)
+
+            def chunk(text, done):
+                body = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": done}
+                body[key] = text if key == "response" else {"role": "assistant", "content": text}
+                if done:
+                    body.update(done_reason="stop", load_duration=int(load * 1e9),
+                                total_duration=int((time.perf_counter() - start) * 1e9),
+                                prompt_eval_count=prompt_tokens, eval_count=len(tokens))
+                return body
+
+            if not req.get("stream", True):
+                time.sleep(len(tokens) / stub.tokens_per_second)
+                self._json(chunk("".join(tokens), True))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(1 / stub.tokens_per_second)
+                    self._write_chunk(json.dumps(chunk(token, False)) + "\n")
+                self._write_chunk(json.dumps(chunk("", True)) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass # client cancelled
+
+        def _write_chunk(self, text):
+            data = text.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(port=11500, host="127.0.0.1", **options) -> tuple[ThreadingHTTPServer, StubOllama]:
+    """Start the stub on a background thread. Returns (server, stub); call server.shutdown() to stop."""
+    stub = StubOllama(**options)
+    server = ThreadingHTTPServer((host, port), _make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--load-ms", type=float, default=500.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--max-loaded", type=int, default=1)
+    args = parser.parse_args()
+    server, _ = serve(args.port, load_ms=args.load_ms, tokens_per_second=args.tokens_per_second, max_loaded=args.max_loaded)
+    print(f"Stub Ollama listening on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
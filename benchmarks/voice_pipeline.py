@@ -0,0 +1,196 @@
+"""Offline benchmark of the voice pipeline: WAV fixtures through wake word, VAD, Whisper, a stub LLM and Piper.
+
+Runs headless on CPU through the services the conversation uses: audio is replayed from WAV files into AudioCapture,
+transcribed by a StreamingTranscriber of a TranscriptionService while it is recorded, and spoken by a SpeechService
+into a NullSink. "stt" is the time from the end of speech to the transcript. Speech is measured once synthesized and
+once from the PhraseCache. Beam sizes only apply to utterances of --greedy-below seconds and longer. Every Whisper
+model size / compute type runs in a fresh process, so load time and peak memory are comparable.
+    python -m benchmarks.voice_pipeline fixtures/*.wav --whisper tiny,base,small --beam 1,5 --compute int8,float32
+    python -m benchmarks.voice_pipeline --synthesize "Hey Jarvis. Wie wird das Wetter morgen?"
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+PORT = 11502
+os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{PORT}"
+
+import numpy as np
+from piper import PiperVoice
+
+from benchmarks.stub_ollama import serve
+from dashboard.services.model.preset import Preset
+from dashboard.services.pipeline.audio_io import NullSink, WavSource, read_wav, write_wav
+from dashboard.services.pipeline.capture import AudioCapture
+from dashboard.services.pipeline.chunker import chunk_sentences
+from dashboard.services.pipeline.recorder import record_utterance, SAMPLE_RATE
+from dashboard.services.pipeline.speech import PhraseCache, SpeechService
+from dashboard.services.pipeline.transcription import TranscriptionService
+from dashboard.services.pipeline.wake import WakeEngine
+
+WAKE_MODEL = "models/hey_jarvis_v0.1.onnx"
+VOICE = "models/de_DE-karlsson-low.onnx"
+STUB_REPLY = ("Morgen wird es sonnig bei zwanzig Grad. Am Nachmittag ziehen ein paar Wolken auf. "
+              "Regen ist erst am Wochenende zu erwarten.")
+STAGES = ["wake_ms", "wake_rtf", "vad_ms", "stt_ms", "stt_rtf", "llm_first_token_ms", "llm_ms", "tts_first_audio_ms",
+          "tts_rtf", "tts_cached_first_audio_ms"]
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run_fixture(samples: np.ndarray, engine: WakeEngine, whisper: TranscriptionService, voice: PiperVoice,
+                voice_id: str) -> dict:
+    # The whole fixture is written at once; the ring holds all of it, so every stage sees every sample
+    source = WavSource(samples, lead_in=0.5, tail=2.0)
+    capture = AudioCapture(capacity_seconds=source.duration + 1, source=source)
+    source.on_end = capture.stop
+    capture.start()
+
+    result = {"audio_s": source.duration}
+    detection, result["wake_ms"] = _timed(engine.listen, {"fixture": capture}, start=0)
+    result["wake_rtf"] = result["wake_ms"] / 1000 / source.duration
+    result["wake_detected"] = detection is not None
+    transcriber = whisper.stream()
+    audio, result["vad_ms"] = _timed(record_utterance, capture, start=detection.pos if detection else 0,
+                                     silence_timeout=1.0, on_frame=transcriber.feed)
+    if audio is None:
+        transcriber.cancel()
+        result["error"] = "no speech detected"
+        return result
+    utterance_s = len(audio) / SAMPLE_RATE
+    result["utterance_s"] = utterance_s
+
+    (text, _), result["stt_ms"] = _timed(transcriber.finish)
+    result["stt_rtf"] = result["stt_ms"] / 1000 / utterance_s
+    result["text"] = text
+
+    preset = Preset("benchmark", "stub", stream=True)
+    start = time.perf_counter()
+    tokens = []
+    for token in preset.prompt_stream(text or "Hallo"):
+        if not tokens:
+            result["llm_first_token_ms"] = (time.perf_counter() - start) * 1000
+        tokens.append(token)
+    result["llm_ms"] = (time.perf_counter() - start) * 1000
+
+    sink = NullSink()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        speech = SpeechService(voice, voice_id, sink, cache=PhraseCache(cache_dir))
+        start = time.perf_counter()
+        first_audio = speech.speak_stream(chunk_sentences(iter(tokens)))
+        tts_s = time.perf_counter() - start
+        result["tts_first_audio_ms"] = (first_audio - start) * 1000 if first_audio else None
+        result["tts_rtf"] = tts_s / sink.duration if sink.duration else None
+        # The same reply again, now from the phrase cache
+        start = time.perf_counter()
+        first_audio = speech.speak_stream(chunk_sentences(iter(tokens)))
+        result["tts_cached_first_audio_ms"] = (first_audio - start) * 1000 if first_audio else None
+        speech.close()
+    return result
+
+
+def run_config(whisper_size: str, compute_type: str, beam_sizes: list[int], greedy_below: float, fixtures: list[str],
+               wake_model: str, voice_model: str) -> list[dict]:
+    """One Whisper model in this (fresh) process, every beam size and fixture. Returns one row per beam size."""
+    engine = WakeEngine([wake_model])
+    voice = PiperVoice.load(voice_model)
+    whisper, load_ms = _timed(TranscriptionService, whisper_size, compute_type=compute_type, pool_size=1,
+                              greedy_below=greedy_below)
+    audio = [read_wav(path) for path in fixtures]
+    # The first decode allocates most buffers; keep it out of the numbers
+    whisper.decode(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+    rows = []
+    for beam_size in beam_sizes:
+        whisper.beam_size = beam_size
+        runs = [run_fixture(samples, engine, whisper, voice, voice_model) for samples in audio]
+        row = {"whisper": whisper_size, "compute": compute_type, "beam": beam_size, "load_ms": load_ms,
+               "fixtures": len(runs), "errors": sum(1 for r in runs if "error" in r),
+               "wake_detected": sum(1 for r in runs if r.get("wake_detected")),
+               "texts": [r.get("text") for r in runs]}
+        for stage in STAGES:
+            values = [r[stage] for r in runs if r.get(stage) is not None]
+            row[stage] = sum(values) / len(values) if values else None
+        rows.append(row)
+    # ru_maxrss is in KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for row in rows:
+        row["peak_mb"] = peak_mb
+    return rows
+
+
+def synthesize_fixture(text: str, voice_model: str) -> str:
+    """Render text with Piper into a temporary 16 kHz WAV, for a quick run without recorded fixtures."""
+    voice = PiperVoice.load(voice_model)
+    pcm = np.concatenate([np.frombuffer(c.audio_int16_bytes, dtype=np.int16) for c in voice.synthesize(text)])
+    raw = tempfile.NamedTemporaryFile(suffix=".wav", delete=False).name
+    write_wav(raw, pcm, voice.config.sample_rate)
+    path = raw[:-len(".wav")] + "_16k.wav"
+    write_wav(path, read_wav(raw))
+    os.unlink(raw)
+    return path
+
+
+def _fmt(value, digits=0):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", nargs="*", help="16-bit PCM WAV files, ideally wake word followed by a question")
+    parser.add_argument("--synthesize", help="Generate a fixture from this text with Piper instead")
+    parser.add_argument("--whisper", default="base,small", help="Comma-separated Whisper model sizes")
+    parser.add_argument("--beam", default="1,5", help="Comma-separated beam sizes")
+    parser.add_argument("--compute", default="int8,float32", help="Comma-separated CTranslate2 compute types")
+    parser.add_argument("--greedy-below", type=float, default=3.0, help="Utterances shorter than this (in seconds) are "
+                                                                         "decoded greedily, whatever the beam size")
+    parser.add_argument("--wake-model", default=WAKE_MODEL)
+    parser.add_argument("--voice", default=VOICE)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--json", help="Also write all results to this file")
+    args = parser.parse_args()
+
+    fixtures = list(args.fixtures)
+    if args.synthesize:
+        fixtures.append(synthesize_fixture(args.synthesize, args.voice))
+    if not fixtures:
+        parser.error("pass WAV fixtures or --synthesize TEXT")
+    beams = [int(b) for b in args.beam.split(",")]
+
+    server, _ = serve(PORT, load_ms=0, tokens_per_second=args.tokens_per_second, max_loaded=1, reply=STUB_REPLY)
+    rows = []
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        for size in args.whisper.split(","):
+            for compute in args.compute.split(","):
+                with ctx.Pool(1) as pool:
+                    rows += pool.apply(run_config, (size, compute, beams, args.greedy_below, fixtures,
+                                                    args.wake_model, args.voice))
+    finally:
+        server.shutdown()
+
+    print(f"{len(fixtures)} fixture(s), averages per fixture; RTF = processing time / audio time")
+    print(f"{'whisper':>8} {'compute':>8} {'beam':>4} {'load':>7} {'wake':>6} {'wake rtf':>8} {'vad':>6} {'stt':>7} {'stt rtf':>7} "
+          f"{'llm 1st':>7} {'llm':>6} {'tts 1st':>7} {'tts rtf':>7} {'cached':>6} {'peak MB':>8}")
+    for r in rows:
+        print(f"{r['whisper']:>8} {r['compute']:>8} {r['beam']:>4} {_fmt(r['load_ms']):>7} {_fmt(r['wake_ms']):>6} "
+              f"{_fmt(r['wake_rtf'], 3):>8} {_fmt(r['vad_ms']):>6} {_fmt(r['stt_ms']):>7} {_fmt(r['stt_rtf'], 2):>7} "
+              f"{_fmt(r['llm_first_token_ms']):>7} {_fmt(r['llm_ms']):>6} {_fmt(r['tts_first_audio_ms']):>7} "
+              f"{_fmt(r['tts_rtf'], 2):>7} {_fmt(r['tts_cached_first_audio_ms']):>6} {_fmt(r['peak_mb']):>8}")
+        if r["errors"] or r["wake_detected"] < r["fixtures"]:
+            print(f"{'':>22} wake word found in {r['wake_detected']}/{r['fixtures']}, {r['errors']} without speech")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,297 @@
+import atexit
+import queue
+import re
 import sqlite3
+import threading
+from datetime import datetime, timezone
 
 path = 'test.db'
 
+LOG_BATCH_SIZE = 256
+LOG_FLUSH_INTERVAL = 0.5
+
+_local = threading.local()
+
+# name -> (create statement, columns copied when migrating a legacy table without keys)
+SCHEMAS = {
+    "logs": ("create table if not exists logs (id integer primary key autoincrement, timestamp text, level text, message text)",
+             "timestamp, level, message"),
+    "instances": ("create table if not exists instances (id integer primary key, name text, status text, config text)",
+                  "id, name, status"),
+    # Append-only conversation history: one row per message, numbered per instance
+    "messages": ("create table if not exists messages (instance_id integer, seq integer, message text, primary key (instance_id, seq))",
+                 "instance_id, seq, message"),
+    "shared_data": ("create table if not exists shared_data (label text primary key, data text, "
+                    "version integer not null default 0, updated_at text)", "label, data"),
+    "metrics": ("create table if not exists metrics (bucket_start integer, name text, count integer, errors integer, "
+                "sum_ms real, p50_ms real, p95_ms real, p99_ms real, buckets text, primary key (bucket_start, name))",
+                "bucket_start, name, count, errors, sum_ms, p50_ms, p95_ms, p99_ms, buckets"),
+}
+# (table, column, type) added after the table was first released
+ADDED_COLUMNS = [
+    ("instances", "config", "text"),
+    ("shared_data", "version", "integer not null default 0"),
+    ("shared_data", "updated_at", "text"),
+]
+INDEXES = [
+    "create index if not exists idx_logs_timestamp on logs (timestamp)",
+    "create index if not exists idx_shared_data_version on shared_data (version)",
+]
+# Full-text index over shared_data, kept in sync by triggers
+SHARED_DATA_FTS = "create virtual table if not exists shared_data_fts using fts5(label, data, content='shared_data', content_rowid='rowid')"
+SHARED_DATA_TRIGGERS = [
+    "create trigger if not exists shared_data_ai after insert on shared_data begin "
+    "insert into shared_data_fts (rowid, label, data) values (new.rowid, new.label, new.data); end",
+    "create trigger if not exists shared_data_ad after delete on shared_data begin "
+    "insert into shared_data_fts (shared_data_fts, rowid, label, data) values ('delete', old.rowid, old.label, old.data); end",
+    "create trigger if not exists shared_data_au after update on shared_data begin "
+    "insert into shared_data_fts (shared_data_fts, rowid, label, data) values ('delete', old.rowid, old.label, old.data); "
+    "insert into shared_data_fts (rowid, label, data) values (new.rowid, new.label, new.data); end",
+]
+# Whether this SQLite build has FTS5; keyword search falls back to LIKE without it
+has_fts = True
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to `path`, opening it (in WAL mode) on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != path:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        _local.conn = conn
+        _local.path = path
+    return conn
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _has_primary_key(cur, table) -> bool:
+    return any(col[5] for col in cur.execute(f"pragma table_info({table})"))
+
+def _table_exists(cur, table) -> bool:
+    return cur.execute("select 1 from sqlite_master where type = 'table' and name = ?", (table,)).fetchone() is not None
+
 def create_tables():
-    with sqlite3.connect(path) as conn:
+    with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute("create table if not exists settings (name, value)")
-        cur.execute("create table if not exists logs (timestamp, level, message)")
-        cur.execute("create table if not exists instances (id, name, status)")
-        cur.execute("create table if not exists shared_data (label, data)")
+        for table, (create, columns) in SCHEMAS.items():
+            if _table_exists(cur, table) and not _has_primary_key(cur, table):
+                # Legacy table without keys: rebuild it, keeping the last row for each key
+                cur.execute(f"alter table {table} rename to {table}_legacy")
+                cur.execute(create)
+                cur.execute(f"insert or replace into {table} ({columns}) select {columns} from {table}_legacy order by rowid")
+                cur.execute(f"drop table {table}_legacy")
+            else:
+                cur.execute(create)
+        for table, column, kind in ADDED_COLUMNS:
+            if column not in {col[1] for col in cur.execute(f"pragma table_info({table})")}:
+                cur.execute(f"alter table {table} add column {column} {kind}")
+        # Rows from before versioning got version 0, which no "changed since" query returns: give each its own
+        cur.execute("update shared_data set version = (select coalesce(max(version), 0) from shared_data) + rowid "
+                    "where version = 0")
+        for index in INDEXES:
+            cur.execute(index)
+        _create_fts(cur)
+
+def _create_fts(cur):
+    global has_fts
+    created = not _table_exists(cur, "shared_data_fts")
+    try:
+        cur.execute(SHARED_DATA_FTS)
+    except sqlite3.OperationalError:
+        has_fts = False
+        return
+    for trigger in SHARED_DATA_TRIGGERS:
+        cur.execute(trigger)
+    if created:
+        # Index the rows written before the index existed
+        cur.execute("insert into shared_data_fts (shared_data_fts) values ('rebuild')")
 
 def drop_tables():
-    with sqlite3.connect(path) as conn:
+    flush_logs()
+    with get_connection() as conn:
         cur = conn.cursor()
+        # No longer created, the settings live in user_settings.cfg
         cur.execute("drop table if exists settings")
         cur.execute("drop table if exists logs")
         cur.execute("drop table if exists instances")
+        cur.execute("drop table if exists messages")
+        cur.execute("drop table if exists shared_data_fts")
         cur.execute("drop table if exists shared_data")
+        cur.execute("drop table if exists metrics")
 
 def test_connection() -> bool:
     try:
-        with sqlite3.connect(path) as conn:
-            cur = conn.cursor()
-            cur.execute("select 1")
+        get_connection().execute("select 1")
         return True
     except sqlite3.Error:
         return False
 
-def save_settings(settings: dict[str, str]):
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        # Update or insert settings
-        for name, value in settings.items():
-            cur.execute("insert or replace into settings (name, value) values (?, ?)", (name, value))
+def get_last_instance_id() -> int | None:
+    row = get_connection().execute("select max(id) from instances").fetchone()
+    return row[0] if row else None
 
-def load_settings() -> dict[str, str]:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select name, value from settings")
-        rows = cur.fetchall()
-        return {name: value for name, value in rows}
+def save_instance(instance_id: int, name: str, status: str, config: str | None = None):
+    with get_connection() as conn:
+        conn.execute("insert or replace into instances (id, name, status, config) values (?, ?, ?, ?)",
+                     (instance_id, name, status, config))
 
-def get_last_instance_id() -> int | None:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select id from instances order by id desc limit 1")
-        row = cur.fetchone()
-        return row[0] if row else None
+def load_instances() -> list[tuple[int, str, str, str | None]]:
+    """All instances as (id, name, status, config json), without their messages."""
+    return get_connection().execute("select id, name, status, config from instances order by id").fetchall()
 
-def save_instance(instance_id: int, name: str, status: str):
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("insert or replace into instances (id, name, status) values (?, ?, ?)", (instance_id, name, status))
+def delete_instance(instance_id: int):
+    """Mark an instance deleted and drop its messages. The row stays so its id is never handed out again."""
+    with get_connection() as conn:
+        conn.execute("update instances set status = 'deleted', config = null where id = ?", (instance_id,))
+        conn.execute("delete from messages where instance_id = ?", (instance_id,))
 
-def load_instances() -> list[tuple[int, str, str]]:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select id, name, status from instances")
-        return cur.fetchall()
+def append_messages(rows: list[tuple[int, int, str]]):
+    """Append (instance_id, seq, message json) rows."""
+    with get_connection() as conn:
+        conn.executemany("insert or replace into messages (instance_id, seq, message) values (?, ?, ?)", rows)
+
+def load_messages(instance_id: int) -> list[str]:
+    rows = get_connection().execute("select message from messages where instance_id = ? order by seq", (instance_id,)).fetchall()
+    return [message for message, in rows]
+
+
+class LogWriter:
+    """Background thread that writes queued log rows in batches, one transaction per batch."""
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, row: tuple[str, str, str]):
+        self._queue.put(row)
+
+    def flush(self):
+        """Block until every log queued so far is written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                # Collect until the batch is full, the queue goes quiet, or someone waits for a flush
+                while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+
+            rows = [item for item in batch if not isinstance(item, threading.Event)]
+            if rows:
+                try:
+                    with get_connection() as conn:
+                        conn.executemany("insert into logs (timestamp, level, message) values (?, ?, ?)", rows)
+                except sqlite3.Error as e:
+                    print(f"Failed to write {len(rows)} logs: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+_log_writer: LogWriter | None = None
+_log_writer_lock = threading.Lock()
+
+def _get_log_writer() -> LogWriter:
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = LogWriter()
+            atexit.register(_log_writer.flush)
+        return _log_writer
 
 def save_log(timestamp: str, level: str, message: str):
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("insert into logs (timestamp, level, message) values (?, ?, ?)", (timestamp, level, message))
+    """Queue a log row. Rows are written in batches by a background thread; call flush_logs() to wait for them."""
+    _get_log_writer().put((timestamp, level, message))
+
+def flush_logs():
+    if _log_writer is not None:
+        _log_writer.flush()
 
 def load_logs() -> list[tuple[str, str, str]]:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select timestamp, level, message from logs")
-        return cur.fetchall()
+    flush_logs()
+    return get_connection().execute("select timestamp, level, message from logs order by timestamp").fetchall()
 
-def save_shared_data(label: str, data: str):
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("insert or replace into shared_data (label, data) values (?, ?)", (label, data))
+def save_shared_data(label: str, data: str) -> int:
+    """
+    Insert or update an entry. Every change gets the next version number of the whole store; writing the data an
+    entry already has keeps its version. Returns the version of the entry.
+    """
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with get_connection() as conn:
+        # One statement, so concurrent writers cannot get the same version
+        conn.execute("insert into shared_data (label, data, version, updated_at) "
+                     "values (?, ?, (select coalesce(max(version), 0) + 1 from shared_data), ?) "
+                     "on conflict (label) do update set data = excluded.data, version = excluded.version, "
+                     "updated_at = excluded.updated_at where shared_data.data is not excluded.data", (label, data, now))
+        return conn.execute("select version from shared_data where label = ?", (label,)).fetchone()[0]
 
 def load_shared_data(label: str) -> str | None:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select data from shared_data where label = ?", (label,))
-        row = cur.fetchone()
-        return row[0] if row else None
+    row = get_connection().execute("select data from shared_data where label = ?", (label,)).fetchone()
+    return row[0] if row else None
+
+def load_shared_entry(label: str) -> tuple[str, int] | None:
+    """(data, version) of an entry."""
+    return get_connection().execute("select data, version from shared_data where label = ?", (label,)).fetchone()
 
 def load_all_shared_data() -> dict[str, str]:
-    with sqlite3.connect(path) as conn:
-        cur = conn.cursor()
-        cur.execute("select label, data from shared_data")
-        rows = cur.fetchall()
-        return {label: data for label, data in rows}
\ No newline at end of file
+    rows = get_connection().execute("select label, data from shared_data").fetchall()
+    return {label: data for label, data in rows}
+
+def get_shared_data_version() -> int:
+    """The version of the latest change to shared_data, 0 if it is empty."""
+    return get_connection().execute("select coalesce(max(version), 0) from shared_data").fetchone()[0]
+
+def load_shared_data_since(version: int, limit: int | None = None) -> list[tuple[str, str, int]]:
+    """Entries changed after version as (label, data, version), oldest change first."""
+    return get_connection().execute("select label, data, version from shared_data where version > ? order by version limit ?",
+                                     (version, -1 if limit is None else limit)).fetchall()
+
+def search_shared_data(keywords: str | None = None, prefix: str | None = None, since: int = 0,
+                       limit: int = 20) -> list[tuple[str, str, int]]:
+    """
+    Entries as (label, data, version) whose label starts with prefix and/or whose label or data contain any of the
+    words in keywords, best match first (most recent first without keywords). Only entries changed after since.
+    """
+    words = re.findall(r"\w+", keywords or "")
+    where, args = ["shared_data.version > ?"], [since]
+    if prefix:
+        # A range instead of LIKE, so the primary key index is used and % or _ in the prefix need no escaping
+        where.append("shared_data.label >= ? and shared_data.label < ?")
+        args += [prefix, prefix + "\uffff"]
+    if words and has_fts:
+        query = ("select shared_data.label, shared_data.data, shared_data.version from shared_data_fts "
+                 "join shared_data on shared_data.rowid = shared_data_fts.rowid "
+                 "where shared_data_fts match ? and " + " and ".join(where) + " order by bm25(shared_data_fts) limit ?")
+        args = [" OR ".join(f'"{word}"' for word in words)] + args
+    else:
+        if words:
+            where.append("(" + " or ".join(["label like ? or data like ?"] * len(words)) + ")")
+            args += [f"%{word}%" for word in words for _ in range(2)]
+        query = ("select label, data, version from shared_data where " + " and ".join(where) +
+                 " order by version desc limit ?")
+    return get_connection().execute(query, args + [limit]).fetchall()
+
+def save_metric_rollups(rows: list[tuple]):
+    """Store (bucket_start, name, count, errors, sum_ms, p50_ms, p95_ms, p99_ms, buckets json) rows."""
+    with get_connection() as conn:
+        conn.executemany("insert or replace into metrics (bucket_start, name, count, errors, sum_ms, p50_ms, p95_ms, p99_ms, buckets) "
+                         "values (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def load_metric_rollups(since: int, until: int | None = None) -> list[tuple[int, str, int, int, float, str]]:
+    """Rollups with since <= bucket_start < until as (bucket_start, name, count, errors, sum_ms, buckets json)."""
+    query = "select bucket_start, name, count, errors, sum_ms, buckets from metrics where bucket_start >= ?"
+    args: list = [since]
+    if until is not None:
+        query += " and bucket_start < ?"
+        args.append(until)
+    return get_connection().execute(query + " order by bucket_start", args).fetchall()
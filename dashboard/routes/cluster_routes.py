@@ -0,0 +1,35 @@
+from flask import Blueprint, abort, request
+
+from dashboard.services import cluster, instance_controller
+
+cluster_bp = Blueprint('cluster', __name__)
+
+@cluster_bp.route('/register', methods=['POST'])
+def register():
+    body = request.get_json(silent=True) or {}
+    if not body.get('url'):
+        abort(400, description="Missing 'url'")
+    worker = cluster.workers.register(body['url'], body.get('ollama_host'), int(body.get('capacity') or 1), body.get('status'))
+    return {"worker_id": worker.id, "heartbeat_interval": cluster.workers.heartbeat_interval}
+
+@cluster_bp.route('/heartbeat/<worker_id>', methods=['POST'])
+def heartbeat(worker_id):
+    if not cluster.workers.heartbeat(worker_id, request.get_json(silent=True) or {}):
+        abort(404, description=f"Worker {worker_id} is not registered")
+    return {}
+
+@cluster_bp.route('/unregister/<worker_id>', methods=['POST'])
+def unregister(worker_id):
+    if not cluster.workers.unregister(worker_id):
+        abort(404, description=f"Worker {worker_id} is not registered")
+    return {}
+
+@cluster_bp.route('/workers')
+def list_workers():
+    """Every node that runs instances, with its load; 'local' is this process."""
+    local = instance_controller.local_node
+    local.update(instance_controller.load_status())
+    nodes = cluster.workers.stats()
+    if instance_controller.LOCAL_PLACEMENT:
+        nodes.insert(0, local.to_dict())
+    return nodes
@@ -1,34 +1,57 @@
-from datetime import timezone, datetime, timedelta
-import random
-import dashboard.services.conversation as conv
+from datetime import datetime
+import json
+import time
+import dashboard.services.conversation as conversation_service
+import dashboard.services.session_manager as session_manager
 
 import dashboard.services.instance_controller as instance_controller
-from flask import Blueprint, render_template, url_for, redirect, request
+from flask import Blueprint, render_template, url_for, redirect, request, abort, Response, stream_with_context
 
 from dashboard.services.instance_controller import master_preset
+from dashboard.services.metrics import metrics as metrics_registry, merge_series
+from dashboard.services.model.model_manager import model_manager
+from dashboard.services.settings import FIELDS as SETTING_FIELDS, user_settings
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+def _delta(current, previous):
+    """Percent change, or None when there is nothing to compare against."""
+    if current is None or not previous:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+def _local_time(timestamp: str) -> str:
+    return datetime.fromisoformat(timestamp).astimezone().strftime("%H:%M:%S")
+
 @dashboard_bp.route('/')
 def index():
+    # Last hour against the hour before, from the in-process aggregator and its SQLite rollups
+    now = time.time()
+    last_hour = metrics_registry.query(now - 3600)
+    previous_hour = metrics_registry.query(now - 7200, now - 3600)
+    http, previous_http = merge_series(last_hour, "http."), merge_series(previous_hour, "http.")
+    requests, previous_requests = http.count, previous_http.count
+    errors, previous_errors = merge_series(last_hour, "").errors, merge_series(previous_hour, "").errors
+    latency, previous_latency = http.percentile(95), previous_http.percentile(95)
+
     metrics = [
-        {"title": "Active Users", "value": 1234, "delta": 4.2},
-        {"title": "Errors", "value": 12, "delta": -1.1},
-        {"title": "Throughput", "value": "540 req/s", "delta": 8.0},
-        {"title": "Latency (p95)", "value": "120 ms", "delta": 0},
+        {"title": "Active Instances", "value": instance_controller.instance_count(), "delta": None},
+        {"title": "Errors (1h)", "value": errors, "delta": _delta(errors, previous_errors)},
+        {"title": "Throughput", "value": f"{requests / 60:.1f} req/min", "delta": _delta(requests, previous_requests)},
+        {"title": "Latency (p95)", "value": f"{latency:.0f} ms" if latency is not None else "-",
+         "delta": _delta(latency, previous_latency)},
     ]
+    stages = [dict(name=name, **h.summary()) for name, h in sorted(last_hour.items()) if not name.startswith("http.")]
 
-    # Chart data (last 24 points as example)
-    now = datetime.now(timezone.utc) + timedelta(hours=1)
-    next_hour = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
-    chart_labels = [(next_hour - timedelta(hours=i)).time().isoformat('minutes') for i in reversed(range(24))]
-    chart_values = [random.randint(200, 800) for _ in range(24)]
+    starts, chart_values = metrics_registry.hourly_counts("http.", 24)
+    chart_labels = [datetime.fromtimestamp(start).time().isoformat('minutes') for start in starts]
 
     presets = [preset.name for preset in instance_controller.instance_presets]
-    running_instances = [
-        { "time": "2025-11-19 10:00", "preset": "fast", "status": "running", "location": "Living Room" },
-    ]
-    activity = [{"time": "10:05", "text": "Deployed preset fast"}]
+    running_instances = instance_controller.list_instances()
+    activity = [{"time": _local_time(job.finished_at or job.started_at or job.created_at),
+                 "text": f"Prompt to instance {job.instance_id} ({job.model}) {job.status}"
+                         + (f": {job.error}" if job.error else "")}
+                for job in instance_controller.recent_jobs(10)]
 
     return render_template(
         "overview.html",
@@ -38,32 +61,105 @@ def index():
         presets=presets,
         running_instances=running_instances,
         activity=activity,
+        models=model_manager.stats(),
+        stages=stages,
     )
 
+@dashboard_bp.route('/metrics/prometheus')
+def prometheus_metrics():
+    return Response(metrics_registry.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+@dashboard_bp.route('/metrics/summary')
+def metrics_summary():
+    """Latency percentiles, counts and errors per series over the last `seconds` (default one hour)."""
+    seconds = request.args.get('seconds', default=3600, type=int)
+    return {name: h.summary() for name, h in metrics_registry.query(time.time() - seconds).items()}
+
 @dashboard_bp.route('/settings')
 def settings():
-    with open('user_settings.cfg', 'r') as f:
-        lines = f.readlines()
-        data = {}
-        for line in lines:
-            key, value = line.strip().split('=')
-            data[key] = value
-    return render_template("settings.html", data=data)
+    return render_template("settings.html", data=user_settings.get().to_dict())
 
 @dashboard_bp.route('/settings/save', methods=['POST'])
 def save_settings():
-    with open('user_settings.cfg', 'w') as f:
-        for k, v in request.form.items():
-            f.write(f"{k}={v}\n")
-
+    # Unchecked checkboxes are not submitted
+    changes = {key: "off" for key, kind in SETTING_FIELDS.items() if kind is bool}
+    changes.update(request.form.items())
+    user_settings.update(changes)
     return redirect(url_for('dashboard.settings'))
 
 @dashboard_bp.route('/conversation')
 def conversation():
     return render_template("conversation.html")
 
-@dashboard_bp.route('/conversation/start')
+@dashboard_bp.route('/conversation/start', methods=['GET', 'POST'])
 def start_conversation():
     rounds = request.args.get('rounds', default=999, type=int)
-    conv.start_conversation(master_preset, rounds)
-    return redirect(url_for('dashboard.conversation'))
\ No newline at end of file
+    if not conversation_service.configured():
+        abort(503, description="This node does not run the voice pipeline")
+    session, started = session_manager.start_session(master_preset, rounds)
+    return {"success": started, "session": session.to_dict()}, 202 if started else 409
+
+@dashboard_bp.route('/conversation/stop/<session_id>', methods=['POST'])
+def stop_conversation(session_id):
+    if not session_manager.stop_session(session_id):
+        abort(404, description=f"Session {session_id} not found")
+    return {"success": True}
+
+@dashboard_bp.route('/conversation/status')
+def active_conversation():
+    session = session_manager.get_active_session()
+    return {"session": session.to_dict() if session else None}
+
+@dashboard_bp.route('/conversation/status/<session_id>')
+def conversation_status(session_id):
+    session = session_manager.get_session(session_id)
+    if session is None:
+        abort(404, description=f"Session {session_id} not found")
+    return session.to_dict()
+
+@dashboard_bp.route('/conversation/models')
+def voice_models():
+    """Whether the voice models are configured and loaded, and how long loading took."""
+    return conversation_service.models_status()
+
+@dashboard_bp.route('/conversation/wake')
+def wake_streams():
+    """Latest wake word scores, CPU load and errors per audio stream."""
+    wake = conversation_service.wake
+    return {"streams": wake.stats() if wake else []}
+
+@dashboard_bp.route('/conversation/stt')
+def transcription_pool():
+    """Whisper pool size, idle models and how many utterances were decoded greedily."""
+    whisper = conversation_service.whisper
+    return whisper.stats() if whisper else {}
+
+@dashboard_bp.route('/conversation/tts')
+def speech_cache():
+    """Pre-rendered phrases and hit rate of the speech cache."""
+    speech = conversation_service.speech
+    return speech.stats() if speech else {}
+
+@dashboard_bp.route('/conversation/events/<session_id>')
+def conversation_events(session_id):
+    """Server-sent events with the live transcript of a session. Any number of clients may watch."""
+    session = session_manager.get_session(session_id)
+    if session is None:
+        abort(404, description=f"Session {session_id} not found")
+    cursor = request.headers.get('Last-Event-ID', default=0, type=int)
+
+    def stream():
+        nonlocal cursor
+        while True:
+            events = session.events_after(cursor, timeout=15)
+            if not events:
+                if session.finished:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                cursor = event["id"]
+                yield f"id: {cursor}\ndata: {json.dumps(event)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
\ No newline at end of file
@@ -1,8 +1,64 @@
-from flask import Blueprint, abort
-from dashboard.services import instance_controller
+import json
+import urllib.parse
+
+from flask import Blueprint, abort, request, Response, stream_with_context
+from dashboard.services import cluster, instance_controller
+from dashboard.services.model.model_manager import model_manager
+from dashboard.services.shared_store import shared_store
 
 instance_bp = Blueprint('instance', __name__)
 
+KEEP_ALIVE_INTERVAL = 15.0
+# How often an idle stream checks whether its client went away, where the server can tell (waitress)
+DISCONNECT_POLL_INTERVAL = 1.0
+STREAMING_ENDPOINTS = ('instance.stream_job', 'instance.stream_prompt')
+
+@instance_bp.before_request
+def proxy_remote():
+    """Requests for instances placed on a worker, and for their jobs, are forwarded to that worker unchanged."""
+    args = request.view_args or {}
+    if 'instance_id' in args:
+        worker = instance_controller.worker_of(args['instance_id'])
+    elif 'job_id' in args:
+        worker = instance_controller.worker_of_job(args['job_id'])
+    else:
+        return None
+    if worker is None:
+        return None
+
+    streaming = request.endpoint in STREAMING_ENDPOINTS
+    try:
+        upstream = cluster.request(worker.url + _raw_path(), request.method, request.get_data() or None,
+                                   request.content_type,
+                                   timeout=cluster.STREAM_TIMEOUT if streaming else cluster.REQUEST_TIMEOUT)
+    # ValueError: a URL http.client refuses to send (http.client.InvalidURL, UnicodeEncodeError)
+    except (OSError, ValueError) as e:
+        abort(502, description=f"Worker {worker.id} is unreachable: {e}")
+    headers = {k: v for k, v in upstream.headers.items() if k.lower() in ('content-type', 'cache-control', 'x-accel-buffering')}
+
+    if streaming and upstream.status == 200:
+        def relay():
+            # Closing the generator (client gone) closes the connection to the worker, which ends its stream too
+            with upstream:
+                yield from iter(lambda: upstream.read1(8192), b"")
+        return Response(stream_with_context(relay()), status=upstream.status, headers=headers)
+
+    with upstream:
+        body = upstream.read()
+    if upstream.status == 202 and request.endpoint in ('instance.submit_prompt', 'instance.prompt_instance'):
+        instance_controller.track_remote_job(json.loads(body)['job']['id'], worker)
+    elif upstream.status == 200 and request.endpoint == 'instance.delete_instance':
+        instance_controller.remove_instance(args['instance_id'])
+    return Response(body, status=upstream.status, headers=headers)
+
+def _raw_path() -> str:
+    """The path and query as the client sent them, still percent-encoded, so they can be forwarded as is."""
+    raw = request.environ.get('RAW_URI') or request.environ.get('REQUEST_URI')
+    if raw and raw.startswith('/'):
+        return raw
+    path = urllib.parse.quote(request.path)
+    return path + (f"?{request.query_string.decode('latin-1')}" if request.query_string else "")
+
 @instance_bp.route('/status/<int:instance_id>')
 def get_instance(instance_id):
     data = instance_controller.get_instance(instance_id)
@@ -10,29 +66,157 @@ def get_instance(instance_id):
         abort(404, description=f"Instance with ID {instance_id} not found")
     return str(data)
 
+@instance_bp.route('/metrics/<int:instance_id>')
+def get_instance_metrics(instance_id):
+    """Prompt size and latency of the most recent model calls of an instance."""
+    instance = instance_controller.get_instance(instance_id)
+    if instance is None:
+        abort(404, description=f"Instance with ID {instance_id} not found")
+    return [turn.to_dict() for turn in instance.metrics]
+
 @instance_bp.route('/create/<preset_name>')
 def create_instance_route(preset_name):
-    iid = instance_controller.create_instance(preset_name)
+    # A coordinator that placed the instance on this worker passes its id
+    iid = instance_controller.create_instance(preset_name, request.args.get('id', type=int))
     if iid == -1:
         abort(404, description=f"Preset {preset_name} not found")
     return f"Instance created with preset {preset_name} and ID {iid}"
 
 @instance_bp.route('/list')
 def list_instances():
-    instances = instance_controller.instances
-    return {iid: str(inst) for iid, inst in instances.items()}
+    instances = instance_controller.describe_instances()
+    for worker in cluster.workers.alive():
+        if worker.id not in instance_controller.remote_instances.values():
+            continue
+        try:
+            status, remote = cluster.request_json(f"{worker.url}/instance/list")
+        except OSError as e:
+            print(f"Failed to list instances of worker {worker.id}: {e}")
+            continue
+        if status == 200 and remote:
+            instances.update({int(iid): desc for iid, desc in remote.items()
+                              if instance_controller.remote_instances.get(int(iid)) == worker.id})
+    return instances
 
 @instance_bp.route('/delete/<int:instance_id>')
 def delete_instance(instance_id):
-    return instance_controller.remove_instance(instance_id)
+    if not instance_controller.remove_instance(instance_id):
+        abort(404, description=f"Instance with ID {instance_id} not found")
+    return f"Instance {instance_id} deleted"
+
+@instance_bp.route('/models')
+def list_models():
+    """Residency, load times and inference times of the models used so far."""
+    return model_manager.stats()
+
+@instance_bp.route('/storage')
+def query_storage():
+    """Shared storage entries matching ?q= keywords and/or ?prefix=, or changed after ?since= version."""
+    return shared_store.show(request.args.get('q'), request.args.get('prefix'), request.args.get('since', 0, type=int))
+
+@instance_bp.route('/storage/<path:label>', methods=['GET', 'PUT'])
+def storage_entry(label):
+    if request.method == 'PUT':
+        return {"label": label, "version": shared_store.put(label, request.get_data(as_text=True))}
+    data = shared_store.get(label)
+    if data is None:
+        abort(404, description=f"No shared data under {label}")
+    return {"label": label, "data": data}
+
+@instance_bp.route('/cache')
+def response_caches():
+    """Entries and hit rates of the response caches, per preset."""
+    return {preset.name: preset.cache.stats() for preset in instance_controller.instance_presets if preset.cache}
 
 @instance_bp.route('/presets')
 def list_presets():
     return [preset.name for preset in instance_controller.instance_presets]
 
+@instance_bp.route('/prompt/<int:instance_id>', methods=['POST'])
+def submit_prompt(instance_id):
+    body = request.get_json(silent=True) or {}
+    if not body.get('prompt'):
+        abort(400, description="Missing 'prompt'")
+    return _submit(instance_id, body['prompt'], body.get('images'))
+
+@instance_bp.route('/prompt/<int:instance_id>/stream', methods=['POST'])
+def stream_prompt(instance_id):
+    """
+    Submit a prompt ({"prompt": ..., "images": [...]}) and stream the reply as server-sent events: a job event, the
+    tokens, and a done event. Generation keeps pace with the client and is cancelled when the client disconnects.
+    """
+    body = request.get_json(silent=True) or {}
+    if not body.get('prompt'):
+        abort(400, description="Missing 'prompt'")
+    job = instance_controller.submit_prompt(instance_id, body['prompt'], body.get('images'), paced=True)
+    if job is None:
+        abort(404, description=f"Instance with ID {instance_id} not found")
+    return _event_stream(job, owned=True)
+
 @instance_bp.route('/prompt/<int:instance_id>/<prompt>')
 def prompt_instance(instance_id, prompt):
-    instance = instance_controller.get_instance(instance_id)
-    if instance is None:
+    return _submit(instance_id, prompt)
+
+def _submit(instance_id, prompt, images=None):
+    job = instance_controller.submit_prompt(instance_id, prompt, images)
+    if job is None:
         abort(404, description=f"Instance with ID {instance_id} not found")
-    return instance.prompt(prompt)
+    return {"job": job.to_dict()}, 202
+
+@instance_bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = instance_controller.get_job(job_id)
+    if job is None:
+        abort(404, description=f"Job {job_id} not found")
+    return job.to_dict()
+
+@instance_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Drop a queued job, or stop a running one at its next token."""
+    job = instance_controller.cancel_job(job_id)
+    if job is None:
+        abort(404, description=f"Job {job_id} not found")
+    return job.to_dict()
+
+@instance_bp.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Server-sent events with the reply tokens of a job, followed by a final event with the job status."""
+    job = instance_controller.get_job(job_id)
+    if job is None:
+        abort(404, description=f"Job {job_id} not found")
+    return _event_stream(job)
+
+def _event_stream(job, owned=False):
+    """SSE response following a job. An owned job is announced first and cancelled when the stream closes early."""
+    disconnected = request.environ.get('waitress.client_disconnected')
+    poll = DISCONNECT_POLL_INTERVAL if disconnected else KEEP_ALIVE_INTERVAL
+
+    def stream():
+        cursor = 0
+        idle = 0.0
+        try:
+            if owned:
+                yield f"event: job\ndata: {json.dumps(job.to_dict())}\n\n"
+            while True:
+                tokens = job.tokens_after(cursor, timeout=poll)
+                if tokens:
+                    cursor += len(tokens)
+                    idle = 0.0
+                    yield f"data: {json.dumps({'token': ''.join(tokens)})}\n\n"
+                elif job.finished:
+                    yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+                    return
+                elif disconnected and disconnected():
+                    return
+                else:
+                    idle += poll
+                    if idle >= KEEP_ALIVE_INTERVAL:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+        finally:
+            # Runs when the server closes the stream because the client went away
+            if owned and not job.finished:
+                instance_controller.cancel_job(job.id)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
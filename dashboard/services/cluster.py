@@ -0,0 +1,273 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from dashboard.services.model.model_manager import tagged_model
+
+HEARTBEAT_INTERVAL = 2.0
+# A worker that missed this many heartbeats in a row is considered dead
+MISSED_HEARTBEATS = 3
+# Idle instances one prompt slot of a worker is expected to serve, for weighing placed instances against queued jobs
+INSTANCES_PER_SLOT = 4
+# Extra load for placing an instance on a worker that does not have its model loaded
+COLD_MODEL_PENALTY = 0.5
+REQUEST_TIMEOUT = 5.0
+# Streams send a keep-alive every 15 seconds
+STREAM_TIMEOUT = 60.0
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class WorkerInfo:
+    """A node that runs instances, with the load it reported in its last heartbeat."""
+    def __init__(self, worker_id: str, url: Optional[str], ollama_host: Optional[str], capacity: int):
+        self.id = worker_id
+        self.url = url.rstrip("/") if url else None
+        self.ollama_host = ollama_host
+        self.capacity = max(1, capacity)
+        self.registered_at = _now()
+        self.last_heartbeat = time.monotonic()
+        self.instances = 0
+        self.queued = 0
+        self.running = 0
+        self.models: set[str] = set()
+        # Instances placed here since the last heartbeat, which that heartbeat could not include yet
+        self.placed = 0
+
+    def update(self, status: dict):
+        self.last_heartbeat = time.monotonic()
+        self.instances = status.get("instances", 0)
+        self.queued = status.get("queued", 0)
+        self.running = status.get("running", 0)
+        self.models = set(status.get("models", ()))
+        self.placed = 0
+
+    def load(self, model: Optional[str] = None) -> float:
+        """Queued and running prompts per slot, plus a share for idle instances and for loading the model."""
+        load = (self.running + self.queued) / self.capacity
+        load += (self.instances + self.placed) / (self.capacity * INSTANCES_PER_SLOT)
+        if model is not None and tagged_model(model) not in self.models:
+            load += COLD_MODEL_PENALTY
+        return load
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "ollama_host": self.ollama_host,
+            "capacity": self.capacity,
+            "instances": self.instances + self.placed,
+            "queued": self.queued,
+            "running": self.running,
+            "models": sorted(self.models),
+            "load": round(self.load(), 3),
+            "registered_at": self.registered_at,
+            "last_heartbeat_s": round(time.monotonic() - self.last_heartbeat, 1),
+        }
+
+
+class WorkerRegistry:
+    """
+    The workers known to the coordinator.
+
+    Workers register with their URL and Ollama host and then send a heartbeat with their load every
+    heartbeat_interval seconds. A monitor thread drops workers that missed `missed` heartbeats in a row and
+    tells the listeners, so instances placed on them can be forgotten.
+    """
+    def __init__(self, heartbeat_interval: float = HEARTBEAT_INTERVAL, missed: int = MISSED_HEARTBEATS):
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = heartbeat_interval * missed
+        self.workers: dict[str, WorkerInfo] = {}
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[WorkerInfo], None]] = []
+        self._monitor: Optional[threading.Thread] = None
+
+    def on_worker_lost(self, callback: Callable[[WorkerInfo], None]):
+        self._listeners.append(callback)
+
+    def register(self, url: str, ollama_host: Optional[str], capacity: int, status: Optional[dict] = None) -> WorkerInfo:
+        """Add a worker. A worker registering again under the same URL has restarted and lost its instances."""
+        worker = WorkerInfo(uuid.uuid4().hex[:8], url, ollama_host, capacity)
+        worker.update(status or {})
+        with self._lock:
+            previous = next((w for w in self.workers.values() if w.url == worker.url), None)
+            if previous is not None:
+                del self.workers[previous.id]
+            self.workers[worker.id] = worker
+        if previous is not None:
+            self._lost(previous, "re-registered")
+        print(f"Worker {worker.id} registered at {worker.url} (Ollama {worker.ollama_host or 'default'})")
+        return worker
+
+    def heartbeat(self, worker_id: str, status: dict) -> bool:
+        """Record a heartbeat. False if the worker is unknown (e.g. declared dead) and has to register again."""
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            return False
+        worker.update(status)
+        return True
+
+    def unregister(self, worker_id: str) -> bool:
+        with self._lock:
+            worker = self.workers.pop(worker_id, None)
+        if worker is None:
+            return False
+        self._lost(worker, "unregistered")
+        return True
+
+    def get(self, worker_id: str) -> Optional[WorkerInfo]:
+        return self.workers.get(worker_id)
+
+    def alive(self) -> list[WorkerInfo]:
+        return list(self.workers.values())
+
+    def place(self, model: str, candidates: Optional[list[WorkerInfo]] = None) -> Optional[WorkerInfo]:
+        """
+        The least loaded worker for a new instance of model, also considering the extra candidates (e.g. the
+        local node). Workers that have the model loaded win unless they are busier. None if there is no node.
+        """
+        nodes = self.alive() + list(candidates or [])
+        if not nodes:
+            return None
+        worker = min(nodes, key=lambda w: w.load(model))
+        worker.placed += 1
+        return worker
+
+    def check(self):
+        """Drop workers whose last heartbeat is older than the timeout."""
+        now = time.monotonic()
+        with self._lock:
+            dead = [w for w in self.workers.values() if now - w.last_heartbeat > self.timeout]
+            for worker in dead:
+                del self.workers[worker.id]
+        for worker in dead:
+            self._lost(worker, f"missed heartbeats for {now - worker.last_heartbeat:.0f}s")
+
+    def start_monitor(self):
+        if self._monitor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.heartbeat_interval)
+                self.check()
+
+        self._monitor = threading.Thread(target=run, name="worker-monitor", daemon=True)
+        self._monitor.start()
+
+    def stats(self) -> list[dict]:
+        return [w.to_dict() for w in self.alive()]
+
+    def _lost(self, worker: WorkerInfo, reason: str):
+        print(f"Worker {worker.id} at {worker.url} lost: {reason}")
+        for callback in self._listeners:
+            try:
+                callback(worker)
+            except Exception as e:
+                print(f"Failed to handle lost worker {worker.id}: {e}")
+
+
+def request(url: str, method: str = "GET", body: Optional[bytes] = None, content_type: Optional[str] = None,
+            timeout: float = REQUEST_TIMEOUT):
+    """
+    Send an HTTP request. Returns the open response, also for HTTP error statuses, so it can be relayed as is.
+    Raises OSError when the other side cannot be reached.
+    """
+    req = urllib.request.Request(url, data=body, method=method)
+    if content_type:
+        req.add_header("Content-Type", content_type)
+    try:
+        return urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        return e
+
+
+def request_json(url: str, method: str = "GET", payload=None, timeout: float = REQUEST_TIMEOUT) -> tuple[int, object]:
+    """Send a JSON request and return (status, decoded body, or None if it is not JSON)."""
+    body = json.dumps(payload).encode() if payload is not None else None
+    with request(url, method, body, "application/json" if body is not None else None, timeout) as res:
+        data = res.read()
+    try:
+        return res.status, json.loads(data)
+    except ValueError:
+        return res.status, None
+
+
+class WorkerAgent:
+    """
+    Runs in a worker process: registers with the coordinator and sends a heartbeat with the current load every
+    interval. If the coordinator does not know the worker (it restarted, or declared the worker dead) the
+    worker registers again; on_register is then called, since instances placed before are unreachable.
+
+    Parameters:
+    - coordinator: Base URL of the coordinator, e.g. "http://10.0.0.2:5000".
+    - url: Base URL under which the coordinator reaches this worker.
+    - ollama_host: The Ollama server this worker uses, for display.
+    - capacity: Number of prompts the worker runs at once.
+    - status: Returns the current load, see WorkerInfo.update.
+    - on_register: Called after every successful registration.
+    """
+    def __init__(self, coordinator: str, url: str, ollama_host: Optional[str], capacity: int,
+                 status: Callable[[], dict], on_register: Optional[Callable[[], None]] = None):
+        self.coordinator = coordinator.rstrip("/")
+        self.url = url
+        self.ollama_host = ollama_host
+        self.capacity = capacity
+        self.status = status
+        self.on_register = on_register
+        self.worker_id: Optional[str] = None
+        self.interval = HEARTBEAT_INTERVAL
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="worker-heartbeat", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop the heartbeats and unregister, so the coordinator stops placing instances here at once."""
+        self._stop.set()
+        if self.worker_id is not None:
+            try:
+                request_json(f"{self.coordinator}/cluster/unregister/{self.worker_id}", "POST", {})
+            except OSError:
+                pass
+
+    def _register(self):
+        status, body = request_json(f"{self.coordinator}/cluster/register", "POST", {
+            "url": self.url, "ollama_host": self.ollama_host, "capacity": self.capacity, "status": self.status(),
+        })
+        if status != 200 or not body:
+            raise OSError(f"registration returned {status}")
+        self.worker_id = body["worker_id"]
+        self.interval = body.get("heartbeat_interval", self.interval)
+        print(f"Registered with {self.coordinator} as worker {self.worker_id}")
+        if self.on_register:
+            self.on_register()
+
+    def _run(self):
+        failing = False
+        while not self._stop.is_set():
+            try:
+                if self.worker_id is None:
+                    self._register()
+                else:
+                    status, _ = request_json(f"{self.coordinator}/cluster/heartbeat/{self.worker_id}", "POST", self.status())
+                    if status == 404:
+                        self.worker_id = None
+                        continue
+                failing = False
+            except OSError as e:
+                if not failing:
+                    print(f"Failed to reach coordinator {self.coordinator}: {e}")
+                failing = True
+            self._stop.wait(self.interval)
+
+
+workers = WorkerRegistry()
@@ -1,51 +1,227 @@
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
 
-from faster_whisper import WhisperModel
-from piper import PiperVoice
+from dashboard.services.metrics import metrics
+from dashboard.services.pipeline.chunker import chunk_sentences
+from dashboard.services.settings import user_settings
 
-from dashboard.services.pipeline.recorder import record_utterance
-from dashboard.services.pipeline.stt import transcribe
-from dashboard.services.pipeline.tts import speak
-from dashboard.services.pipeline.wake import WakeListener
+# The audio stack (faster-whisper, piper, openwakeword, webrtcvad, sounddevice) is only imported when the models
+# are loaded, so processes that never run a conversation do not pay for it
+if TYPE_CHECKING:
+    from dashboard.services.pipeline.audio_io import AudioSource
+    from dashboard.services.pipeline.barge_in import BargeInDetector
+    from dashboard.services.pipeline.capture import AudioCapture
+    from dashboard.services.pipeline.speech import SpeechService
+    from dashboard.services.pipeline.transcription import TranscriptionService
+    from dashboard.services.pipeline.wake import WakeEngine
 
-wake: WakeListener | None = None
-voice: PiperVoice | None = None
-whisper: WhisperModel | None = None
+capture: "AudioCapture | None" = None
+wake: "WakeEngine | None" = None
+speech: "SpeechService | None" = None
+barge_in: "BargeInDetector | None" = None
 
-def init_models(wake_model, voice_model, whisper_model, whisper_device):
-    global wake, voice, whisper
-    wake = WakeListener([wake_model])
-    voice = PiperVoice.load(voice_model)
-    whisper = WhisperModel(whisper_model, device=whisper_device)
+GREETING = "Wie kann ich behilflich sein?"
+# Rendered once when the models load so they play without synthesis
+STOCK_PHRASES = [GREETING]
+SAMPLE_RATE = 16000
+# Audio kept from before a barge-in was detected, so the first syllable is not cut off
+BARGE_IN_PREROLL = 0.3
+whisper: "TranscriptionService | None" = None
+
+# Set by init_models; the models are loaded from it on first use
+_config: Optional[dict] = None
+_models_lock = threading.Lock()
+models_ready = threading.Event()
+load_seconds: Optional[float] = None
+load_error: Optional[str] = None
+
+def init_models(wake_model, voice_model, whisper_model, whisper_device, source: Optional["AudioSource"] = None,
+                whisper_compute_type="int8", whisper_pool_size=2, whisper_cpu_threads=2, prewarm=False):
+    """
+    Configure the voice pipeline. The models are loaded on first use (see ensure_models), or right away on a
+    background thread with prewarm.
+    """
+    global _config
+    _config = dict(wake_model=wake_model, voice_model=voice_model, whisper_model=whisper_model,
+                   whisper_device=whisper_device, source=source, whisper_compute_type=whisper_compute_type,
+                   whisper_pool_size=whisper_pool_size, whisper_cpu_threads=whisper_cpu_threads)
+    if prewarm:
+        prewarm_models()
+
+def configured() -> bool:
+    return _config is not None
+
+def ensure_models():
+    """Load the voice models unless they are loaded already, blocking until they are."""
+    global capture, wake, speech, whisper, barge_in, load_seconds, load_error
+    if models_ready.is_set():
+        return
+    with _models_lock:
+        if models_ready.is_set():
+            return
+        if _config is None:
+            raise RuntimeError("The voice pipeline is not configured on this node")
+        start = time.perf_counter()
+        from piper import PiperVoice
+        from dashboard.services.pipeline.barge_in import BargeInDetector
+        from dashboard.services.pipeline.capture import AudioCapture
+        from dashboard.services.pipeline.speech import PhraseCache, SpeechService
+        from dashboard.services.pipeline.transcription import TranscriptionService
+        from dashboard.services.pipeline.wake import WakeEngine
+
+        c = _config
+        try:
+            # The three models load mostly in native code, so loading them side by side saves most of the wait
+            with ThreadPoolExecutor(max_workers=3, thread_name_prefix="model-load") as pool:
+                wake_future = pool.submit(WakeEngine, [c["wake_model"]])
+                speech_future = pool.submit(lambda: SpeechService(PiperVoice.load(c["voice_model"]), c["voice_model"],
+                                                                  phrases=STOCK_PHRASES, cache=PhraseCache()))
+                whisper_future = pool.submit(TranscriptionService, c["whisper_model"], device=c["whisper_device"],
+                                             compute_type=c["whisper_compute_type"], pool_size=c["whisper_pool_size"],
+                                             cpu_threads=c["whisper_cpu_threads"])
+                wake, speech, whisper = wake_future.result(), speech_future.result(), whisper_future.result()
+            barge_in = BargeInDetector(min_speech=user_settings.get().barge_in_min_speech)
+            capture = AudioCapture(source=c["source"])
+            capture.start()
+        except Exception as e:
+            load_error = str(e)
+            raise
+        load_seconds = time.perf_counter() - start
+        load_error = None
+        models_ready.set()
+        print(f"Voice models loaded in {load_seconds:.1f} s")
+
+def _apply_settings(settings, changed):
+    if barge_in is not None and "barge_in_min_speech" in changed:
+        barge_in.set_min_speech(settings.barge_in_min_speech)
+
+user_settings.subscribe(_apply_settings)
+
+def prewarm_models():
+    """Load the voice models on a background thread, so the first conversation does not wait for them."""
+    def run():
+        try:
+            ensure_models()
+        except Exception as e:
+            print(f"Failed to load voice models: {e}")
+
+    threading.Thread(target=run, name="voice-prewarm", daemon=True).start()
+
+def models_status() -> dict:
+    return {
+        "configured": configured(),
+        "loaded": models_ready.is_set(),
+        "load_seconds": load_seconds,
+        "error": load_error,
+    }
+
+def _sentences(tokens: Iterator[str], stop_event: Optional[threading.Event],
+               on_sentence: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """Chunk a token stream into sentences, closing the token stream (and its LLM request) once stopped."""
+    try:
+        for sentence in chunk_sentences(tokens):
+            if stop_event and stop_event.is_set():
+                return
+            if on_sentence:
+                on_sentence(sentence)
+            yield sentence
+    finally:
+        tokens.close()
+
+def _speak(sentences: Iterator[str], stop_event: Optional[threading.Event]) -> tuple[Optional[float], Optional[int], str]:
+    """
+    Play sentences in the background while listening for the user.
+    Returns (time of the first audio, capture position to record from, text that was spoken). The position is set
+    when the user spoke during playback (which then stops, along with the LLM stream behind the sentences), else
+    None. Raises the error that stopped the playback, e.g. a failed LLM stream.
+    """
+    playback = speech.play(sentences)
+    onset = barge_in.watch(capture, playback, stop_event)
+    if onset is not None or (stop_event and stop_event.is_set()):
+        playback.interrupt()
+    playback.wait()
+    if playback.error is not None:
+        raise playback.error
+    if onset is None:
+        return playback.first_audio, None, playback.text
+    return playback.first_audio, max(onset - int(BARGE_IN_PREROLL * SAMPLE_RATE), 0), playback.text
+
+def start_conversation(preset, rounds=999, emit: Optional[Callable[..., None]] = None,
+                       stop_event: Optional[threading.Event] = None, session_id: Optional[str] = None):
+    """
+    Run the voice loop: wait for the wake word, then record, transcribe, prompt and speak for `rounds` turns.
+    Parameters:
+    - emit: Called as emit(kind, **data) for status, transcript and assistant events, e.g. ConversationSession.emit.
+    - stop_event: Ends the conversation at the next checkpoint when set.
+    - session_id: Key for per-session state such as the cached transcription language.
+    """
+    def log(kind, message, **data):
+        print(message)
+        if emit:
+            emit(kind, message=message, **data)
+
+    def stopped():
+        return stop_event is not None and stop_event.is_set()
+
+    if not models_ready.is_set():
+        log("status", "Loading voice models...")
+        ensure_models()
+    from dashboard.services.pipeline.recorder import record_utterance
 
-def start_conversation(preset, rounds=999):
-    global wake, voice, whisper
     try:
-        print("Listening for wake word...")
-        wake.listen()
-        print("Wake word detected")
-        speak("Wie kann ich behilflich sein?", voice)
+        log("status", "Listening for wake word...")
+        detection = wake.listen({"default": capture}, stop_event)
+        if detection is None:
+            return
+        log("status", f"Wake word detected ({detection.model}, {detection.score:.2f})")
+        _, record_from, _ = _speak(iter([GREETING]), stop_event)
         curr_rounds = 0
-        while curr_rounds < rounds:
-            print("Recording...")
-            wav = record_utterance(silence_timeout=1.5)
-            if not wav:
-                print("No speech detected.")
+        while curr_rounds < rounds and not stopped():
+            log("status", "Recording...")
+            transcriber = whisper.stream(session_id)
+            settings = user_settings.get()
+            with metrics.timer("pipeline.record"):
+                # Starts right where playback ended, or where the user interrupted it
+                audio = record_utterance(capture, silence_timeout=settings.silence_timeout,
+                                         aggressiveness=settings.vad_aggressiveness, start=record_from,
+                                         on_frame=transcriber.feed, stop_event=stop_event)
+            record_from = None
+            if audio is None:
+                transcriber.cancel()
+                log("status", "No speech detected.")
                 continue
-            print("Recorded:", wav)
+            speech_end = time.perf_counter()
+            print(f"Recorded: {len(audio) / SAMPLE_RATE:.1f} s")
 
-            text, lang_info = transcribe(wav, whisper)
+            text, lang_info = transcriber.finish()
+            stt_ms = (time.perf_counter() - speech_end) * 1000
+            metrics.observe("pipeline.speech_to_text", stt_ms)
+            print(f"End of speech to text: {stt_ms:.0f} ms")
             if not text:
-                print("No speech detected.")
+                log("status", "No speech detected.")
                 continue
-            print(f"User: {text} ({lang_info[0]}, {lang_info[1]:.2f})")
+            log("transcript", f"User: {text} ({lang_info[0]}, {lang_info[1]:.2f})", text=text, language=lang_info[0])
 
             lang_text = f"Detected language with code {lang_info[0]}. Please respond in the same language."
-            resp = preset.prompt(text + "\n" + lang_text)
-            print("Assistant:", resp)
+            prompt_start = time.perf_counter()
+            if preset.stream:
+                tokens = preset.prompt_stream(text + "\n" + lang_text)
+                on_sentence = (lambda s: emit("assistant_partial", text=s)) if emit else None
+                first_audio, record_from, resp = _speak(_sentences(tokens, stop_event, on_sentence), stop_event)
+            else:
+                reply = preset.prompt(text + "\n" + lang_text)
+                first_audio, record_from, resp = _speak(iter([reply]), stop_event)
+            log("assistant", f"Assistant: {resp}", text=resp, interrupted=record_from is not None)
+            if record_from is not None:
+                log("status", "Interrupted by user")
+            if first_audio:
+                metrics.observe("pipeline.first_audio", (first_audio - prompt_start) * 1000)
+                print(f"Time to first audio: {(first_audio - prompt_start) * 1000:.0f} ms")
+            else:
+                print("Time to first audio: n/a")
 
-            speak(resp, voice)
-            time.sleep(0.2)
             curr_rounds += 1
     except KeyboardInterrupt:
         print("Exiting.")
\ No newline at end of file
@@ -1,48 +1,299 @@
-from dashboard.repository.sqlite.db import load_all_shared_data, test_connection
+import collections
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from ollama import Message
+
+from dashboard.repository.sqlite.db import (append_messages, delete_instance, get_last_instance_id, load_instances,
+                                             load_messages, save_instance, test_connection)
+from dashboard.services import cluster
+from dashboard.services.cluster import WorkerInfo
+from dashboard.services.model.model_manager import model_manager
 from dashboard.services.model.preset import Preset
+from dashboard.services.model.response_cache import ResponseCache
 from dashboard.services.model.request.tool import Tool
 from dashboard.services.model.request.tool_param import ToolParameter
+from dashboard.services.scheduler import JobScheduler
+from dashboard.services.settings import user_settings
+from dashboard.services.shared_store import shared_store
+
+# Prompt workers shared by all instances, and how many prompts may run against one model at once
+MAX_PROMPT_WORKERS = 4
+MODEL_CONCURRENCY: dict[str, int] = {}
+DEFAULT_MODEL_CONCURRENCY = 2
+# Replies of the master preset are reused for repeated prompts while the response_cache setting is on. Exact
+# matches only: in a conversation a similar prompt often wants a different answer
+RESPONSE_CACHE_TTL = 600
+# Whether this node runs instances itself, next to the workers registered with it
+LOCAL_PLACEMENT = True
+# Remote jobs whose worker is remembered for proxying
+MAX_REMOTE_JOBS = 10000
 
 instance_tools = [
     Tool('search_web', 'Search the web for information', [
         ToolParameter('query', 'string', 'The search query', required=True),
-    ], func=lambda query: f"Results for {query}", available=True),
-    Tool('show_storage', 'Use this tool to query the cross-instance shared storage. This storage may contain important information from other instances.',
-         [], func=load_all_shared_data, available=test_connection()),
+    ], func=lambda query: f"Results for {query}", available=True, timeout=20, cache_ttl=300),
+    Tool('show_storage', 'Use this tool to query the cross-instance shared storage. This storage may contain important information from other instances. '
+         'Pass keywords or a label prefix to get only relevant entries, and the version from your last call to get only what changed since.',
+         [
+             ToolParameter('query', 'string', 'Keywords to look for in labels and contents'),
+             ToolParameter('prefix', 'string', 'Only entries whose label starts with this'),
+             ToolParameter('since_version', 'integer', 'Only entries changed after this version'),
+         # Offered once check_storage() found the database working
+         ], func=shared_store.show, available=False, timeout=5, cache_ttl=10),
     Tool('start_instance_with_prompt', 'Start a new instance with a given preset and an optional initial prompt', [
          ToolParameter('preset_name', 'string', 'The preset name', required=True, enum=[i.name for i in []]) # TODO: turn into class and actually load presets
     ], func=lambda preset_name: create_instance(preset_name), available=True),
 ]
 master_preset = Preset('master', 'llama3.2', [],
                        'You are a conversational AI chat bot meant to fulfill user request and hold conversations',
-                       False, False)
+                       True, False, max_context_tokens=4096, summarize_context=True, keep_alive="30m")
+master_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL)
 instance_presets = [
     master_preset
 ]
+# Arguments are validated against the compiled schema, so the enum has to list the real presets
+instance_tools[2].params[0].enum = [p.name for p in instance_presets]
+# Cached storage results are stale once an entry changes
+shared_store.subscribe(lambda label, data, version: instance_tools[1].clear_cache())
+
+def check_storage() -> bool:
+    """Probe the database at startup (not on import, which must not touch it) and offer the storage tool if it works."""
+    connected = test_connection()
+    instance_tools[1].available = connected
+    return connected
+
+def _apply_settings(settings, changed):
+    if "prefer_streaming" in changed:
+        master_preset.stream = settings.prefer_streaming
+    if "response_cache" in changed:
+        cache = master_cache if settings.response_cache else None
+        master_preset.cache = cache
+        # Loaded instances keep the cache of their preset from when they were created
+        for instance in list(instances.values()):
+            if instance.name == master_preset.name:
+                instance.cache = cache
+
 instances: dict[int, Preset] = { }
+# Instances restored from the database whose preset and history are loaded on first access: id -> config
+dormant: dict[int, dict] = {}
+# Number of history messages of each loaded instance that are already in the database
+_persisted: dict[int, int] = {}
+_restore_lock = threading.Lock()
+# Instances placed on workers: instance id -> worker id, and job id -> worker id for their jobs
+remote_instances: dict[int, str] = {}
+# Preset names of the instances placed on workers, for listing them
+_remote_presets: dict[int, str] = {}
+remote_jobs: collections.OrderedDict[str, str] = collections.OrderedDict()
 curr_id = 0
+_id_lock = threading.Lock()
+user_settings.subscribe(_apply_settings)
+
+def persist_history(instance_id, instance):
+    """Append the messages an instance added since the last call to the database."""
+    if instances.get(instance_id) is not instance:
+        return # deleted in the meantime
+    start = _persisted.get(instance_id, 0)
+    new = instance.history[start:]
+    if not new:
+        return
+    try:
+        append_messages([(instance_id, start + i, m.model_dump_json(exclude_none=True)) for i, m in enumerate(new)])
+    except sqlite3.Error as e:
+        print(f"Failed to save history of instance {instance_id}: {e}")
+        return
+    _persisted[instance_id] = start + len(new)
+
+scheduler = JobScheduler(MAX_PROMPT_WORKERS, MODEL_CONCURRENCY, DEFAULT_MODEL_CONCURRENCY,
+                         resident_models=model_manager.resident_models,
+                         on_finished=lambda job, instance: persist_history(job.instance_id, instance))
+local_node = WorkerInfo("local", None, os.environ.get("OLLAMA_HOST"), MAX_PROMPT_WORKERS)
 
-def create_instance(preset_name):
+def load_status() -> dict:
+    """The load of this node, as sent in worker heartbeats."""
+    stats = scheduler.stats()
+    return {
+        "instances": len(instances) + len(dormant),
+        "queued": stats["queued"],
+        "running": stats["running"],
+        "models": sorted(model_manager.resident_models()),
+    }
+
+def create_instance(preset_name, instance_id: Optional[int] = None):
+    """
+    Create an instance of a preset on the least loaded node: a registered worker or this one.
+    A coordinator passes instance_id when it placed the instance here; an existing instance with that id is replaced.
+    Returns the instance id, or -1 if the preset does not exist.
+    """
     preset = next((p for p in instance_presets if p.name == preset_name), None)
     if preset is None:
         return -1
 
+    if instance_id is not None:
+        remove_instance(instance_id)
+        _reserve_id(instance_id)
+        _create_local(preset, instance_id)
+        return instance_id
+
+    instance_id = _next_id()
+    local_node.update(load_status())
+    worker = cluster.workers.place(preset.model, [local_node] if LOCAL_PLACEMENT else [])
+    if worker is not None and worker is not local_node:
+        try:
+            status, _ = cluster.request_json(f"{worker.url}/instance/create/{preset_name}?id={instance_id}")
+            if status == 200:
+                remote_instances[instance_id] = worker.id
+                _remote_presets[instance_id] = preset_name
+                # Reserves the id, so this node does not hand it out again after a restart
+                _save(instance_id, preset_name, "remote")
+                return instance_id
+            print(f"Failed to create instance on worker {worker.id}: status {status}")
+        except OSError as e:
+            print(f"Failed to create instance on worker {worker.id}: {e}")
+    _create_local(preset, instance_id)
+    return instance_id
+
+def _next_id() -> int:
+    # Requests, prompt workers and tool threads create instances concurrently
+    global curr_id
+    with _id_lock:
+        curr_id += 1
+        return curr_id
+
+def _reserve_id(instance_id: int):
     global curr_id
-    curr_id += 1
+    with _id_lock:
+        curr_id = max(curr_id, instance_id)
+
+def _create_local(preset, instance_id):
     # Create a copy of the preset for the new instance
-    instances[curr_id] = Preset(
-        name=preset.name,
-        model=preset.model,
-        tools=preset.tools,
-        system=preset.system,
-        stream=preset.stream,
-        think=preset.think
-    )
-    return curr_id
-
-def remove_instance(instance_id):
-    if instance_id in instances:
-        del instances[instance_id]
+    instance = Preset(**preset.config(), tools=preset.tools, cache=preset.cache)
+    instances[instance_id] = instance
+    _persisted[instance_id] = 0
+    _save(instance_id, preset.name, "active", {**preset.config(), "tools": [tool.name for tool in preset.tools]})
+
+def _save(instance_id, name, status, config=None):
+    try:
+        save_instance(instance_id, name, status, json.dumps(config) if config is not None else None)
+    except sqlite3.Error as e:
+        print(f"Failed to save instance {instance_id}: {e}")
+
+def restore_instances():
+    """
+    Pick up the instances of the previous run. Only ids and configs are read here, so startup stays fast with many
+    instances; each preset and its history are loaded on first access.
+    """
+    for instance_id, _, status, config in load_instances():
+        if status == "active" and config:
+            dormant[instance_id] = json.loads(config)
+    _reserve_id(get_last_instance_id() or 0)
+    if dormant:
+        print(f"Restored {len(dormant)} instances")
+
+def _rehydrate(instance_id) -> Optional[Preset]:
+    with _restore_lock:
+        if instance_id in instances:
+            return instances[instance_id]
+        config = dormant.pop(instance_id, None)
+        if config is None:
+            return None
+        tool_names = set(config.pop("tools", ()))
+        template = next((p for p in instance_presets if p.name == config["name"]), None)
+        instance = Preset(**config, tools=[tool for tool in instance_tools if tool.name in tool_names],
+                          cache=template.cache if template else None)
+        messages = load_messages(instance_id)
+        if messages:
+            instance.history = [Message.model_validate_json(m) for m in messages]
+        _persisted[instance_id] = len(messages)
+        instances[instance_id] = instance
+        return instance
+
+def remove_instance(instance_id) -> bool:
+    if instance_id in instances or dormant.pop(instance_id, None) is not None:
+        instances.pop(instance_id, None)
+        _persisted.pop(instance_id, None)
+        scheduler.cancel_instance(instance_id)
+        try:
+            delete_instance(instance_id)
+        except sqlite3.Error as e:
+            print(f"Failed to delete instance {instance_id}: {e}")
+        return True
+    _remote_presets.pop(instance_id, None)
+    return remote_instances.pop(instance_id, None) is not None
+
+def clear_instances():
+    for instance_id in list(instances) + list(dormant):
+        remove_instance(instance_id)
 
 def get_instance(instance_id):
-    return instances.get(instance_id, None)
\ No newline at end of file
+    instance = instances.get(instance_id, None)
+    if instance is None and instance_id in dormant:
+        instance = _rehydrate(instance_id)
+    return instance
+
+def instance_count() -> int:
+    return len(instances) + len(dormant) + len(remote_instances)
+
+def describe_instances() -> dict[int, str]:
+    """A description of every instance on this node, without loading dormant ones."""
+    described = {iid: str(inst) for iid, inst in list(instances.items())}
+    described.update({iid: f"Preset(name={config['name']}, model={config['model']}, dormant=True)"
+                      for iid, config in list(dormant.items())})
+    return dict(sorted(described.items()))
+
+def list_instances() -> list[dict]:
+    """Every instance with its preset, status and where it runs, without loading dormant ones."""
+    listed = [{"id": iid, "preset": inst.name, "status": scheduler.status(iid), "location": "local"}
+              for iid, inst in list(instances.items())]
+    listed += [{"id": iid, "preset": config["name"], "status": "dormant", "location": "local"}
+               for iid, config in list(dormant.items())]
+    listed += [{"id": iid, "preset": _remote_presets.get(iid, "-"), "status": "remote", "location": worker_id}
+               for iid, worker_id in list(remote_instances.items())]
+    return sorted(listed, key=lambda row: row["id"])
+
+def recent_jobs(limit: int = 10):
+    """The last prompts run on this node, newest first."""
+    return scheduler.recent(limit)
+
+def worker_of(instance_id) -> Optional[WorkerInfo]:
+    """The worker running an instance, or None if it runs here (or does not exist)."""
+    worker_id = remote_instances.get(instance_id)
+    return cluster.workers.get(worker_id) if worker_id else None
+
+def worker_of_job(job_id) -> Optional[WorkerInfo]:
+    worker_id = remote_jobs.get(job_id)
+    return cluster.workers.get(worker_id) if worker_id else None
+
+def track_remote_job(job_id, worker: WorkerInfo):
+    remote_jobs[job_id] = worker.id
+    while len(remote_jobs) > MAX_REMOTE_JOBS:
+        remote_jobs.popitem(last=False)
+
+def _forget_worker(worker: WorkerInfo):
+    """The instances of a lost worker are gone with it."""
+    lost = [iid for iid, wid in remote_instances.items() if wid == worker.id]
+    for iid in lost:
+        del remote_instances[iid]
+        _remote_presets.pop(iid, None)
+    for job_id in [j for j, wid in remote_jobs.items() if wid == worker.id]:
+        del remote_jobs[job_id]
+    if lost:
+        print(f"Dropped instances {lost} of worker {worker.id}")
+
+cluster.workers.on_worker_lost(_forget_worker)
+
+def submit_prompt(instance_id, prompt, images=None, paced: bool = False):
+    """Queue a prompt for an instance. Returns the Job, or None if the instance does not exist."""
+    instance = get_instance(instance_id)
+    if instance is None:
+        return None
+    return scheduler.submit(instance_id, instance, prompt, images, paced)
+
+def get_job(job_id):
+    return scheduler.get(job_id)
+
+def cancel_job(job_id):
+    return scheduler.cancel(job_id)
\ No newline at end of file
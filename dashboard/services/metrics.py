@@ -0,0 +1,236 @@
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import threading
+import time
+from typing import Iterable, Optional
+
+from dashboard.repository.sqlite import db
+
+# Latency bucket upper bounds in ms: 0.5 ms .. ~2 min, growing by 25% per bucket
+BUCKET_BOUNDS = [0.5 * 1.25 ** i for i in range(56)]
+ROLLUP_SECONDS = 60
+
+
+class Histogram:
+    """Fixed log-spaced latency buckets; recording is a bisect and an increment."""
+    __slots__ = ("counts", "count", "errors", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float, error: bool = False):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if error:
+            self.errors += 1
+
+    def merge(self, other: "Histogram"):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.errors += other.errors
+        self.sum += other.sum
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100), interpolated linearly inside its bucket."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                if i == len(BUCKET_BOUNDS):
+                    return BUCKET_BOUNDS[-1]
+                lower = BUCKET_BOUNDS[i - 1] if i else 0.0
+                return lower + (BUCKET_BOUNDS[i] - lower) * (rank - seen) / c
+            seen += c
+        return BUCKET_BOUNDS[-1]
+
+    def sparse(self) -> dict[int, int]:
+        return {i: c for i, c in enumerate(self.counts) if c}
+
+    @classmethod
+    def from_sparse(cls, buckets: dict, count: int, errors: int, total: float) -> "Histogram":
+        h = cls()
+        for i, c in buckets.items():
+            h.counts[int(i)] = c
+        h.count, h.errors, h.sum = count, errors, total
+        return h
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": self.sum / self.count if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process aggregator for latency, throughput and error counts.
+
+    Each series keeps a cumulative histogram (for the Prometheus endpoint) and a window histogram that is
+    rolled up into SQLite every ROLLUP_SECONDS and then reset.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total: dict[str, Histogram] = {}
+        self._window: dict[str, Histogram] = {}
+        self._window_start = time.time()
+        self._rollup_thread: Optional[threading.Thread] = None
+
+    def observe(self, name: str, ms: float, error: bool = False):
+        with self._lock:
+            total = self._total.get(name)
+            if total is None:
+                total = self._total[name] = Histogram()
+            window = self._window.get(name)
+            if window is None:
+                window = self._window[name] = Histogram()
+            total.observe(ms, error)
+            window.observe(ms, error)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """Time a block; an exception counts as an error and is re-raised."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, error)
+
+    def timed(self, name: str):
+        """Decorator form of timer()."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict[str, Histogram]:
+        with self._lock:
+            copy = {}
+            for name, h in self._total.items():
+                copy[name] = Histogram()
+                copy[name].merge(h)
+            return copy
+
+    def current_window(self) -> tuple[float, dict[str, Histogram]]:
+        """Start time and a copy of the not yet rolled up window."""
+        with self._lock:
+            copy = {}
+            for name, h in self._window.items():
+                copy[name] = Histogram()
+                copy[name].merge(h)
+            return self._window_start, copy
+
+    def rollup(self):
+        """Write the current window to SQLite as one row per series and start a new window."""
+        with self._lock:
+            window, start = self._window, self._window_start
+            self._window, self._window_start = {}, time.time()
+        rows = [(int(start), name, h.count, h.errors, h.sum, h.percentile(50), h.percentile(95), h.percentile(99),
+                 json.dumps(h.sparse())) for name, h in window.items() if h.count]
+        if rows:
+            try:
+                db.save_metric_rollups(rows)
+            except Exception as e:
+                print(f"Failed to store metrics: {e}")
+
+    def start_rollup(self, interval: float = ROLLUP_SECONDS):
+        if self._rollup_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.rollup()
+
+        self._rollup_thread = threading.Thread(target=run, name="metrics-rollup", daemon=True)
+        self._rollup_thread.start()
+        atexit.register(self.rollup)
+
+    def query(self, since: float, until: Optional[float] = None) -> dict[str, Histogram]:
+        """
+        Merged histograms of everything recorded between since and until (unix seconds), at rollup resolution.
+        Without until, the current not yet rolled up window is included.
+        """
+        rows = db.load_metric_rollups(int(since), None if until is None else int(until))
+        merged = merge_rollups((name, count, errors, total, buckets) for _, name, count, errors, total, buckets in rows)
+        if until is None:
+            _, window = self.current_window()
+            for name, h in window.items():
+                merged.setdefault(name, Histogram()).merge(h)
+        return merged
+
+    def hourly_counts(self, prefix: str, hours: int = 24) -> tuple[list[float], list[int]]:
+        """Start times and event counts of the last `hours` hours for series whose name starts with prefix."""
+        now = time.time()
+        first = (int(now) // 3600 - hours + 1) * 3600
+        starts = [first + i * 3600 for i in range(hours)]
+        counts = [0] * hours
+        for bucket_start, name, count, _, _, _ in db.load_metric_rollups(first):
+            if name.startswith(prefix):
+                counts[min((bucket_start - first) // 3600, hours - 1)] += count
+        _, window = self.current_window()
+        counts[-1] += sum(h.count for name, h in window.items() if name.startswith(prefix))
+        return starts, counts
+
+    def prometheus_text(self, prefix: str = "jarvisnet") -> str:
+        """Cumulative series in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_latency_ms Latency of pipeline stages, tool calls and HTTP routes in milliseconds.",
+            f"# TYPE {prefix}_latency_ms histogram",
+        ]
+        errors = [f"# HELP {prefix}_errors_total Failed operations.", f"# TYPE {prefix}_errors_total counter"]
+        for name, h in sorted(self.snapshot().items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, c in zip(BUCKET_BOUNDS, h.counts):
+                cumulative += c
+                lines.append(f'{prefix}_latency_ms_bucket{{name="{label}",le="{bound:.3f}"}} {cumulative}')
+            lines.append(f'{prefix}_latency_ms_bucket{{name="{label}",le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_latency_ms_sum{{name="{label}"}} {h.sum:.3f}')
+            lines.append(f'{prefix}_latency_ms_count{{name="{label}"}} {h.count}')
+            errors.append(f'{prefix}_errors_total{{name="{label}"}} {h.errors}')
+        return "\n".join(lines + errors) + "\n"
+
+
+def merge_rollups(rows: Iterable[tuple]) -> dict[str, Histogram]:
+    """Merge (name, count, errors, sum, buckets json) rows into one histogram per series."""
+    merged: dict[str, Histogram] = {}
+    for name, count, errors, total, buckets in rows:
+        h = Histogram.from_sparse(json.loads(buckets), count, errors, total)
+        if name in merged:
+            merged[name].merge(h)
+        else:
+            merged[name] = h
+    return merged
+
+
+def merge_series(histograms: dict[str, Histogram], prefix: str) -> Histogram:
+    """One histogram over all series whose name starts with prefix, e.g. every HTTP route."""
+    merged = Histogram()
+    for name, h in histograms.items():
+        if name.startswith(prefix):
+            merged.merge(h)
+    return merged
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,116 @@
+from typing import Optional
+
+import ollama
+from ollama import Message
+
+# Rough characters per token before the first real prompt_eval_count is observed
+DEFAULT_CHARS_PER_TOKEN = 4.0
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = ("Summarize the following conversation between a user and an assistant in a few sentences. "
+                  "Keep names, facts, decisions and open tasks. Reply with the summary only.")
+
+
+class TurnMetrics:
+    """Prompt size and latency of a single model call."""
+    def __init__(self, messages: int, estimated_tokens: int, dropped_messages: int):
+        self.messages = messages
+        self.estimated_tokens = estimated_tokens
+        self.dropped_messages = dropped_messages
+        self.prompt_eval_count: Optional[int] = None
+        self.eval_count: Optional[int] = None
+        self.first_token_ms: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class ContextWindow:
+    """
+    Keeps the messages sent to the model within a token budget.
+
+    Leading system messages are pinned. The rest of the history is sent as a sliding window of whole turns
+    (a turn starts at a user message, so tool calls are never separated from their results). When the window
+    overflows it slides forward until it is down to `slide_to` of the budget, so it moves in steps rather than
+    every turn; this keeps the prompt prefix stable for Ollama's cache and keeps summarization rare. Turns that
+    slide out can optionally be folded into a running summary, sent after the pinned messages.
+    Token counts are estimated from text length and calibrated against Ollama's prompt_eval_count.
+    """
+    def __init__(self, max_tokens: int = 4096, reserve_tokens: int = 512, summarize: bool = False, slide_to: float = 0.5,
+                 client: Optional[ollama.Client] = None):
+        self.max_tokens = max_tokens
+        self.reserve_tokens = min(reserve_tokens, max_tokens // 4)
+        self.summarize = summarize
+        self.slide_to = slide_to
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self.client = client or ollama
+
+        self._start = 0 # first non-pinned history message in the window
+        self._summary: Optional[str] = None
+        self._summarized = 0 # number of non-pinned history messages covered by the summary
+
+    def estimate(self, message: Message) -> int:
+        chars = len(message.content or "") + len(message.thinking or "")
+        if message.tool_calls:
+            chars += sum(len(call.function.name) + len(str(call.function.arguments)) for call in message.tool_calls)
+        return int(chars / self.chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, history: list[Message], model: str) -> tuple[list[Message], int]:
+        """Return (messages to send, number of history messages left out)."""
+        pinned = 0
+        while pinned < len(history) and history[pinned].role == "system":
+            pinned += 1
+        head, rest = history[:pinned], history[pinned:]
+
+        budget = self.max_tokens - self.reserve_tokens - sum(self.estimate(m) for m in head)
+        if self._summary:
+            budget -= int(len(self._summary) / self.chars_per_token) + MESSAGE_OVERHEAD_TOKENS
+
+        window = rest[self._start:]
+        sizes = [self.estimate(m) for m in window]
+        used = sum(sizes)
+        if used > budget:
+            # Slide forward turn by turn until the window is small enough; the current turn is always kept
+            target = budget * self.slide_to
+            start = 0
+            for i, message in enumerate(window):
+                if i > 0 and message.role == "user":
+                    start = i
+                    if used <= target:
+                        break
+                used -= sizes[i]
+            self._start += start
+        cut = self._start
+
+        if self.summarize and cut > self._summarized:
+            self._extend_summary(rest[self._summarized:cut], model)
+            self._summarized = cut
+
+        summary = [Message(role="system", content=f"Summary of the earlier conversation: {self._summary}")] if self._summary else []
+        return head + summary + rest[cut:], cut
+
+    def observe(self, messages: list[Message], prompt_eval_count: Optional[int]):
+        """Calibrate the characters-per-token estimate with the real prompt size reported by Ollama."""
+        if not prompt_eval_count:
+            return
+        chars = sum(len(m.content or "") for m in messages)
+        tokens = prompt_eval_count - MESSAGE_OVERHEAD_TOKENS * len(messages)
+        if chars > 0 and tokens > 0:
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * (chars / tokens)
+
+    def _extend_summary(self, messages: list[Message], model: str):
+        lines = [f"{m.role}: {m.content}" for m in messages if m.content and m.role in ("user", "assistant")]
+        if self._summary:
+            lines.insert(0, f"Summary so far: {self._summary}")
+        if not lines:
+            return
+        try:
+            res = self.client.chat(model=model, messages=[
+                Message(role="system", content=SUMMARY_PROMPT),
+                Message(role="user", content="\n".join(lines)),
+            ], stream=False)
+            self._summary = res.message.content
+        except Exception as e:
+            # Without a summary the dropped turns are simply forgotten
+            print(f"Failed to summarize context: {e}")
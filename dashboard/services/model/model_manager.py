@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Iterable, Optional, Union
+
+import ollama
+
+# How long a `ollama ps` snapshot is trusted before asking the server again
+RESIDENCY_REFRESH_SECONDS = 5.0
+
+
+def tagged_model(model: str) -> str:
+    """`ollama ps` reports 'llama3.2:latest' for a model requested as 'llama3.2'."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelStats:
+    """Load and inference timings of one model, from Ollama's load_duration / total_duration."""
+    def __init__(self, model: str):
+        self.model = model
+        self.loads = 0
+        self.last_load_ms: Optional[float] = None
+        self.total_load_ms = 0.0
+        self.calls = 0
+        self.total_inference_ms = 0.0
+
+    def to_dict(self, resident: bool) -> dict:
+        return {
+            "model": self.model,
+            "resident": resident,
+            "loads": self.loads,
+            "last_load_ms": self.last_load_ms,
+            "avg_load_ms": self.total_load_ms / self.loads if self.loads else None,
+            "calls": self.calls,
+            "avg_inference_ms": self.total_inference_ms / self.calls if self.calls else None,
+        }
+
+
+class ModelManager:
+    """
+    Keeps track of which Ollama models are loaded and how much loading costs.
+
+    Models used by the presets are preloaded at startup with their keep_alive policy, residency is read from
+    `ollama ps`, and every chat response reports its load and inference time so swaps become visible.
+    """
+    def __init__(self, host: Optional[str] = None):
+        self.client = ollama.Client(host)
+        self._lock = threading.Lock()
+        self._stats: dict[str, ModelStats] = {}
+        self._resident: set[str] = set()
+        self._resident_at = 0.0
+
+    def _model_stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats(model)
+        return stats
+
+    def preload(self, model: str, keep_alive: Optional[Union[str, float]] = None) -> Optional[float]:
+        """Load a model without generating anything. Returns the load time in ms, or None on failure."""
+        try:
+            res = self.client.generate(model=model, prompt="", keep_alive=keep_alive)
+        except Exception as e:
+            print(f"Failed to preload model {model}: {e}")
+            return None
+        self.record(model, res, inference=False)
+        return (res.load_duration or 0) / 1e6
+
+    def preload_presets(self, presets: Iterable, background: bool = True):
+        """Preload every distinct model used by the presets, each with the keep_alive of its first preset."""
+        models: dict[str, Optional[Union[str, float]]] = {}
+        for preset in presets:
+            models.setdefault(preset.model, getattr(preset, "keep_alive", None))
+
+        def run():
+            for model, keep_alive in models.items():
+                load_ms = self.preload(model, keep_alive)
+                if load_ms is not None:
+                    print(f"Preloaded model {model} in {load_ms:.0f} ms")
+
+        if background:
+            threading.Thread(target=run, name="model-preload", daemon=True).start()
+        else:
+            run()
+
+    def record(self, model: str, res, inference: bool = True):
+        """Record timings of a finished chat/generate response (the final chunk when streaming)."""
+        load_ms = (res.load_duration or 0) / 1e6
+        total_ms = (res.total_duration or 0) / 1e6
+        with self._lock:
+            stats = self._model_stats(model)
+            # Ollama reports a few ms of load_duration even when the model is already resident
+            if load_ms > 50:
+                stats.loads += 1
+                stats.last_load_ms = load_ms
+                stats.total_load_ms += load_ms
+            if inference:
+                stats.calls += 1
+                stats.total_inference_ms += max(total_ms - load_ms, 0.0)
+            self._resident.add(tagged_model(model))
+
+    def refresh(self):
+        self._resident_at = time.monotonic()
+        try:
+            models = {tagged_model(m.model) for m in self.client.ps().models}
+        except Exception:
+            return
+        with self._lock:
+            self._resident = models
+
+    def resident_models(self) -> set[str]:
+        if time.monotonic() - self._resident_at > RESIDENCY_REFRESH_SECONDS:
+            self.refresh()
+        return self._resident
+
+    def is_resident(self, model: str) -> bool:
+        return tagged_model(model) in self.resident_models()
+
+    def stats(self) -> list[dict]:
+        resident = self.resident_models()
+        with self._lock:
+            return [s.to_dict(tagged_model(s.model) in resident) for s in self._stats.values()]
+
+
+model_manager = ModelManager()
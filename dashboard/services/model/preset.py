@@ -1,8 +1,40 @@
-﻿from typing import Optional
+﻿import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Iterator, Union
+from dashboard.services.metrics import metrics
+from dashboard.services.model.context import ContextWindow, TurnMetrics
+from dashboard.services.model.model_manager import model_manager
+from dashboard.services.model.request.registry import ToolRegistry
+from dashboard.services.model.response_cache import ResponseCache
 from dashboard.services.model.request.tool import Tool
 import ollama
 from ollama import Message, ChatResponse
 
+MAX_TURN_METRICS = 100
+DEFAULT_MAX_TOOL_ROUNDS = 8
+
+# Shared by all presets: tool calls of one model turn run concurrently
+_tool_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool")
+# Tools with a timeout run on a small pool of their own. A call that hangs past its timeout keeps its thread (threads
+# cannot be stopped), so it can only hold up later calls of the same tool, which then time out in turn
+MAX_CALLS_PER_TOOL = 4
+_timed_tool_pools: dict[str, ThreadPoolExecutor] = {}
+_timed_tool_pools_lock = threading.Lock()
+
+
+def _pool_for(tool: Tool) -> ThreadPoolExecutor:
+    if tool.timeout is None:
+        return _tool_pool
+    with _timed_tool_pools_lock:
+        pool = _timed_tool_pools.get(tool.name)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=MAX_CALLS_PER_TOOL, thread_name_prefix=f"tool-{tool.name}")
+            _timed_tool_pools[tool.name] = pool
+        return pool
+
 
 class Preset:
     name: str
@@ -11,48 +43,268 @@ class Preset:
     system: Optional[str] = None
     stream: bool = False
     think: bool = False
+    max_context_tokens: Optional[int] = None
+    summarize_context: bool = False
+    max_tool_rounds: int = DEFAULT_MAX_TOOL_ROUNDS
+    keep_alive: Optional[Union[str, float]] = None
+    host: Optional[str] = None
+    cache: Optional[ResponseCache] = None
 
-    history: list[Message] = []
+    history: list[Message]
+    metrics: collections.deque[TurnMetrics]
 
-    def __init__(self, name: str, model: str, tools: Optional[list[Tool]] = None, system: Optional[str] = None, stream: bool = False, think: bool = False):
+    def __init__(self, name: str, model: str, tools: Optional[list[Tool]] = None, system: Optional[str] = None, stream: bool = False, think: bool = False,
+                 max_context_tokens: Optional[int] = None, summarize_context: bool = False, max_tool_rounds: int = DEFAULT_MAX_TOOL_ROUNDS,
+                 keep_alive: Optional[Union[str, float]] = None, host: Optional[str] = None, cache: Optional[ResponseCache] = None):
         self.name = name
         self.model = model
         self.tools = tools or []
+        self.registry = ToolRegistry(self.tools)
         self.system = system
         self.stream = stream
         self.think = think
+        self.max_context_tokens = max_context_tokens
+        self.summarize_context = summarize_context
+        self.max_tool_rounds = max_tool_rounds
+        self.keep_alive = keep_alive
+        # Ollama server of this preset; None uses OLLAMA_HOST (or localhost)
+        self.host = host
+        self.client = ollama.Client(host)
+        # Opt-in; shared by the instances of a preset
+        self.cache = cache
+
+        self.history = []
+        self.metrics = collections.deque(maxlen=MAX_TURN_METRICS)
+        self.context = ContextWindow(max_context_tokens, summarize=summarize_context, client=self.client) if max_context_tokens else None
 
         if system:
             self.history.append(Message(role="system", content=system))
 
+    def config(self) -> dict:
+        """The settings of this preset without tools and history, as keyword arguments for Preset()."""
+        return {
+            "name": self.name,
+            "model": self.model,
+            "system": self.system,
+            "stream": self.stream,
+            "think": self.think,
+            "max_context_tokens": self.max_context_tokens,
+            "summarize_context": self.summarize_context,
+            "max_tool_rounds": self.max_tool_rounds,
+            "keep_alive": self.keep_alive,
+            "host": self.host,
+        }
+
     def prompt(self, prompt, images = None) -> str:
+        if self.stream:
+            return "".join(self.prompt_stream(prompt, images))
+
+        cached, vector = self.__cache_lookup(prompt, images)
+        if cached is not None:
+            return cached
+        turn_start = len(self.history)
         self.history.append(Message(role="user", content=prompt, images=images))
-        res = self.__run_agent()
+        with metrics.timer("llm.prompt"):
+            res = self.__run_agent()
+        self.__cache_store(prompt, images, turn_start, vector)
         return res.message.content
 
-    def __run_agent(self) -> ChatResponse:
-        res = ollama.chat(
-            model=self.model,
-            messages=self.history,
-            tools=[tool.to_schema() for tool in self.tools if tool.available],
-            stream=False,  # TODO: streaming support
-            think=self.think
-        )
-        self.history.append(res.message)
-
-        if res.message.tool_calls:
-            for call in res.message.tool_calls:
-                self.__handle_tool(call.function.name, call.function.arguments)
-            return self.__run_agent()
-        return res
-
-    def __handle_tool(self, name, args):
-        tool = next((t for t in self.tools if t.name == name and t.available), None)
-        if tool and tool.func:
-            result = tool.func(**args)
-            self.history.append(Message(role="tool", tool_name=tool.name, content=result))
+    def prompt_stream(self, prompt, images = None) -> Iterator[str]:
+        """Prompt the agent and yield the reply content token by token.
+
+        Tool calls are resolved between rounds, so the yielded text only contains
+        what the model says to the user.
+        """
+        cached, vector = self.__cache_lookup(prompt, images)
+        if cached is not None:
+            yield cached
+            return
+        turn_start = len(self.history)
+        self.history.append(Message(role="user", content=prompt, images=images))
+        start = time.perf_counter()
+        error = False
+        try:
+            yield from self.__run_agent_stream()
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.observe("llm.prompt", (time.perf_counter() - start) * 1000, error)
+        # Only reached when the reply was streamed to the end
+        self.__cache_store(prompt, images, turn_start, vector)
+
+    def __cache_scope(self, turn_start: int) -> int:
+        # Follow-ups like "why?" depend on what was said before, so the previous exchange is part of the key
+        previous = {}
+        for message in reversed(self.history[:turn_start]):
+            if message.role in ("user", "assistant") and message.content:
+                previous.setdefault(message.role, message.content)
+                if len(previous) == 2:
+                    break
+        return ResponseCache.scope(self.model, self.system, [tool.name for tool in self.tools if tool.available],
+                                   [previous.get("user", ""), previous.get("assistant", "")])
+
+    def __cache_lookup(self, prompt, images):
+        """A cached reply to prompt, added to the history as if the model had given it, or None. Also the prompt embedding."""
+        if self.cache is None:
+            return None, None
+        if images:
+            self.cache.skip()
+            return None, None
+        response, vector = self.cache.lookup(self.__cache_scope(len(self.history)), prompt)
+        if response is not None:
+            self.history.append(Message(role="user", content=prompt))
+            self.history.append(Message(role="assistant", content=response))
+        return response, vector
+
+    def __cache_store(self, prompt, images, turn_start: int, vector):
+        if self.cache is None or images:
+            return
+        turn = self.history[turn_start:]
+        if any(m.role == "tool" for m in turn):
+            self.cache.skip() # the reply depends on what the tools returned
+            return
+        self.cache.store(self.__cache_scope(turn_start), prompt, turn[-1].content, vector)
+
+    def __messages(self) -> tuple[list[Message], TurnMetrics]:
+        """Messages to send for the next model call, trimmed to the context budget, and a metrics record for it."""
+        if self.context:
+            messages, dropped = self.context.build(self.history, self.model)
+            estimated = sum(self.context.estimate(m) for m in messages)
         else:
-            self.history.append(Message(role="tool", tool_name=name, content=f"Tool {name} not found or unavailable."))
+            messages, dropped, estimated = self.history, 0, 0
+        turn = TurnMetrics(len(messages), estimated, dropped)
+        self.metrics.append(turn)
+        return messages, turn
+
+    def __record(self, turn: TurnMetrics, messages: list[Message], res: ChatResponse, start: float):
+        turn.latency_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("llm.chat", turn.latency_ms)
+        turn.prompt_eval_count = res.prompt_eval_count
+        turn.eval_count = res.eval_count
+        model_manager.record(self.model, res)
+        if self.context:
+            self.context.observe(messages, res.prompt_eval_count)
+
+    def __tool_schemas(self, rounds: int) -> list:
+        # Once the round cap is hit the model gets no tools, forcing it to answer with what it has
+        if rounds >= self.max_tool_rounds:
+            return []
+        return self.registry.schemas()
+
+    def __run_agent(self) -> ChatResponse:
+        rounds = 0
+        while True:
+            messages, turn = self.__messages()
+            start = time.perf_counter()
+            res = self.client.chat(
+                model=self.model,
+                messages=messages,
+                tools=self.__tool_schemas(rounds),
+                stream=False,
+                think=self.think,
+                keep_alive=self.keep_alive
+            )
+            self.__record(turn, messages, res, start)
+            self.history.append(res.message)
+
+            if not res.message.tool_calls:
+                return res
+            if rounds >= self.max_tool_rounds:
+                self.__skip_tools(res.message.tool_calls)
+                return res
+            self.__handle_tools(res.message.tool_calls)
+            rounds += 1
+
+    def __run_agent_stream(self) -> Iterator[str]:
+        rounds = 0
+        while True:
+            messages, turn = self.__messages()
+            start = time.perf_counter()
+            chunks = self.client.chat(
+                model=self.model,
+                messages=messages,
+                tools=self.__tool_schemas(rounds),
+                stream=True,
+                think=self.think,
+                keep_alive=self.keep_alive
+            )
+            content = []
+            thinking = []
+            tool_calls = []
+            try:
+                for chunk in chunks:
+                    if turn.first_token_ms is None:
+                        turn.first_token_ms = (time.perf_counter() - start) * 1000
+                        metrics.observe("llm.first_token", turn.first_token_ms)
+                    if chunk.done:
+                        self.__record(turn, messages, chunk, start)
+                    msg = chunk.message
+                    if msg.thinking:
+                        thinking.append(msg.thinking)
+                    if msg.tool_calls:
+                        tool_calls.extend(msg.tool_calls)
+                    if msg.content:
+                        content.append(msg.content)
+                        yield msg.content
+            finally:
+                # Also runs when the consumer closes us early: stop the HTTP stream and keep what was said
+                chunks.close()
+                # Rebuild the full assistant message so the history looks like a non-streamed round
+                self.history.append(Message(
+                    role="assistant",
+                    content="".join(content),
+                    thinking="".join(thinking) or None,
+                    tool_calls=tool_calls or None,
+                ))
+
+            if not tool_calls:
+                return
+            if rounds >= self.max_tool_rounds:
+                self.__skip_tools(tool_calls)
+                return
+            self.__handle_tools(tool_calls)
+            rounds += 1
+
+    def __handle_tools(self, calls):
+        """Run the tool calls of one turn concurrently and append their results in call order."""
+        pending = []
+        submitted = time.monotonic()
+        for call in calls:
+            name = call.function.name
+            compiled = self.registry.get(name)
+            if compiled is None or not compiled.tool.func:
+                pending.append((name, None, None, f"Tool {name} not found or unavailable."))
+                continue
+            args, error = compiled.validate(call.function.arguments)
+            if error:
+                pending.append((name, None, None, f"Invalid arguments for tool {name}: {error}"))
+                continue
+            pending.append((name, compiled.tool, _pool_for(compiled.tool).submit(compiled.tool.invoke, args), None))
+
+        for name, tool, future, error in pending:
+            if error:
+                content = error
+            else:
+                # Timeouts count from submission, so waiting on one call does not extend the others
+                remaining = None if tool.timeout is None else max(0.0, submitted + tool.timeout - time.monotonic())
+                try:
+                    result = future.result(timeout=remaining)
+                    content = result if isinstance(result, str) else json.dumps(result, default=str)
+                except FutureTimeoutError:
+                    # Still queued behind hung calls of the same tool: do not run it at all
+                    future.cancel()
+                    content = f"Tool {name} timed out after {tool.timeout} seconds."
+                except Exception as e:
+                    content = f"Tool {name} failed: {e}"
+            self.history.append(Message(role="tool", tool_name=name, content=content))
+
+    def __skip_tools(self, calls):
+        """Answer tool calls made past the round cap, so every call in the history has its tool message."""
+        for call in calls:
+            name = call.function.name
+            self.history.append(Message(role="tool", tool_name=name,
+                                        content=f"Tool {name} was not called: the limit of {self.max_tool_rounds} tool rounds was reached."))
 
     def __str__(self):
-        return f"Preset(name={self.name}, model={self.model}, tools={[tool.name for tool in self.tools]}, system={self.system}, stream={self.stream}, think={self.think})"
+        return f"Preset(name={self.name}, model={self.model}, tools={[tool.name for tool in self.tools]}, system={self.system}, stream={self.stream}, think={self.think}, max_context_tokens={self.max_context_tokens}, host={self.host})"
@@ -0,0 +1,114 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from dashboard.services.model.request.tool import Tool
+
+# JSON Schema type -> accepted Python types (bool is excluded from the numeric types explicitly)
+JSON_TYPES: Dict[str, tuple] = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "array": (list, tuple),
+    "object": (dict,),
+}
+
+
+class CompiledTool:
+    """A tool with its schema and argument checks computed once."""
+    __slots__ = ("tool", "schema", "types", "enums", "required")
+
+    def __init__(self, tool: Tool):
+        self.tool = tool
+        self.schema = tool.to_schema()
+        self.types = {p.name: p.type for p in tool.params}
+        self.enums = {p.name: frozenset(map(str, p.enum)) for p in tool.params if p.enum is not None}
+        self.required = tuple(p.name for p in tool.params if p.required)
+
+    def validate(self, args: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Check model-supplied arguments against the schema.
+        Returns (arguments to call the tool with, error message or None). Unknown arguments are dropped and
+        numbers/booleans sent as strings are coerced, since small models often get these wrong.
+        """
+        args = args or {}
+        clean: Dict[str, Any] = {}
+        for name, value in args.items():
+            expected = self.types.get(name)
+            if expected is None:
+                continue
+            value = _coerce(value, expected)
+            accepted = JSON_TYPES.get(expected)
+            if accepted and (not isinstance(value, accepted) or (expected != "boolean" and isinstance(value, bool))):
+                return args, f"Argument '{name}' must be of type {expected}."
+            if name in self.enums and str(value) not in self.enums[name]:
+                return args, f"Argument '{name}' must be one of {sorted(self.enums[name])}."
+            clean[name] = value
+
+        missing = [name for name in self.required if name not in clean]
+        if missing:
+            return args, f"Missing required arguments: {', '.join(missing)}."
+        return clean, None
+
+
+def _coerce(value, expected: str):
+    if not isinstance(value, str):
+        return value
+    try:
+        if expected == "integer":
+            return int(value)
+        if expected == "number":
+            return float(value)
+    except ValueError:
+        return value
+    if expected == "boolean" and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return value
+
+
+class ToolRegistry:
+    """
+    Compiled view of a preset's tools.
+
+    Schemas of available tools are built once and reused for every model call until a tool or one of its
+    parameters changes (the registry subscribes to its tools). Lookup by name is a dict access.
+    """
+    def __init__(self, tools: List[Tool]):
+        self._tools = list(tools)
+        self._lock = threading.Lock()
+        # (available tools by name, their schemas), replaced as a whole so readers never see a half-built state
+        self._compiled: Optional[Tuple[Dict[str, CompiledTool], List[Dict[str, Any]]]] = None
+        # Counts invalidations, so a compilation that raced with one is not kept
+        self._generation = 0
+        for tool in self._tools:
+            tool.subscribe(self)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._compiled = None
+
+    def _compile(self) -> Tuple[Dict[str, CompiledTool], List[Dict[str, Any]]]:
+        compiled = self._compiled
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            generation = self._generation
+        by_name = {t.name: CompiledTool(t) for t in self._tools if t.available}
+        compiled = (by_name, [c.schema for c in by_name.values()])
+        with self._lock:
+            # A tool changed while compiling: this call still gets a result, but the next one compiles again
+            if self._generation == generation:
+                self._compiled = compiled
+        return compiled
+
+    def schemas(self) -> List[Dict[str, Any]]:
+        """Schemas of all available tools, as passed to ollama.chat(tools=...)."""
+        return self._compile()[1]
+
+    def get(self, name: str) -> Optional[CompiledTool]:
+        """The available tool with this name, or None."""
+        return self._compile()[0].get(name)
+
+    def __iter__(self):
+        return iter(self._tools)
@@ -1,19 +1,111 @@
-﻿from typing import List, Optional, Dict, Any
+﻿import collections
+import json
+import threading
+import time
+import weakref
+from typing import List, Optional, Dict, Any
+from dashboard.services.metrics import metrics
 from dashboard.services.model.request.tool_param import ToolParameter
 
+# Attributes that end up in to_schema(); changing them invalidates compiled schemas
+SCHEMA_FIELDS = frozenset(("name", "description", "params", "available"))
+
 class Tool:
+    """Represents a function the model can call.
+
+    Fields:
+    - name, description, params: exposed to the model via to_schema()
+    - available: whether the tool is offered to the model
+    - func: the callable invoked with the model-supplied arguments
+    - timeout: seconds a call may take before the model is told it timed out (None waits indefinitely)
+    - cache_ttl: opt-in result cache; results are reused for this many seconds for the same normalized arguments
+    - cache_size: maximum number of cached results, least recently used are evicted
+
+    params is stored as a tuple; assign a new sequence to change it. Listeners (e.g. a ToolRegistry) are told
+    whenever a schema field of the tool or one of its parameters changes.
+    """
+    __slots__ = ("name", "description", "params", "available", "func", "timeout", "cache_ttl", "cache_size",
+                 "_cache", "_cache_lock", "_listeners", "__weakref__")
+
     name: str
-    description: Optional[str] = None
-    params: List[ToolParameter] = []
-    available: bool = True
-    func = None
+    description: Optional[str]
+    params: tuple[ToolParameter, ...]
+    available: bool
+    timeout: Optional[float]
+    cache_ttl: Optional[float]
+    cache_size: int
 
-    def __init__(self, name: str, description: Optional[str] = None, params: Optional[List[ToolParameter]] = None, available: bool = True, func = None):
+    def __init__(self, name: str, description: Optional[str] = None, params: Optional[List[ToolParameter]] = None, available: bool = True, func = None,
+                 timeout: Optional[float] = None, cache_ttl: Optional[float] = None, cache_size: int = 128):
+        object.__setattr__(self, "_listeners", weakref.WeakSet())
         self.name = name
         self.description = description
         self.params = params or []
         self.available = available
         self.func = func
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache: collections.OrderedDict[str, tuple[float, Any]] = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __setattr__(self, key, value):
+        if key == "params":
+            value = tuple(value or ())
+            for param in value:
+                param._owners.add(self)
+        object.__setattr__(self, key, value)
+        if key in SCHEMA_FIELDS:
+            self._changed()
+
+    def _changed(self):
+        for listener in list(self._listeners):
+            listener.invalidate()
+
+    def subscribe(self, listener):
+        """Register an object with an invalidate() method. Held weakly."""
+        self._listeners.add(listener)
+
+    def cache_key(self, args: Dict[str, Any]) -> str:
+        """Tool name plus arguments with sorted keys and whitespace-normalized strings."""
+        def normalize(value):
+            if isinstance(value, str):
+                return " ".join(value.split())
+            if isinstance(value, dict):
+                return {k: normalize(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [normalize(v) for v in value]
+            return value
+        return self.name + ":" + json.dumps(normalize(args or {}), sort_keys=True, default=str)
+
+    def invoke(self, args: Optional[Dict[str, Any]] = None) -> Any:
+        """Call func with the given arguments, serving from the result cache when enabled."""
+        with metrics.timer(f"tool.{self.name}"):
+            return self._invoke(args or {})
+
+    def _invoke(self, args: Dict[str, Any]) -> Any:
+        if not self.cache_ttl:
+            return self.func(**args)
+
+        key = self.cache_key(args)
+        now = time.monotonic()
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] > now:
+                self._cache.move_to_end(key)
+                return hit[1]
+
+        result = self.func(**args)
+        with self._cache_lock:
+            self._cache[key] = (now + self.cache_ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
 
     def to_schema(self) -> Dict[str, Any]:
         """Convert the Tool instance to the requested function schema.
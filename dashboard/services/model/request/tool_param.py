@@ -1,4 +1,5 @@
-﻿from typing import List, Optional, Dict, Any
+﻿import weakref
+from typing import List, Optional, Dict, Any
 
 class ToolParameter:
     """Represents a single parameter for a tool/function.
@@ -9,20 +10,30 @@ class ToolParameter:
     - description: optional description
     - enum: optional list of allowed values
     - required: whether this parameter is required
+
+    Changing a field notifies the tools using this parameter, so their compiled schemas are rebuilt.
     """
+    __slots__ = ("name", "type", "description", "enum", "required", "_owners")
+
     name: str
-    type: str = "string"
-    description: Optional[str] = None
-    enum: Optional[List[str]] = None
-    required: bool = False
+    type: str
+    description: Optional[str]
+    enum: Optional[List[str]]
+    required: bool
 
     def __init__(self, name: str, type: str = "string", description: Optional[str] = None, enum: Optional[List[Any]] = None, required: bool = False):
+        object.__setattr__(self, "_owners", weakref.WeakSet())
         self.name = name
         self.type = type or "string"
         self.description = description
         self.enum = enum
         self.required = required
 
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        for tool in list(self._owners):
+            tool._changed()
+
     def to_schema(self) -> Dict[str, Any]:
         """Convert the ToolParameter instance to a JSON Schema property dict.
 
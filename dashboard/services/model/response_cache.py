@@ -0,0 +1,197 @@
+import collections
+import hashlib
+import re
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+import ollama
+
+from dashboard.services.metrics import metrics
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 600.0
+DEFAULT_EMBED_MODEL = "nomic-embed-text"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation, so trivial variations hit the same entry."""
+    return re.sub(r"\s+", " ", prompt.lower()).strip().rstrip("?!.,;: ")
+
+
+class _Entry:
+    __slots__ = ("response", "expires", "slot")
+
+    def __init__(self, response: str, expires: float, slot: Optional[int]):
+        self.response = response
+        self.expires = expires
+        self.slot = slot
+
+
+class ResponseCache:
+    """
+    Replies of earlier prompts, reused without calling the model.
+
+    Entries are keyed by model, system prompt, tool set, the previous exchange of the conversation and the normalized
+    prompt. With a similarity threshold, prompts are also embedded and a miss on the exact key falls back to the most
+    similar cached prompt with the same model, system prompt, tool set and previous exchange, if its cosine
+    similarity reaches the threshold. Embeddings are kept in one numpy matrix, one row per entry, so a lookup is a
+    single matrix-vector product. Entries expire after ttl seconds; beyond max_entries the least recently used are
+    evicted. Replies of turns that called tools are never stored, since they depend on what the tools returned.
+
+    Parameters:
+    - max_entries: Maximum number of cached replies.
+    - ttl: Seconds a reply is reused.
+    - similarity: Cosine similarity needed for a semantic hit, e.g. 0.92; None for exact matches only.
+    - embed_model: Ollama embedding model for the semantic tier.
+    - host: Ollama server for the embeddings; None uses OLLAMA_HOST.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL, similarity: Optional[float] = None,
+                 embed_model: str = DEFAULT_EMBED_MODEL, host: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.embed_model = embed_model
+        self.client = ollama.Client(host) if similarity is not None else None
+
+        self._entries: collections.OrderedDict[str, _Entry] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Row i holds the unit-length embedding of the entry in slot i; allocated with the first embedding
+        self._vectors: Optional[np.ndarray] = None
+        self._valid: Optional[np.ndarray] = None
+        self._scopes: Optional[np.ndarray] = None
+        self._expires: Optional[np.ndarray] = None
+        self._slot_keys: list[Optional[str]] = [None] * max_entries
+        self._free = list(range(max_entries - 1, -1, -1))
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._embed_failing = False
+
+    @staticmethod
+    def scope(model: str, system: Optional[str], tools: Iterable[str], context: Iterable[str] = ()) -> int:
+        """Hash of everything besides the prompt that a reply depends on; context is e.g. the previous exchange."""
+        text = "\0".join([model, system or "", *sorted(tools), "\1", *context])
+        return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little", signed=True)
+
+    @staticmethod
+    def key(scope: int, prompt: str) -> str:
+        return f"{scope}:{hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()}"
+
+    def lookup(self, scope: int, prompt: str) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        The cached reply for prompt, or None. Also returns the prompt's embedding (when the semantic tier computed
+        one), to pass on to store() after a miss so the prompt is not embedded twice.
+        """
+        start = time.perf_counter()
+        key = self.key(scope, prompt)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                metrics.observe("llm.cache.exact", (time.perf_counter() - start) * 1000)
+                return entry.response, None
+
+        vector = self._embed(prompt)
+        if vector is not None:
+            with self._lock:
+                match = self._nearest(vector, scope, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    metrics.observe("llm.cache.semantic", (time.perf_counter() - start) * 1000)
+                    return self._entries[match].response, vector
+        with self._lock:
+            self.misses += 1
+        metrics.observe("llm.cache.miss", (time.perf_counter() - start) * 1000)
+        return None, vector
+
+    def store(self, scope: int, prompt: str, response: str, vector: Optional[np.ndarray] = None):
+        if not response:
+            return
+        key = self.key(scope, prompt)
+        if vector is None and self.similarity is not None:
+            vector = self._embed(prompt)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._release(old)
+            while len(self._entries) >= self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._release(evicted)
+            slot = None
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                    self._valid = np.zeros(self.max_entries, dtype=bool)
+                    self._scopes = np.zeros(self.max_entries, dtype=np.int64)
+                    self._expires = np.zeros(self.max_entries, dtype=np.float64)
+                if len(vector) == self._vectors.shape[1]:
+                    slot = self._free.pop()
+                    self._vectors[slot] = vector
+                    self._valid[slot] = True
+                    self._scopes[slot] = scope
+                    self._expires[slot] = time.monotonic() + self.ttl
+                    self._slot_keys[slot] = key
+            self._entries[key] = _Entry(response, time.monotonic() + self.ttl, slot)
+
+    def skip(self):
+        """Count a prompt that could not use the cache, e.g. one with images."""
+        with self._lock:
+            self.skipped += 1
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._release(entry)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else None,
+            "semantic": self.similarity is not None,
+        }
+
+    def _nearest(self, vector: np.ndarray, scope: int, now: float) -> Optional[str]:
+        threshold = self.similarity
+        if threshold is None or self._vectors is None or len(vector) != self._vectors.shape[1]:
+            return None
+        scores = self._vectors @ vector
+        scores[~(self._valid & (self._scopes == scope) & (self._expires > now))] = -1.0
+        best = int(np.argmax(scores))
+        return self._slot_keys[best] if scores[best] >= threshold else None
+
+    def _release(self, entry: _Entry):
+        if entry.slot is not None:
+            self._valid[entry.slot] = False
+            self._slot_keys[entry.slot] = None
+            self._free.append(entry.slot)
+
+    def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        if self.similarity is None:
+            return None
+        start = time.perf_counter()
+        try:
+            res = self.client.embed(model=self.embed_model, input=normalize_prompt(prompt))
+        except Exception as e:
+            # This lookup only uses exact matches; the next one tries again
+            if not self._embed_failing:
+                print(f"Failed to embed prompt, using exact matches only until it works again: {e}")
+            self._embed_failing = True
+            return None
+        self._embed_failing = False
+        metrics.observe("llm.cache.embed", (time.perf_counter() - start) * 1000)
+        vector = np.asarray(res.embeddings[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
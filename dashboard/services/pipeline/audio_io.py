@@ -0,0 +1,186 @@
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class AudioSource(ABC):
+    """Feeds int16 mono samples at SAMPLE_RATE into an AudioCapture via capture.write()."""
+    @abstractmethod
+    def start(self, capture):
+        ...
+
+    @abstractmethod
+    def stop(self):
+        ...
+
+
+class MicrophoneSource(AudioSource):
+    """Live input through sounddevice. sounddevice (and PortAudio) is only imported when the stream starts."""
+    def __init__(self, device=None, block_size: int = SAMPLE_RATE // 100):
+        self.device = device
+        self.block_size = block_size
+        self._stream = None
+
+    def start(self, capture):
+        import sounddevice as sd
+        self._stream = sd.InputStream(channels=1, samplerate=SAMPLE_RATE, dtype="int16", blocksize=self.block_size,
+                                      device=self.device, callback=lambda indata, frames, t, status: capture.write(indata))
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class WavSource(AudioSource):
+    """
+    Replays a WAV file (or int16 samples) into the capture from a background thread.
+    Parameters:
+    - speed: Playback speed relative to real time; 0 writes everything at once, so the capture must be able
+      to hold the whole file (see AudioCapture capacity_seconds) or consumers will skip ahead.
+    - block_ms: Size of each write, like the microphone callback blocks.
+    - lead_in / tail: Seconds of silence written before and after the audio, so VAD sees the speech end.
+    - on_end: Called once everything was written, e.g. capture.stop to end blocking readers.
+    """
+    def __init__(self, audio, speed: float = 0.0, block_ms: int = 10, lead_in: float = 0.0, tail: float = 1.0,
+                 on_end=None):
+        samples = read_wav(audio) if isinstance(audio, str) else np.asarray(audio, dtype=np.int16)
+        silence = lambda seconds: np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+        self.samples = np.concatenate((silence(lead_in), samples, silence(tail)))
+        self.speed = speed
+        self.block_size = int(SAMPLE_RATE * block_ms / 1000)
+        self.on_end = on_end
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / SAMPLE_RATE
+
+    def start(self, capture):
+        self._thread = threading.Thread(target=self._run, args=(capture,), name="wav-source", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, capture):
+        start = time.perf_counter()
+        for offset in range(0, len(self.samples), self.block_size):
+            if self._stop.is_set():
+                break
+            if self.speed:
+                delay = start + offset / SAMPLE_RATE / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            capture.write(self.samples[offset:offset + self.block_size])
+        self.finished.set()
+        if self.on_end:
+            self.on_end()
+
+
+class AudioSink(ABC):
+    """Plays int16 mono audio. open() returns a stream with write(samples) and close()."""
+    @abstractmethod
+    def open(self, sample_rate: int):
+        ...
+
+
+class SpeakerSink(AudioSink):
+    """Live output through sounddevice, imported on first use."""
+    def __init__(self, device=None):
+        self.device = device
+
+    def open(self, sample_rate: int):
+        import sounddevice as sd
+        return _SpeakerStream(sd.OutputStream(samplerate=sample_rate, channels=1, dtype='int16', device=self.device))
+
+
+class _SpeakerStream:
+    def __init__(self, stream):
+        self._stream = stream
+        self._stream.start()
+
+    def write(self, samples: np.ndarray):
+        self._stream.write(samples)
+
+    def close(self):
+        self._stream.stop()
+        self._stream.close()
+
+
+class NullSink(AudioSink):
+    """Discards audio but counts it, for headless runs and benchmarks."""
+    def __init__(self):
+        self.samples = 0
+        self.sample_rate = 0
+
+    def open(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        return self
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def write(self, samples: np.ndarray):
+        self.samples += len(samples)
+
+    def close(self):
+        pass
+
+
+class WavSink(AudioSink):
+    """Writes everything played through one open() to a WAV file."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def open(self, sample_rate: int):
+        return _WavStream(self.path, sample_rate)
+
+
+class _WavStream:
+    def __init__(self, path: str, sample_rate: int):
+        self._file = wave.open(path, "wb")
+        self._file.setnchannels(1)
+        self._file.setsampwidth(2)
+        self._file.setframerate(sample_rate)
+
+    def write(self, samples: np.ndarray):
+        self._file.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+
+    def close(self):
+        self._file.close()
+
+
+def read_wav(path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Read a 16-bit PCM WAV file as int16 mono at sample_rate (channels are averaged, other rates resampled)."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        channels, rate = f.getnchannels(), f.getframerate()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate:
+        # Linear interpolation is plenty for speech fed into 16 kHz models
+        positions = np.arange(int(len(samples) * sample_rate / rate)) * rate / sample_rate
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.asarray(samples).astype(np.int16)
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
@@ -0,0 +1,75 @@
+import threading
+from typing import Optional
+
+import numpy as np
+import webrtcvad
+
+from dashboard.services.pipeline.capture import AudioCapture
+from dashboard.services.pipeline.speech import Playback
+
+SAMPLE_RATE = 16000
+FRAME_DURATION_MS = 30
+FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
+
+
+class BargeInDetector:
+    """
+    Listens to the microphone while the assistant speaks and reports when the user starts talking.
+
+    A frame counts as user speech when webrtcvad says it is speech and it is clearly louder than the echo
+    expected from the loudspeaker: mic RMS > margin * echo_gain * playback RMS + noise_floor. echo_gain (how
+    much of the playback level reaches the microphone) is learned from frames that do not count as user speech,
+    so the gate adapts to speaker volume and room. min_speech seconds of consecutive user speech trigger.
+
+    Parameters:
+    - aggressiveness: webrtcvad aggressiveness (0-3); high, since the speaker output is partly speech.
+    - min_speech: Seconds of consecutive user speech needed to interrupt.
+    - margin: How much louder than the expected echo the microphone must be.
+    - noise_floor: Minimum mic RMS (int16 units) for user speech, regardless of playback.
+    - echo_gain: Initial estimate of playback-to-microphone coupling.
+    """
+    def __init__(self, aggressiveness: int = 3, min_speech: float = 0.3, margin: float = 2.0,
+                 noise_floor: float = 300.0, echo_gain: float = 0.5):
+        self.aggressiveness = aggressiveness
+        self.set_min_speech(min_speech)
+        self.margin = margin
+        self.noise_floor = noise_floor
+        self.echo_gain = echo_gain
+        self.interruptions = 0
+
+    def set_min_speech(self, min_speech: float):
+        self.min_frames = max(1, int(min_speech * 1000 / FRAME_DURATION_MS))
+
+    def is_user_speech(self, frame: np.ndarray, playback_rms: float, is_speech: bool) -> bool:
+        mic_rms = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+        user = is_speech and mic_rms > self.margin * self.echo_gain * playback_rms + self.noise_floor
+        if not user and playback_rms > self.noise_floor:
+            # Slowly track the coupling while only the assistant is audible
+            self.echo_gain = 0.95 * self.echo_gain + 0.05 * (mic_rms / playback_rms)
+        return user
+
+    def watch(self, capture: AudioCapture, playback: Playback, stop_event: Optional[threading.Event] = None,
+              start: Optional[int] = None) -> Optional[int]:
+        """
+        Block until the playback finishes or the user starts speaking.
+        Returns the capture position where the user's speech began, or None if the playback finished
+        (or stop_event was set) without the user speaking. Speech that started just before the playback
+        finished is returned too, so recording does not miss its beginning.
+        """
+        vad = webrtcvad.Vad(self.aggressiveness)
+        reader = capture.reader(start)
+        run = 0
+        while not playback.done.is_set():
+            if stop_event and stop_event.is_set():
+                return None
+            frame = reader.read(FRAME_SIZE, timeout=0.1)
+            if frame is None:
+                if not capture.running:
+                    return None
+                continue
+            speech = vad.is_speech(frame.tobytes(), SAMPLE_RATE)
+            run = run + 1 if self.is_user_speech(frame, playback.level(), speech) else 0
+            if run >= self.min_frames:
+                self.interruptions += 1
+                return reader.pos - run * FRAME_SIZE
+        return reader.pos - run * FRAME_SIZE if run else None
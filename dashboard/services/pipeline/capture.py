@@ -0,0 +1,117 @@
+import threading
+from typing import Optional
+
+import numpy as np
+
+from dashboard.services.pipeline.audio_io import AudioSource, MicrophoneSource
+
+SAMPLE_RATE = 16000
+CHANNELS = 1
+BLOCK_DURATION_MS = 10
+BLOCK_SIZE = int(SAMPLE_RATE * BLOCK_DURATION_MS / 1000)
+
+
+class AudioCapture:
+    """
+    One persistent microphone stream shared by wake word detection, VAD and recording.
+
+    The audio source (the microphone by default, or e.g. a WavSource for offline runs) writes int16 samples
+    into a preallocated ring buffer. Positions are
+    absolute sample counts since start(), so consumers can hand a position to each other (e.g. wake end ->
+    recorder start) without losing audio in between, and can look back up to `capacity_seconds`.
+    """
+    def __init__(self, capacity_seconds: float = 30.0, device=None, source: Optional[AudioSource] = None):
+        self.source = source or MicrophoneSource(device, BLOCK_SIZE)
+        self._ring = np.zeros(int(capacity_seconds * SAMPLE_RATE), dtype=np.int16)
+        self._written = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self.overruns = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._ring)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def position(self) -> int:
+        """Absolute position (in samples) of the next sample to be captured."""
+        return self._written
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.source.start(self)
+
+    def stop(self):
+        if not self._running:
+            return
+        self.source.stop()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def write(self, samples: np.ndarray):
+        """Append samples to the ring buffer. Called from the capture thread."""
+        samples = samples.ravel()
+        n = len(samples)
+        with self._cond:
+            if n > self.capacity:
+                samples = samples[-self.capacity:]
+                self._written += n - self.capacity
+                n = self.capacity
+            start = self._written % self.capacity
+            first = min(n, self.capacity - start)
+            self._ring[start:start + first] = samples[:first]
+            self._ring[:n - first] = samples[first:]
+            self._written += n
+            self._cond.notify_all()
+
+    def read(self, pos: int, n: int, timeout: Optional[float] = None) -> tuple[Optional[np.ndarray], int]:
+        """
+        Read n samples starting at absolute position pos, blocking until they are captured.
+        Returns (samples, pos) where pos is the position actually read from: if the requested audio was
+        already overwritten, the read skips ahead to the oldest available sample.
+        The returned array is a view into the ring when contiguous; copy it if it must outlive the buffer.
+        Returns (None, pos) on timeout or when capture is stopped.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._written >= pos + n or not self._running, timeout)
+            if not ready or self._written < pos + n:
+                return None, pos
+            oldest = self._written - self.capacity
+            if pos < oldest:
+                self.overruns += 1
+                pos = oldest
+            start = pos % self.capacity
+            if start + n <= self.capacity:
+                return self._ring[start:start + n], pos
+            return np.concatenate((self._ring[start:], self._ring[:start + n - self.capacity])), pos
+
+    def reader(self, start: Optional[int] = None, preroll: float = 0.0) -> "CaptureReader":
+        """
+        Create a consumer cursor.
+        Parameters:
+        - start: Absolute position to start from. Defaults to the current position.
+        - preroll: Seconds of already captured audio to include before start.
+        """
+        pos = self.position if start is None else start
+        pos -= int(preroll * SAMPLE_RATE)
+        return CaptureReader(self, max(pos, self.position - self.capacity, 0))
+
+
+class CaptureReader:
+    """A consumer cursor into an AudioCapture, reading frames at its own frame size."""
+    def __init__(self, capture: AudioCapture, pos: int):
+        self.capture = capture
+        self.pos = pos
+
+    def read(self, n: int, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        frame, pos = self.capture.read(self.pos, n, timeout)
+        if frame is not None:
+            self.pos = pos + n
+        return frame
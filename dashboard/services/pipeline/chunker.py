@@ -0,0 +1,31 @@
+import re
+from typing import Iterable, Iterator
+
+# End of a sentence: terminal punctuation (optionally followed by closing quotes/brackets) and whitespace,
+# or a line break. The trailing whitespace is required so "3.5" or "z.B." mid-token does not split.
+SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+|\n+')
+MIN_SENTENCE_CHARS = 12
+
+
+def chunk_sentences(tokens: Iterable[str], min_chars: int = MIN_SENTENCE_CHARS) -> Iterator[str]:
+    """
+    Group a stream of LLM tokens into complete sentences.
+    Yields each sentence as soon as its end is seen, so synthesis can start while generation continues.
+    Parameters:
+    - tokens: Iterable of text fragments, e.g. from Preset.prompt_stream.
+    - min_chars: Sentences shorter than this are merged with the next one to avoid choppy audio.
+    """
+    buf = ""
+    for token in tokens:
+        buf += token
+        start = 0
+        for match in SENTENCE_END.finditer(buf):
+            end = match.end()
+            if len(buf[start:end].strip()) < min_chars:
+                continue
+            yield buf[start:end].strip()
+            start = end
+        buf = buf[start:]
+
+    if buf.strip():
+        yield buf.strip()
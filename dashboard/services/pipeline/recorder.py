@@ -1,63 +1,80 @@
-﻿import time
-import tempfile
-import wave
+﻿import collections
+import threading
+from typing import Callable, Optional
+
 import numpy as np
-import sounddevice as sd
 import webrtcvad
 
+from dashboard.services.pipeline.capture import AudioCapture
+
 SAMPLE_RATE = 16000
 CHANNELS = 1
 FRAME_DURATION_MS = 30
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
 
 
-def _write_wav(path, audio_np):
-    with wave.open(path, "wb") as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(2)
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(audio_np.tobytes())
-
-
-def record_utterance(initial_timeout=10, silence_timeout=0.5, total_timeout=60, aggressiveness=2):
+def record_utterance(capture: AudioCapture, initial_timeout=10, silence_timeout=0.5, total_timeout=60, aggressiveness=2,
+                     preroll=0.3, start: Optional[int] = None,
+                     on_frame: Optional[Callable[[np.ndarray], None]] = None,
+                     stop_event: Optional[threading.Event] = None) -> Optional[np.ndarray]:
     """
     Record audio after wake until silence (webrtcvad) or timeout.
-    Returns path to WAV file.
+    Returns the recorded audio as an in-memory int16 numpy array, starting shortly before speech onset.
     Parameters:
+    - capture: Shared AudioCapture to read from.
     - initial_timeout: Maximum time to wait for initial speech (in seconds). Will return None if no speech is detected within this time.
     - silence_timeout: Time of silence to consider the end of speech (in seconds).
     - total_timeout: Maximum total recording time (in seconds).
     - aggressiveness: VAD aggressiveness (0-3).
+    - preroll: Audio kept from before VAD onset (in seconds), so the first syllable is not cut off.
+    - start: Capture position to start reading from, e.g. the position returned by WakeEngine.listen. Defaults to now.
+    - on_frame: Called with every recorded int16 frame while recording, e.g. StreamingTranscriber.feed.
+    - stop_event: Aborts the recording (returning None) when set.
     """
     vad = webrtcvad.Vad(aggressiveness)
+    reader = capture.reader(start)
+    pending = collections.deque(maxlen=max(1, int(preroll * 1000 / FRAME_DURATION_MS)))
     frames = []
-    silence_start = None
-    start_time = time.time()
+    silence_frames = 0
+    total_frames = 0
     started = False
 
-    with sd.InputStream(channels=CHANNELS, samplerate=SAMPLE_RATE, dtype="int16", blocksize=FRAME_SIZE) as stream:
-        while True:
-            data, _ = stream.read(FRAME_SIZE)
-            frames.append(data.copy())
-            pcm = data.tobytes()
-            is_speech = vad.is_speech(pcm, SAMPLE_RATE)
+    # Timeouts are counted in captured audio, not wall time, so a consumer that lags behind still sees every frame
+    initial_limit = initial_timeout * 1000 / FRAME_DURATION_MS
+    silence_limit = silence_timeout * 1000 / FRAME_DURATION_MS
+    total_limit = total_timeout * 1000 / FRAME_DURATION_MS
 
-            now = time.time()
+    while True:
+        if stop_event and stop_event.is_set():
+            return None
+        data = reader.read(FRAME_SIZE, timeout=0.5)
+        if data is None:
+            if capture.running:
+                continue
+            break # capture stopped
+        frame = data.copy()
+        total_frames += 1
+        is_speech = vad.is_speech(frame.tobytes(), SAMPLE_RATE)
+
+        if not started:
+            pending.append(frame)
             if is_speech:
                 started = True
-                silence_start = None
-            else:
-                if silence_start is None:
-                    silence_start = now
-                elif started and now - silence_start > silence_timeout:
-                    break
-                elif not started and now - start_time > initial_timeout:
-                    return None # No speech detected, don't waste time transcribing silence
-
-            if now - start_time > total_timeout:
-                break
-
-    audio = np.concatenate(frames, axis=0).ravel().astype(np.int16)
-    tf = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-    _write_wav(tf.name, audio)
-    return tf.name
+                for f in pending:
+                    frames.append(f)
+                    if on_frame:
+                        on_frame(f)
+            elif total_frames > initial_limit:
+                return None # No speech detected, don't waste time transcribing silence
+            continue
+
+        frames.append(frame)
+        if on_frame:
+            on_frame(frame)
+        silence_frames = 0 if is_speech else silence_frames + 1
+        if silence_frames > silence_limit or total_frames > total_limit:
+            break
+
+    if not frames:
+        return None
+    return np.concatenate(frames).astype(np.int16)
@@ -0,0 +1,283 @@
+import atexit
+import collections
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+from piper import PiperVoice
+
+from dashboard.services.metrics import metrics
+from dashboard.services.pipeline.audio_io import AudioSink, SpeakerSink
+
+CACHE_DIR = "cache/tts"
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+# Audio is written in slices of this length, so an interruption takes effect within one slice
+SLICE_SECONDS = 0.1
+
+
+class PhraseCache:
+    """
+    Content-addressed on-disk cache of synthesized speech: sha256(voice + text) -> raw int16 PCM file.
+    Reads are memory-mapped. The least recently used files are deleted once the cache exceeds max_bytes.
+    """
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first; rebuilt from modification times on startup
+        self._index: collections.OrderedDict[str, int] = collections.OrderedDict()
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".pcm"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name[:-len(".pcm")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+        self.size = sum(self._index.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @staticmethod
+    def key(voice_id: str, text: str) -> str:
+        return hashlib.sha256(f"{voice_id}\0{text}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            size = self._index.get(key)
+            if size is None:
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            os.utime(path) # keeps the LRU order across restarts
+            return np.memmap(path, dtype=np.int16, mode="r") if size else np.zeros(0, dtype=np.int16)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                if self._index.pop(key, None) is not None:
+                    self.size -= size
+            return None
+
+    def put(self, key: str, pcm: np.ndarray):
+        data = np.asarray(pcm, dtype=np.int16).tobytes()
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path) # readers never see a partial file
+        with self._lock:
+            self.size += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self.size > self.max_bytes and len(self._index) > 1:
+                old, old_size = self._index.popitem(last=False)
+                self.size -= old_size
+                try:
+                    os.remove(self._path(old))
+                except FileNotFoundError:
+                    pass
+
+
+class SpeechService:
+    """
+    Text to speech through one persistent output stream.
+
+    Stock phrases (like the greeting after the wake word) are rendered at startup and kept in memory, other
+    sentences go through the PhraseCache, so anything said before plays without synthesis. Sentences that
+    are not cached are played chunk by chunk while they are synthesized and stored afterwards.
+
+    Parameters:
+    - voice: Loaded PiperVoice.
+    - voice_id: Identifies the voice in cache keys, e.g. the model path.
+    - sink: Where to play audio. Defaults to the speakers.
+    - phrases: Stock phrases to pre-render.
+    - cache: PhraseCache to use, or None to synthesize everything that is not a stock phrase.
+    """
+    def __init__(self, voice: PiperVoice, voice_id: str, sink: Optional[AudioSink] = None,
+                 phrases: Iterable[str] = (), cache: Optional[PhraseCache] = None):
+        self.voice = voice
+        self.voice_id = voice_id
+        self.sample_rate = voice.config.sample_rate
+        self.cache = cache
+        self._sink = sink or SpeakerSink()
+        self._stream = None
+        self._lock = threading.Lock()
+        self._phrases: dict[str, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+        for phrase in phrases:
+            self._phrases[phrase] = np.array(self.render(phrase))
+        self.hits = self.misses = 0
+
+    def render(self, text: str) -> np.ndarray:
+        """The int16 PCM of text, from memory, the disk cache, or freshly synthesized (and then cached)."""
+        pcm = self._cached(text)
+        if pcm is None:
+            pcm = np.concatenate(list(self._synthesize(text)) or [np.zeros(0, dtype=np.int16)])
+            self._store(text, pcm)
+        return pcm
+
+    def speak(self, text: str) -> Optional[float]:
+        """Play text. Returns the time.perf_counter() timestamp of the first audio written, or None."""
+        return self.speak_stream([text])
+
+    def play(self, sentences: Iterable[str]) -> "Playback":
+        """Start speaking sentences on a background thread."""
+        return Playback(self, sentences)
+
+    @metrics.timed("tts.speak")
+    def speak_stream(self, sentences: Iterable[str], interrupt: Optional[threading.Event] = None,
+                     on_write: Optional[Callable[[np.ndarray], None]] = None) -> Optional[float]:
+        """
+        Play sentences as they arrive, e.g. from chunk_sentences. Returns the timestamp of the first audio.
+        Parameters:
+        - interrupt: Stops playback within SLICE_SECONDS when set. The sentence iterator is closed, which also
+          cancels an LLM stream feeding it.
+        - on_write: Called with every slice right before it is written, e.g. to track the playback level.
+        """
+        first_audio = None
+        slice_size = int(self.sample_rate * SLICE_SECONDS)
+        try:
+            for sentence in sentences:
+                start = time.perf_counter()
+                pcm = self._cached(sentence)
+                chunks = [pcm] if pcm is not None else self._synthesize(sentence)
+                rendered = []
+                with self._lock:
+                    stream = self._open()
+                    for chunk in chunks:
+                        rendered.append(chunk)
+                        for offset in range(0, len(chunk), slice_size):
+                            if interrupt is not None and interrupt.is_set():
+                                return first_audio
+                            if first_audio is None:
+                                first_audio = time.perf_counter()
+                                metrics.observe("tts.first_chunk", (first_audio - start) * 1000)
+                            part = chunk[offset:offset + slice_size]
+                            if on_write:
+                                on_write(part)
+                            stream.write(part)
+                if pcm is None and rendered:
+                    self._store(sentence, np.concatenate(rendered))
+        finally:
+            close = getattr(sentences, "close", None)
+            if close:
+                close()
+        return first_audio
+
+    def close(self):
+        with self._lock:
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+    def stats(self) -> dict:
+        return {
+            "phrases": len(self._phrases),
+            "hits": self.hits,
+            "misses": self.misses,
+            "cache_bytes": self.cache.size if self.cache else 0,
+            "cache_files": len(self.cache) if self.cache else 0,
+        }
+
+    def _open(self):
+        if self._stream is None:
+            self._stream = self._sink.open(self.sample_rate)
+            atexit.register(self.close)
+        return self._stream
+
+    def _key(self, text: str) -> str:
+        return PhraseCache.key(self.voice_id, text)
+
+    def _cached(self, text: str) -> Optional[np.ndarray]:
+        pcm = self._phrases.get(text)
+        if pcm is None and self.cache is not None:
+            pcm = self.cache.get(self._key(text))
+        if pcm is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return pcm
+
+    def _synthesize(self, text: str):
+        for chunk in self.voice.synthesize(text):
+            yield np.frombuffer(chunk.audio_int16_bytes, dtype=np.int16)
+
+    def _store(self, text: str, pcm: np.ndarray):
+        if self.cache is not None:
+            try:
+                self.cache.put(self._key(text), pcm)
+            except OSError as e:
+                print(f"Failed to cache speech: {e}")
+
+
+class Playback:
+    """
+    A reply being spoken on a background thread, with the level of what was just played so that
+    barge-in detection can tell the assistant's own voice (echo) from the user.
+    """
+    def __init__(self, service: SpeechService, sentences: Iterable[str]):
+        self.first_audio: Optional[float] = None
+        # Sentences that were (at least partly) heard, in order
+        self.spoken: list[str] = []
+        self.error: Optional[Exception] = None
+        self._pending: Optional[str] = None
+        self.done = threading.Event()
+        self._interrupt = threading.Event()
+        self._levels: collections.deque[tuple[float, float]] = collections.deque(maxlen=64) # (time written, rms)
+        self._thread = threading.Thread(target=self._run, args=(service, self._track(sentences)), name="playback",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def interrupted(self) -> bool:
+        return self._interrupt.is_set()
+
+    def interrupt(self):
+        self._interrupt.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+    def level(self, window: float = 0.5) -> float:
+        """Loudest RMS written within the last `window` seconds; covers the output device's buffering delay."""
+        since = time.perf_counter() - window
+        return max((rms for t, rms in list(self._levels) if t >= since), default=0.0)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.spoken)
+
+    def _track(self, sentences: Iterable[str]) -> Iterator[str]:
+        iterator = iter(sentences)
+        try:
+            for sentence in iterator:
+                self._pending = sentence
+                yield sentence
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def _on_write(self, part: np.ndarray):
+        if self._pending is not None:
+            self.spoken.append(self._pending)
+            self._pending = None
+        rms = float(np.sqrt(np.mean(part.astype(np.float32) ** 2))) if len(part) else 0.0
+        self._levels.append((time.perf_counter(), rms))
+
+    def _run(self, service: SpeechService, sentences: Iterable[str]):
+        try:
+            self.first_audio = service.speak_stream(sentences, self._interrupt, self._on_write)
+        except Exception as e:
+            # E.g. the LLM stream behind the sentences failed; raised again by whoever waits for the playback
+            print(f"Playback failed: {e}")
+            self.error = e
+        finally:
+            self.done.set()
@@ -1,9 +1,123 @@
-﻿def transcribe(wav_path, model, beam_size=5):
+﻿import threading
+
+import numpy as np
+
+from dashboard.services.metrics import metrics
+
+SAMPLE_RATE = 16000
+
+
+def to_float32(audio):
+    """Convert int16 PCM to the float32 [-1, 1] waveform faster-whisper expects. Other inputs pass through."""
+    if isinstance(audio, np.ndarray) and audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio
+
+
+class StreamingTranscriber:
     """
-    Transcribe a wav file using faster-whisper.
-    Returns concatenated text.
+    Decodes an utterance while it is still being recorded.
+
+    Frames are fed from the recorder thread. A background worker periodically decodes the audio that is
+    not yet committed; segments ending well before the live edge are committed and never decoded again.
+    After end of speech, finish() only has to decode the short uncommitted tail.
+
+    Parameters:
+    - service: TranscriptionService whose model pool does the decoding.
+    - session: Conversation the utterance belongs to; its cached language skips detection.
+    - partial_interval: Seconds of new audio between partial decodes.
+    - stable_margin: Segments ending closer than this to the live edge (in seconds) are not committed yet.
     """
-    segments, info = model.transcribe(wav_path, beam_size=beam_size)
-    text = " ".join(seg.text for seg in segments).strip()
-    language_data = (info.language, info.language_probability)
-    return str(text), language_data
+    def __init__(self, service, session=None, partial_interval=1.0, stable_margin=1.0):
+        self.service = service
+        self.session = session
+        self.partial_interval = partial_interval
+        self.stable_margin = stable_margin
+
+        self._buffer = np.zeros(SAMPLE_RATE * 30, dtype=np.float32)
+        self._length = 0
+        self._committed = 0 # sample offset up to which text is final
+        self._texts: list[str] = []
+        # The language windows are decoded in, once known; until then each window detects it again
+        self._language, self._language_probability = service.language(session) or (None, 0.0)
+        self._detected_language = None
+        self._detected = False
+        self._decoded_at = 0
+
+        self._lock = threading.Lock()
+        self._new_audio = threading.Event()
+        self._done = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def feed(self, frame: np.ndarray):
+        """Append an int16 or float32 frame."""
+        frame = to_float32(frame.ravel())
+        with self._lock:
+            end = self._length + len(frame)
+            if end > len(self._buffer):
+                grown = np.zeros(max(end, len(self._buffer) * 2), dtype=np.float32)
+                grown[:self._length] = self._buffer[:self._length]
+                self._buffer = grown
+            self._buffer[self._length:end] = frame
+            self._length = end
+        if self._length - self._decoded_at >= self.partial_interval * SAMPLE_RATE:
+            self._new_audio.set()
+
+    def cancel(self):
+        """Stop the background worker without decoding the rest."""
+        self._done = True
+        self._new_audio.set()
+        self._worker.join()
+
+    def finish(self):
+        """
+        Decode the remaining tail and return (text, (language, probability)), like TranscriptionService.transcribe().
+        """
+        self.cancel()
+        with self._lock:
+            tail = self._buffer[self._committed:self._length].copy()
+            duration = self._length / SAMPLE_RATE
+        if len(tail) > 0:
+            self._decode(tail, duration, commit_all=True)
+        language = self._language or self._detected_language
+        if self._detected:
+            self.service.remember_language(self.session, language, self._language_probability)
+        text = " ".join(t for t in self._texts if t).strip()
+        return text, (language, self._language_probability)
+
+    def _run(self):
+        while True:
+            self._new_audio.wait()
+            self._new_audio.clear()
+            if self._done:
+                return
+            with self._lock:
+                self._decoded_at = self._length
+                window = self._buffer[self._committed:self._length].copy()
+                duration = self._length / SAMPLE_RATE
+            self._decode(window, duration, commit_all=False)
+
+    @metrics.timed("stt.decode")
+    def _decode(self, window, duration, commit_all):
+        # The utterance length so far, not the window's, picks the decoding: the windows are almost always short
+        segments, info = self.service.decode(window, self._language, duration)
+        if self._language is None:
+            self._detected_language = info.language
+            self._language_probability = info.language_probability
+            self._detected = True
+            # Pin a confident detection so later windows skip detection and stay consistent. An early window is
+            # often mostly silence or a pause, so an unsure guess is not forced on the rest of the utterance.
+            if info.language_probability >= self.service.language_confidence:
+                self._language = info.language
+
+        live_edge = len(window) / SAMPLE_RATE
+        committed_until = 0.0
+        for seg in segments:
+            if not commit_all and seg.end > live_edge - self.stable_margin:
+                break
+            self._texts.append(seg.text.strip())
+            committed_until = seg.end
+        if commit_all:
+            committed_until = live_edge
+        self._committed += int(committed_until * SAMPLE_RATE)
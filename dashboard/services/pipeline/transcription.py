@@ -0,0 +1,114 @@
+import contextlib
+import queue
+import threading
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+from dashboard.services.metrics import metrics
+from dashboard.services.pipeline.stt import SAMPLE_RATE, StreamingTranscriber, to_float32
+
+
+class TranscriptionService:
+    """
+    A pool of faster-whisper models shared by all conversations.
+
+    Each transcription checks a model out of the pool, so sessions decode in parallel up to pool_size instead of
+    queueing on one model; each model gets its own cpu_threads. Utterances shorter than greedy_below seconds are
+    decoded greedily (beam size 1), which is much faster and rarely worse for a few words. The language detected
+    for a session is cached once it is confident enough, so later utterances skip language detection.
+
+    Parameters:
+    - model_size: Whisper model name or path, e.g. "small".
+    - device: "cpu" or "cuda".
+    - compute_type: CTranslate2 quantization, int8 by default (about 4x smaller and faster on CPU than float32).
+    - pool_size: Number of model instances.
+    - cpu_threads: Threads per model instance.
+    - beam_size: Beam size for utterances of greedy_below seconds and longer.
+    - greedy_below: Utterance length (in seconds) under which greedy decoding is used.
+    - language_confidence: Minimum detection probability for a language to be cached for the session.
+    """
+    def __init__(self, model_size: str = "small", device: str = "cpu", compute_type: str = "int8", pool_size: int = 2,
+                 cpu_threads: int = 2, beam_size: int = 5, greedy_below: float = 3.0, language_confidence: float = 0.7):
+        self.model_size = model_size
+        self.beam_size = beam_size
+        self.greedy_below = greedy_below
+        self.language_confidence = language_confidence
+        self.pool_size = pool_size
+
+        self._pool: queue.Queue[WhisperModel] = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads))
+        self._languages: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.transcriptions = 0
+        self.greedy = 0
+
+    @contextlib.contextmanager
+    def checkout(self) -> Iterator[WhisperModel]:
+        """Borrow a model for one decode, waiting for a free one if all are busy."""
+        start = time.perf_counter()
+        model = self._pool.get()
+        metrics.observe("stt.checkout_wait", (time.perf_counter() - start) * 1000)
+        try:
+            yield model
+        finally:
+            self._pool.put(model)
+
+    def language(self, session: Optional[str]) -> Optional[tuple[str, float]]:
+        """The cached (language, probability) of a session, or None to detect it."""
+        return self._languages.get(session) if session is not None else None
+
+    def remember_language(self, session: Optional[str], language: Optional[str], probability: float):
+        if session is not None and language and probability >= self.language_confidence:
+            with self._lock:
+                self._languages[session] = (language, probability)
+
+    def forget_session(self, session: str):
+        with self._lock:
+            self._languages.pop(session, None)
+
+    def decode(self, audio: np.ndarray, language: Optional[str] = None,
+               duration: Optional[float] = None) -> tuple[list, object]:
+        """
+        Decode float32 audio on a pooled model. Returns (segments, info) with the segments fully decoded,
+        since faster-whisper decodes lazily and the model must not be used after it is returned to the pool.
+        duration is the length of the whole utterance in seconds, when audio is only a window of it; it decides
+        between greedy and beam search decoding.
+        """
+        if duration is None:
+            duration = len(audio) / SAMPLE_RATE
+        greedy = duration < self.greedy_below
+        with self._lock:
+            self.transcriptions += 1
+            self.greedy += greedy
+        with self.checkout() as model:
+            segments, info = model.transcribe(audio, beam_size=1 if greedy else self.beam_size, language=language)
+            return list(segments), info
+
+    def transcribe(self, audio, session: Optional[str] = None) -> tuple[str, tuple[Optional[str], float]]:
+        """Transcribe a whole utterance (int16 or float32, 16 kHz mono). Returns (text, (language, probability))."""
+        with metrics.timer("stt.transcribe"):
+            cached = self.language(session)
+            segments, info = self.decode(to_float32(audio), cached[0] if cached else None)
+        text = " ".join(seg.text for seg in segments).strip()
+        if cached:
+            return text, cached
+        self.remember_language(session, info.language, info.language_probability)
+        return text, (info.language, info.language_probability)
+
+    def stream(self, session: Optional[str] = None, **options) -> StreamingTranscriber:
+        """A StreamingTranscriber decoding on this pool, starting with the session's cached language."""
+        return StreamingTranscriber(self, session=session, **options)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_size,
+            "pool_size": self.pool_size,
+            "idle": self._pool.qsize(),
+            "transcriptions": self.transcriptions,
+            "greedy": self.greedy,
+            "sessions": len(self._languages),
+        }
@@ -1,31 +1,209 @@
-﻿import sounddevice as sd
+﻿import os
+import threading
+import time
+from typing import Optional, Union
+
+import numpy as np
 import openwakeword
+from openwakeword.utils import AudioFeatures
+
+from dashboard.services.metrics import metrics
+from dashboard.services.pipeline.capture import AudioCapture
 
 SAMPLE_RATE = 16000
 FRAME_DURATION_MS = 80
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)
+# openwakeword zeroes the first frames of a stream while its feature buffers fill up
+WARMUP_FRAMES = 5
+
+
+class WakeWord:
+    """
+    A wake word model and how it triggers.
+    Parameters:
+    - path: The openwakeword .onnx model.
+    - threshold: Score a frame must reach.
+    - patience: Consecutive frames at or above the threshold needed for a detection.
+    - debounce: Seconds of audio after a detection during which the model cannot trigger again on that stream.
+    """
+    def __init__(self, path: str, threshold: float = 0.5, patience: int = 1, debounce: float = 1.0):
+        self.path = path
+        self.name = os.path.basename(path)[:-len(".onnx")] if path.endswith(".onnx") else os.path.basename(path)
+        self.threshold = threshold
+        self.patience = max(1, patience)
+        self.debounce_frames = int(debounce * 1000 / FRAME_DURATION_MS)
+
+
+class Detection:
+    def __init__(self, stream: str, model: str, score: float, pos: int):
+        self.stream = stream
+        self.model = model
+        self.score = score
+        self.pos = pos # capture position right after the wake word
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class WakeStream:
+    """Feature buffers and trigger state of one audio input, e.g. one room microphone."""
+    def __init__(self, name: str, features: AudioFeatures, models: list[str]):
+        self.name = name
+        self.features = features
+        self.frames = 0
+        self.hits = {m: 0 for m in models} # consecutive frames above threshold
+        self.cooldown = {m: 0 for m in models} # frames left until the model may trigger again
+        self.scores = {m: 0.0 for m in models} # latest score per model
+        self.cpu_seconds = 0.0
+        self.errors = 0
+
+    @property
+    def cpu_load(self) -> float:
+        """CPU time spent per second of audio, 0.05 meaning 5% of one core."""
+        audio_seconds = self.frames * FRAME_DURATION_MS / 1000
+        return self.cpu_seconds / audio_seconds if audio_seconds else 0.0
 
+    def to_dict(self) -> dict:
+        return {"name": self.name, "frames": self.frames, "scores": dict(self.scores),
+                "cpu_load": self.cpu_load, "errors": self.errors}
 
-class WakeListener:
+
+class WakeEngine:
     """
-    Wraps an openwakeword engine. Replace model_path / API calls to match your local engine.
+    Scores several wake word models on several audio streams.
+
+    Each stream keeps its own openwakeword feature buffers (mel spectrogram and speech embeddings). Per 80 ms
+    frame window the features of all streams are stacked and every wake model runs once on the whole batch;
+    models exported with a fixed batch size of 1 fall back to one call per stream.
     """
-    def __init__(self, model_paths: list[str], sensitivity: float = 0.5):
-        self.model = openwakeword.Model(wakeword_model_paths=model_paths)
-        self.sensitivity = sensitivity
-
-    def listen(self):
-        """Blocking: yields when wake word is detected."""
-        with sd.InputStream(channels=1, samplerate=SAMPLE_RATE, dtype="int16", blocksize=FRAME_SIZE) as stream:
-            while True:
-                data, _ = stream.read(FRAME_SIZE)
-                pcm = data.ravel()
-                try:
-                    scores = self.model.predict(pcm).values()
-                    score = list(scores)[0] if scores and len(scores) > 0 else 0.0
-                    detected = score >= self.sensitivity
-                except Exception:
-                    detected = False
-                if detected:
-                    return
+    def __init__(self, words: list[Union[WakeWord, str]], sensitivity: float = 0.5):
+        self.words = [w if isinstance(w, WakeWord) else WakeWord(w, threshold=sensitivity) for w in words]
+        # Loads the classifier sessions and the shared feature models
+        self.model = openwakeword.Model(wakeword_model_paths=[w.path for w in self.words])
+        self._sessions = {w.name: self.model.models[w.name] for w in self.words}
+        self._batched = {name: _has_dynamic_batch(session) for name, session in self._sessions.items()}
+        self.streams: dict[str, WakeStream] = {}
+        self._lock = threading.Lock()
+
+    def add_stream(self, name: str) -> WakeStream:
+        with self._lock:
+            stream = self.streams.get(name)
+            if stream is None:
+                # The first stream reuses the preprocessor openwakeword created with the model
+                features = AudioFeatures() if self.streams else self.model.preprocessor
+                stream = self.streams[name] = WakeStream(name, features, list(self._sessions))
+            return stream
+
+    def remove_stream(self, name: str):
+        with self._lock:
+            self.streams.pop(name, None)
+
+    def process(self, frames: dict[str, np.ndarray]) -> list[Detection]:
+        """
+        Score one frame window. `frames` maps stream name to FRAME_SIZE int16 samples; streams without a frame
+        this window are skipped. Returns the detections (positions are left at 0, see listen()).
+        """
+        start = time.perf_counter()
+        failed = False
+        ready: list[WakeStream] = []
+        for name, pcm in frames.items():
+            stream = self.add_stream(name)
+            cpu = time.thread_time()
+            try:
+                stream.features(pcm)
+            except Exception as e:
+                self._error(stream, "feature extraction", e)
+                failed = True
+                continue
+            finally:
+                stream.cpu_seconds += time.thread_time() - cpu
+            stream.frames += 1
+            ready.append(stream)
+        if not ready:
+            return []
+
+        cpu = time.thread_time()
+        scores = {name: self._score(name, ready) for name in self._sessions}
+        failed = failed or any(batch is None for batch in scores.values())
+        share = (time.thread_time() - cpu) / len(ready)
+
+        detections = []
+        for i, stream in enumerate(ready):
+            stream.cpu_seconds += share
+            for word in self.words:
+                batch = scores[word.name]
+                score = 0.0 if batch is None or stream.frames <= WARMUP_FRAMES else float(batch[i])
+                stream.scores[word.name] = score
+                if stream.cooldown[word.name]:
+                    stream.cooldown[word.name] -= 1
+                    continue
+                stream.hits[word.name] = stream.hits[word.name] + 1 if score >= word.threshold else 0
+                if stream.hits[word.name] >= word.patience:
+                    stream.hits[word.name] = 0
+                    stream.cooldown[word.name] = word.debounce_frames
+                    detections.append(Detection(stream.name, word.name, score, 0))
+        metrics.observe("wake.predict", (time.perf_counter() - start) * 1000, error=failed)
+        return detections
+
+    def _score(self, name: str, streams: list[WakeStream]) -> Optional[np.ndarray]:
+        """Scores of one model for each stream, or None if the model failed."""
+        session = self._sessions[name]
+        input_name = self.model.model_input_names[name]
+        n_frames = self.model.model_inputs[name]
+        try:
+            features = [s.features.get_features(n_frames) for s in streams]
+            if self._batched[name] or len(features) == 1:
+                out = session.run(None, {input_name: np.concatenate(features)})[0]
+            else:
+                out = np.concatenate([session.run(None, {input_name: f})[0] for f in features])
+            # Multi-class models trigger on their best class
+            return out.reshape(len(streams), -1).max(axis=1)
+        except Exception as e:
+            for stream in streams:
+                self._error(stream, f"model {name}", e)
+            return None
+
+    def _error(self, stream: WakeStream, stage: str, e: Exception):
+        stream.errors += 1
+        # Log the first failure and then every 100th, a broken model would otherwise flood the log 12 times a second
+        if stream.errors == 1 or stream.errors % 100 == 0:
+            print(f"Wake word {stage} failed on stream {stream.name} ({stream.errors} errors): {e}")
+
+    def listen(self, captures: dict[str, AudioCapture], stop_event: Optional[threading.Event] = None,
+               start: Optional[int] = None) -> Optional[Detection]:
+        """
+        Blocking: returns the first detection on any of the captures, with the capture position right after it.
+        Returns None if stop_event is set or all captures stop first.
+        Parameters:
+        - start: Capture position to start scoring from, e.g. 0 for replayed audio. Defaults to now.
+        """
+        readers = {name: capture.reader(start) for name, capture in captures.items()}
+        for name in captures:
+            self.add_stream(name)
+        while not (stop_event and stop_event.is_set()):
+            frames = {}
+            for name, reader in readers.items():
+                # Captures run on the same clock, so after waiting for the first the others are ready too
+                pcm = reader.read(FRAME_SIZE, timeout=0.5 if not frames else 0.05)
+                if pcm is not None:
+                    frames[name] = pcm
+            if not frames:
+                if not any(capture.running for capture in captures.values()):
+                    return None
+                continue
+            detections = self.process(frames)
+            if detections:
+                best = max(detections, key=lambda d: d.score)
+                best.pos = readers[best.stream].pos
+                return best
+        return None
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [s.to_dict() for s in self.streams.values()]
+
 
+def _has_dynamic_batch(session) -> bool:
+    """True if the model's batch dimension is symbolic, so several streams fit into one run."""
+    dim = session.get_inputs()[0].shape[0]
+    return not isinstance(dim, int) or dim <= 0
@@ -0,0 +1,260 @@
+import collections
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from dashboard.services.model.model_manager import tagged_model
+
+MAX_FINISHED_JOBS = 1000
+# Jobs for models that are not loaded yield to jobs for loaded models for at most this long
+MAX_AFFINITY_WAIT = 10.0
+# A paced job stops reading from the model while its client is this many tokens behind
+MAX_UNREAD_TOKENS = 256
+# ... and is cancelled if the client does not catch up within this many seconds
+STALL_TIMEOUT = 60.0
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+
+class Job:
+    """
+    A queued prompt for one instance. Tokens are collected as they stream so clients can poll or follow them.
+
+    A paced job belongs to one streaming client: producing tokens waits while that client is MAX_UNREAD_TOKENS
+    behind, which in turn stops reading the model's HTTP stream, so a slow client slows down generation instead of
+    buffering the reply.
+    """
+    def __init__(self, instance_id: int, model: str, prompt: str, images=None, paced: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.instance_id = instance_id
+        self.model = model
+        self.prompt = prompt
+        self.images = images
+        self.status = "queued"
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = _now()
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+        self.tokens: list[str] = []
+        self.paced = paced
+        self.cancel_requested = False
+        self._consumed = 0
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def append_token(self, token: str) -> bool:
+        """Add a token. For a paced job, wait until the client has caught up. False if the job was cancelled."""
+        with self._cond:
+            self.tokens.append(token)
+            self._cond.notify_all()
+            if self.paced:
+                caught_up = self._cond.wait_for(
+                    lambda: self.cancel_requested or len(self.tokens) - self._consumed < MAX_UNREAD_TOKENS, STALL_TIMEOUT)
+                if not caught_up:
+                    print(f"Cancelling job {self.id}: client stopped reading")
+                    self.cancel_requested = True
+            return not self.cancel_requested
+
+    def tokens_after(self, cursor: int, timeout: Optional[float] = None) -> list[str]:
+        """Return tokens from index cursor on, waiting up to timeout for new ones."""
+        with self._cond:
+            if cursor > self._consumed:
+                self._consumed = cursor
+                self._cond.notify_all()
+            self._cond.wait_for(lambda: self.finished or len(self.tokens) > cursor, timeout)
+            return self.tokens[cursor:]
+
+    def cancel(self):
+        """Ask the running job to stop. It stops reading from the model at the next token."""
+        with self._cond:
+            self.cancel_requested = True
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout)
+
+    def _finish(self, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = _now()
+            self._cond.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "instance_id": self.instance_id,
+            "model": self.model,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobScheduler:
+    """
+    Runs instance prompts on a bounded worker pool.
+
+    Each instance has its own FIFO queue and at most one running job, so prompts to one instance are processed
+    in order while different instances run concurrently. Jobs are only dispatched while their model is below
+    its concurrency limit; otherwise they wait without occupying a worker.
+
+    With `resident_models` (e.g. ModelManager.resident_models), jobs whose model is already loaded are
+    dispatched first to avoid model swaps, unless a cold job has waited longer than MAX_AFFINITY_WAIT.
+    `on_finished(job, instance)` is called on the worker thread after every job that ran, e.g. to persist history.
+    """
+    def __init__(self, max_workers: int = 4, model_limits: Optional[dict[str, int]] = None, default_model_limit: int = 2,
+                 resident_models: Optional[Callable[[], set[str]]] = None,
+                 on_finished: Optional[Callable[[Job, object], None]] = None):
+        self.max_workers = max_workers
+        self.model_limits = model_limits or {}
+        self.default_model_limit = default_model_limit
+        self.resident_models = resident_models
+        self.on_finished = on_finished
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prompt-worker")
+        self._lock = threading.Lock()
+        self._queues: dict[int, collections.deque[tuple[Job, object]]] = {}
+        self._busy: set[int] = set()
+        self._running_per_model: collections.Counter[str] = collections.Counter()
+        self._jobs: collections.OrderedDict[str, Job] = collections.OrderedDict()
+        self._order = itertools.count()
+        self._enqueued_at: dict[str, int] = {}
+
+    def model_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.default_model_limit)
+
+    def submit(self, instance_id: int, instance, prompt: str, images=None, paced: bool = False) -> Job:
+        job = Job(instance_id, instance.model, prompt, images, paced)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._enqueued_at[job.id] = next(self._order)
+            self._queues.setdefault(instance_id, collections.deque()).append((job, instance))
+            self._trim()
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a job: a queued one is dropped, a running one stops generating. None if the job is unknown."""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        with self._lock:
+            queue = self._queues.get(job.instance_id, ())
+            queued = next((item for item in queue if item[0] is job), None)
+            if queued is not None:
+                queue.remove(queued)
+        if queued is not None:
+            job._finish("cancelled")
+        else:
+            job.cancel()
+        return job
+
+    def status(self, instance_id: int) -> str:
+        """Whether an instance has a job running, jobs queued, or is idle."""
+        with self._lock:
+            if instance_id in self._busy:
+                return "running"
+            return "queued" if self._queues.get(instance_id) else "idle"
+
+    def recent(self, limit: int) -> list[Job]:
+        """The last submitted jobs, newest first."""
+        with self._lock:
+            return list(itertools.islice(reversed(self._jobs.values()), limit))
+
+    def cancel_instance(self, instance_id: int):
+        """Cancel all queued jobs of an instance. A job that is already running finishes normally."""
+        with self._lock:
+            queue = self._queues.pop(instance_id, collections.deque())
+        for job, _ in queue:
+            job._finish("cancelled")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": sum(len(q) for q in self._queues.values()),
+                "running": len(self._busy),
+                "running_per_model": dict(self._running_per_model),
+            }
+
+    def _trim(self):
+        while len(self._jobs) > MAX_FINISHED_JOBS:
+            oldest = next(iter(self._jobs.values()))
+            if not oldest.finished:
+                break
+            self._jobs.popitem(last=False)
+            self._enqueued_at.pop(oldest.id, None)
+
+    def _priority(self, job: Job, resident: Optional[set[str]], now: float) -> tuple[int, int]:
+        warm = (resident is None or tagged_model(job.model) in resident
+                or self._running_per_model[job.model] > 0 or now - job.queued_at > MAX_AFFINITY_WAIT)
+        return 0 if warm else 1, self._enqueued_at[job.id]
+
+    def _dispatch(self):
+        # Read residency outside the lock, it may ask the Ollama server
+        resident = self.resident_models() if self.resident_models else None
+        now = time.monotonic()
+        with self._lock:
+            # Jobs for loaded models first, then oldest waiting job first, across instances
+            ready = sorted(
+                (iid for iid, q in self._queues.items() if q and iid not in self._busy),
+                key=lambda iid: self._priority(self._queues[iid][0][0], resident, now),
+            )
+            for iid in ready:
+                job, instance = self._queues[iid][0]
+                if self._running_per_model[job.model] >= self.model_limit(job.model):
+                    continue
+                if self._priority(job, resident, now)[0] and self._busy:
+                    continue # cold model: wait until the pool is idle so swaps happen one at a time
+                self._queues[iid].popleft()
+                self._busy.add(iid)
+                self._running_per_model[job.model] += 1
+                self._executor.submit(self._run, job, instance)
+
+    def _run(self, job: Job, instance):
+        job.status = "running"
+        job.started_at = _now()
+        try:
+            # Cancelled between dispatch and start: do not call the model at all
+            if not job.cancel_requested:
+                stream = instance.prompt_stream(job.prompt, job.images)
+                for token in stream:
+                    if not job.append_token(token):
+                        break
+                # Closing the stream closes the HTTP response, which makes Ollama stop generating
+                stream.close()
+            job._finish("cancelled" if job.cancel_requested else "done", result="".join(job.tokens))
+        except Exception as e:
+            job._finish("failed", result="".join(job.tokens), error=str(e))
+        finally:
+            if self.on_finished:
+                try:
+                    self.on_finished(job, instance)
+                except Exception as e:
+                    print(f"Failed to handle finished job {job.id}: {e}")
+            with self._lock:
+                self._busy.discard(job.instance_id)
+                self._running_per_model[job.model] -= 1
+                if not self._queues.get(job.instance_id):
+                    self._queues.pop(job.instance_id, None)
+            self._dispatch()
@@ -0,0 +1,115 @@
+import collections
+import itertools
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+import dashboard.services.conversation as conv
+
+MAX_EVENTS = 1000
+
+
+class ConversationSession:
+    """
+    A voice conversation running on a background thread.
+
+    Events emitted by the conversation loop are kept in a bounded buffer with increasing ids, so any number
+    of watchers can follow the same session from their own cursor without blocking each other.
+    """
+    def __init__(self, preset, rounds: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.preset = preset
+        self.rounds = rounds
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        self._events: collections.deque = collections.deque(maxlen=MAX_EVENTS)
+        self._event_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"conversation-{self.id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if self.status in ("starting", "running"):
+            self._set_status("stopping")
+        self._stop.set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("finished", "stopped", "failed")
+
+    def emit(self, kind: str, **data):
+        with self._cond:
+            self._events.append({
+                "id": next(self._event_ids),
+                "type": kind,
+                "time": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                **data,
+            })
+            self._cond.notify_all()
+
+    def events_after(self, cursor: int, timeout: Optional[float] = None) -> list[dict]:
+        """Return events with an id greater than cursor, waiting up to timeout for new ones."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.finished or (self._events and self._events[-1]["id"] > cursor), timeout)
+            return [e for e in self._events if e["id"] > cursor]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "preset": self.preset.name,
+            "rounds": self.rounds,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at,
+        }
+
+    def _set_status(self, status: str):
+        self.status = status
+        self.emit("status", status=status)
+
+    def _run(self):
+        self._set_status("running")
+        try:
+            conv.start_conversation(self.preset, self.rounds, emit=self.emit, stop_event=self._stop, session_id=self.id)
+            self._set_status("stopped" if self._stop.is_set() else "finished")
+        except Exception as e:
+            self.error = str(e)
+            self._set_status("failed")
+        finally:
+            if conv.whisper is not None:
+                conv.whisper.forget_session(self.id)
+
+
+sessions: dict[str, ConversationSession] = {}
+_lock = threading.Lock()
+
+def get_active_session() -> Optional[ConversationSession]:
+    """The voice pipeline has a single microphone, so at most one session runs at a time."""
+    return next((s for s in sessions.values() if not s.finished), None)
+
+def start_session(preset, rounds=999) -> tuple[ConversationSession, bool]:
+    """Start a session, or return the active one. Returns (session, started)."""
+    with _lock:
+        active = get_active_session()
+        if active is not None:
+            return active, False
+        session = ConversationSession(preset, rounds)
+        sessions[session.id] = session
+    session.start()
+    return session, True
+
+def stop_session(session_id: str) -> bool:
+    session = sessions.get(session_id)
+    if session is None:
+        return False
+    session.stop()
+    return True
+
+def get_session(session_id: str) -> Optional[ConversationSession]:
+    return sessions.get(session_id)
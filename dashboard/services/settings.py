@@ -0,0 +1,205 @@
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+SETTINGS_FILE = "user_settings.cfg"
+# How often reads check the file for edits made by hand or by another process
+RELOAD_INTERVAL = 1.0
+TRUE_VALUES = ("on", "true", "yes", "1")
+
+
+class Settings:
+    """
+    A snapshot of the user settings, parsed into their types. A change replaces the snapshot as a whole, so a
+    reader always sees one consistent set of values.
+    """
+    name: str = "Jarvisnet"
+    # Speak replies sentence by sentence while they are generated
+    prefer_streaming: bool = True
+    # Voice activity detection while recording (webrtcvad, 0-3)
+    vad_aggressiveness: int = 2
+    # Seconds of silence that end an utterance
+    silence_timeout: float = 1.5
+    # Seconds of speech needed to interrupt the assistant
+    barge_in_min_speech: float = 0.3
+    # Answer repeated prompts to the master preset from its response cache
+    response_cache: bool = False
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in FIELDS}
+
+
+FIELDS: dict[str, type] = dict(Settings.__annotations__)
+LIMITS = {"vad_aggressiveness": (0, 3), "silence_timeout": (0.1, 10.0), "barge_in_min_speech": (0.03, 5.0)}
+
+
+def parse_value(key: str, text: str):
+    """Convert the text of a setting to its type, clamped to its limits. Raises ValueError for malformed values."""
+    kind = FIELDS[key]
+    if kind is bool:
+        return text.strip().lower() in TRUE_VALUES
+    value = kind(text.strip())
+    # nan would pass the clamp below, since comparisons with it are always false
+    if kind is float and not math.isfinite(value):
+        raise ValueError(f"{key} must be a finite number")
+    if key in LIMITS:
+        low, high = LIMITS[key]
+        value = min(max(value, low), high)
+    return value
+
+
+def format_value(value) -> str:
+    return ("on" if value else "off") if isinstance(value, bool) else str(value)
+
+
+class SettingsService:
+    """
+    The user settings, kept in memory and persisted as key=value lines.
+
+    Reads return the current snapshot; at most every reload_interval seconds they check the file's modification
+    time and reparse it if it was edited outside the service. start_watcher() does the same check in the
+    background, so subscribers also learn about such edits when nothing reads. Updates are written to a temporary file that
+    replaces the settings file, so a crash never leaves it half written. Subscribers are called with the new
+    snapshot and the names of the settings that changed, and once with all of them when they subscribe.
+    Unknown keys in the file are kept as they are.
+    """
+    def __init__(self, path: str = SETTINGS_FILE, reload_interval: float = RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._snapshot = Settings()
+        self._extra: dict[str, str] = {}
+        self._mtime: Optional[int] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._subscribers: list[Callable[[Settings, set[str]], None]] = []
+        self._watcher: Optional[threading.Thread] = None
+
+    def get(self) -> Settings:
+        self.reload()
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[Settings, set[str]], None]) -> Callable[[], None]:
+        """Call callback(settings, changed) on every change. Returns a function that unsubscribes again."""
+        self._subscribers.append(callback)
+        self._notify(callback, self.get(), set(FIELDS))
+        return lambda: self._subscribers.remove(callback)
+
+    def start_watcher(self):
+        if self._watcher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.reload_interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Failed to reload settings from {self.path}: {e}")
+
+        self._watcher = threading.Thread(target=run, name="settings-watcher", daemon=True)
+        self._watcher.start()
+
+    def reload(self, force: bool = False):
+        """Reparse the file if it changed since it was last read."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        values, extra = self._read() if mtime is not None else ({}, {})
+        with self._lock:
+            self._mtime = mtime
+            self._extra = extra
+        self._apply(values)
+
+    def update(self, changes: dict[str, str]) -> Settings:
+        """Parse and store the changed settings (as text, e.g. from a form). Malformed values are ignored."""
+        self.reload(force=True)
+        values = self._snapshot.to_dict()
+        for key, text in changes.items():
+            if key not in FIELDS:
+                continue
+            try:
+                values[key] = parse_value(key, text)
+            except ValueError:
+                print(f"Failed to parse setting {key}={text!r}, keeping {values[key]!r}")
+        with self._lock:
+            self._write(values)
+        return self._apply(values)
+
+    def _read(self) -> tuple[dict, dict[str, str]]:
+        values, extra = {}, {}
+        try:
+            with open(self.path, "r", encoding="utf-8-sig") as f:
+                lines = f.readlines()
+        except OSError as e:
+            print(f"Failed to read settings from {self.path}: {e}")
+            return values, extra
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key, sep, text = line.partition("=")
+            key = key.strip()
+            if not sep:
+                print(f"Failed to parse line {number} of {self.path}: no '=' in {line!r}")
+            elif key not in FIELDS:
+                extra[key] = text
+            else:
+                try:
+                    values[key] = parse_value(key, text)
+                except ValueError:
+                    print(f"Failed to parse setting {key}={text!r} in {self.path}, using the default")
+        return values, extra
+
+    def _write(self, values: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".settings-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for key, value in values.items():
+                    f.write(f"{key}={format_value(value)}\n")
+                for key, text in self._extra.items():
+                    f.write(f"{key}={text}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates the file private to the owner
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _apply(self, values: dict) -> Settings:
+        with self._lock:
+            previous = self._snapshot
+            snapshot = Settings(**values)
+            changed = {key for key in FIELDS if getattr(snapshot, key) != getattr(previous, key)}
+            self._snapshot = snapshot
+        if changed:
+            for callback in list(self._subscribers):
+                self._notify(callback, snapshot, changed)
+        return snapshot
+
+    @staticmethod
+    def _notify(callback, settings: Settings, changed: set[str]):
+        try:
+            callback(settings, changed)
+        except Exception as e:
+            print(f"Failed to apply settings {', '.join(sorted(changed))}: {e}")
+
+
+user_settings = SettingsService()
@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from dashboard.repository.sqlite.db import (get_shared_data_version, load_shared_data_since, load_shared_entry,
+                                             save_shared_data, search_shared_data)
+
+# How often reads check the database for changes written by other processes
+REFRESH_INTERVAL = 1.0
+MAX_RESULTS = 20
+
+
+class SharedStore:
+    """
+    The storage shared by all instances: text entries under unique labels, with a store-wide version number.
+
+    Single entries are read through an in-memory cache. Writes through the store update the cache and notify the
+    subscribers right away. Changes written by other processes sharing the database are picked up incrementally by
+    version, at most every refresh_interval seconds, and published the same way.
+    Searches and change queries go to the database, which indexes labels, versions and contents.
+    """
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        # Latest change seen from the database; None until first use
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._cache: dict[str, tuple[str, int]] = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._subscribers: list[Callable[[str, str, int], None]] = []
+
+    def subscribe(self, callback: Callable[[str, str, int], None]) -> Callable[[], None]:
+        """Call callback(label, data, version) on every change. Returns a function that unsubscribes again."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def get(self, label: str) -> Optional[str]:
+        self.refresh()
+        with self._lock:
+            hit = self._cache.get(label)
+        if hit is not None:
+            self.hits += 1
+            return hit[0]
+        self.misses += 1
+        row = load_shared_entry(label)
+        if row is None:
+            return None
+        data, version = row
+        with self._lock:
+            self._cache.setdefault(label, (data, version))
+        return data
+
+    def put(self, label: str, data: str) -> int:
+        """Store data under label. Returns the version of the entry."""
+        self.refresh()
+        version = save_shared_data(label, data)
+        # Not advancing self.version: changes by other processes may have got lower versions in the meantime
+        self._apply(label, data, version)
+        return version
+
+    def refresh(self, force: bool = False):
+        """Apply the changes made by others since the last check."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_interval:
+            return
+        self._checked = now
+        if self.version is None:
+            self.version = get_shared_data_version()
+            return
+        for label, data, version in load_shared_data_since(self.version):
+            self._apply(label, data, version)
+            self.version = max(self.version, version)
+
+    def current_version(self) -> int:
+        return get_shared_data_version()
+
+    def changed_since(self, version: int, limit: int = MAX_RESULTS) -> list[dict]:
+        return [self._entry(row) for row in load_shared_data_since(version, limit)]
+
+    def search(self, keywords: Optional[str] = None, prefix: Optional[str] = None, since: int = 0,
+               limit: int = MAX_RESULTS) -> list[dict]:
+        """Entries matching any of the keywords and/or the label prefix, changed after since, best match first."""
+        return [self._entry(row) for row in search_shared_data(keywords, prefix, since, limit)]
+
+    def show(self, query: Optional[str] = None, prefix: Optional[str] = None, since_version: int = 0) -> dict:
+        """
+        The show_storage tool: matching (or, without query and prefix, changed) entries and the version to pass next
+        time. If there are more changes than fit, that is the version of the last one returned, so nothing is skipped.
+        """
+        self.refresh()
+        if query or prefix:
+            entries = self.search(query, prefix, since_version)
+        else:
+            entries = self.changed_since(since_version)
+            if len(entries) == MAX_RESULTS:
+                return {"version": entries[-1]["version"], "entries": entries, "more": True}
+        return {"version": self.current_version(), "entries": entries}
+
+    def stats(self) -> dict:
+        return {"version": self.version, "cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def _apply(self, label: str, data: str, version: int):
+        with self._lock:
+            if self._cache.get(label) == (data, version):
+                return # our own write, seen again by refresh
+            self._cache[label] = (data, version)
+        for callback in list(self._subscribers):
+            try:
+                callback(label, data, version)
+            except Exception as e:
+                print(f"Failed to notify about shared data {label}: {e}")
+
+    @staticmethod
+    def _entry(row: tuple[str, str, int]) -> dict:
+        label, data, version = row
+        return {"label": label, "data": data, "version": version}
+
+
+shared_store = SharedStore()
@@ -1,25 +1,104 @@
-﻿from pathlib import Path
-from flask import Flask
+﻿import argparse
+import time
+from pathlib import Path
+from flask import Flask, g, request
 
-from dashboard.repository.sqlite.db import create_tables, test_connection
-from dashboard.services.conversation import init_models
+from dashboard.repository.sqlite.db import create_tables
+from dashboard.services import conversation
+from dashboard.services.cluster import workers
+from dashboard.services.instance_controller import check_storage, instance_presets, restore_instances
+from dashboard.services.metrics import metrics
+from dashboard.services.model.model_manager import model_manager
+from dashboard.services.settings import user_settings
 from dashboard.routes.dashboard_routes import dashboard_bp
 from dashboard.routes.instance_routes import instance_bp
+from dashboard.routes.cluster_routes import cluster_bp
 
 WAKE_MODEL = "models/hey_jarvis_v0.1.onnx"
 VOICE = "models/de_DE-karlsson-low.onnx"
 WHISPER_MODEL = "small"
 WHISPER_DEVICE = "cpu"
+WHISPER_COMPUTE_TYPE = "int8"
+WHISPER_POOL_SIZE = 2
+WHISPER_CPU_THREADS = 2
+DEFAULT_PORT = 5000
+# Request threads of the production server; every open event stream holds one
+DEFAULT_THREADS = 32
+# Output buffered per connection before a stream waits for its client
+OUTPUT_BUFFER_BYTES = 65536
 
-if __name__ == "__main__":
-    create_tables()
-    connected = test_connection()
-    print(f"Database connected: {connected}")
-
-    init_models(WAKE_MODEL, VOICE, WHISPER_MODEL, WHISPER_DEVICE)
+# all: dashboard, instances and voice pipeline; the voice models load in the background after startup
+# dashboard: dashboard and instances only, the audio libraries are never imported
+# voice: dashboard and voice pipeline, with the voice models loaded before serving
+# Agent workers have their own entry point, worker.py, since they must set OLLAMA_HOST before importing anything
+ROLES = ("all", "dashboard", "voice")
+# waitress: production WSGI server (falls back to werkzeug if it is not installed); werkzeug: Flask's development server
+SERVERS = ("waitress", "werkzeug")
 
+def create_app() -> Flask:
     base = Path(__file__).resolve().parent
     app = Flask(__name__, root_path=str(base / "dashboard"))
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(instance_bp, url_prefix='/instance')
-    app.run(host='0.0.0.0', debug=True)
+    app.register_blueprint(cluster_bp, url_prefix='/cluster')
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        # Streaming responses are measured up to their headers
+        start = g.pop("request_start", None)
+        if start is not None and request.endpoint != "static":
+            metrics.observe(f"http.{request.endpoint or 'not_found'}", (time.perf_counter() - start) * 1000,
+                            error=response.status_code >= 500)
+        return response
+
+    return app
+
+def serve(app: Flask, host: str, port: int, server: str = "waitress", threads: int = DEFAULT_THREADS, debug: bool = False):
+    if server == "waitress" and not debug:
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            print("Failed to start waitress, it is not installed; using the development server")
+        else:
+            # The request lookahead lets streams notice clients that went away
+            waitress_serve(app, host=host, port=port, threads=threads, channel_request_lookahead=1,
+                           outbuf_high_watermark=OUTPUT_BUFFER_BYTES, ident="jarvisnet")
+            return
+    app.run(host=host, port=port, debug=debug, threaded=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Jarvisnet node")
+    parser.add_argument("--role", choices=ROLES, default="all")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--server", choices=SERVERS, default="waitress")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="Request threads of the waitress server")
+    parser.add_argument("--debug", action="store_true", help="Flask debug mode with the reloader on the development server (starts everything twice)")
+    args = parser.parse_args()
+
+    create_tables()
+    connected = check_storage()
+    print(f"Database connected: {connected}")
+    if args.role != "voice":
+        restore_instances()
+        workers.start_monitor()
+    model_manager.preload_presets(instance_presets)
+
+    if args.role != "dashboard":
+        conversation.init_models(WAKE_MODEL, VOICE, WHISPER_MODEL, WHISPER_DEVICE, whisper_compute_type=WHISPER_COMPUTE_TYPE,
+                                 whisper_pool_size=WHISPER_POOL_SIZE, whisper_cpu_threads=WHISPER_CPU_THREADS,
+                                 prewarm=args.role == "all")
+        if args.role == "voice":
+            conversation.ensure_models()
+
+    app = create_app()
+    metrics.start_rollup()
+    user_settings.start_watcher()
+    serve(app, args.host, args.port, args.server, args.threads, args.debug)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dashboard.repository.sqlite import db
+
+# Keep the tests away from the repository database
+db.path = os.path.join(tempfile.mkdtemp(prefix="jarvisnet-tests-"), "test.db")
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from dashboard.repository.sqlite import db
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """A database from before shared data was versioned."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("create table shared_data (label text primary key, data text)")
+    conn.executemany("insert into shared_data values (?, ?)", [("notes/wifi", "wifi password is hunter2"),
+                                                                ("notes/garden", "water the plants")])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "path", path)
+    yield path
+    db.close_connection()
+
+
+def test_migrated_rows_get_versions(legacy_db):
+    db.create_tables()
+    versions = [version for _, _, version in db.load_shared_data_since(0)]
+    assert len(versions) == 2
+    assert 0 not in versions and len(set(versions)) == 2
+    assert db.get_shared_data_version() == max(versions)
+
+
+def test_migrated_rows_are_found(legacy_db):
+    db.create_tables()
+    assert [label for label, _, _ in db.search_shared_data("wifi")] == ["notes/wifi"]
+    assert [label for label, _, _ in db.search_shared_data(prefix="notes/g")] == ["notes/garden"]
+
+
+def test_new_writes_come_after_migrated_rows(legacy_db):
+    db.create_tables()
+    before = db.get_shared_data_version()
+    assert db.save_shared_data("notes/new", "x") > before
+    # Running the migration again leaves the versions alone
+    db.create_tables()
+    assert db.get_shared_data_version() == before + 1
@@ -0,0 +1,88 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.stub_ollama import serve
+from dashboard.services import scheduler as scheduler_module
+from dashboard.services.model.model_manager import ModelManager
+from dashboard.services.scheduler import JobScheduler
+
+LOAD_MS = 60
+
+
+@pytest.fixture
+def stub():
+    """A stub Ollama server on a free port that keeps one model loaded."""
+    server, stub = serve(0, load_ms=LOAD_MS, tokens_per_second=1000, max_loaded=1)
+    stub.url = f"http://127.0.0.1:{server.server_port}"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def manager(stub):
+    return ModelManager(stub.url)
+
+
+class FakeInstance:
+    """Records the order prompts run in; prompts to a gated instance wait until the gate opens."""
+    def __init__(self, model, order, gate=None):
+        self.model = model
+        self.order = order
+        self.gate = gate
+
+    def prompt_stream(self, prompt, images=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.order.append(prompt)
+        yield prompt
+
+
+def test_preload_presets_loads_each_model_once(stub, manager):
+    presets = [SimpleNamespace(model="llama3.2", keep_alive="30m"), SimpleNamespace(model="qwen3", keep_alive=None),
+               SimpleNamespace(model="llama3.2", keep_alive=None)]
+    manager.preload_presets(presets, background=False)
+    assert stub.loads == {"llama3.2:latest": 1, "qwen3:latest": 1}
+    stats = {s["model"]: s for s in manager.stats()}
+    assert stats["llama3.2"]["loads"] == 1 and stats["qwen3"]["loads"] == 1
+    assert stats["llama3.2"]["last_load_ms"] >= LOAD_MS
+
+
+def test_residency_follows_loads_and_evictions(stub, manager):
+    manager.preload("llama3.2")
+    manager.refresh()
+    assert manager.resident_models() == {"llama3.2:latest"}
+    # The stub keeps one model, so loading another evicts the first
+    manager.preload("qwen3")
+    manager.refresh()
+    assert manager.is_resident("qwen3")
+    assert not manager.is_resident("llama3.2")
+    assert {s["model"]: s["resident"] for s in manager.stats()} == {"llama3.2": False, "qwen3": True}
+
+
+def _run_cold_then_warm(manager) -> list[str]:
+    """Queue a job for a cold model, then one for the resident model, while the only worker is busy."""
+    manager.preload("warm")
+    manager.refresh()
+    order = []
+    gate = threading.Event()
+    scheduler = JobScheduler(max_workers=1, resident_models=manager.resident_models)
+    busy = scheduler.submit(1, FakeInstance("warm", order, gate), "busy")
+    cold = scheduler.submit(2, FakeInstance("cold", order), "cold")
+    warm = scheduler.submit(3, FakeInstance("warm", order), "warm")
+    gate.set()
+    for job in (busy, cold, warm):
+        assert job.wait(5)
+    return order
+
+
+def test_scheduler_prefers_resident_models(manager):
+    assert _run_cold_then_warm(manager) == ["busy", "warm", "cold"]
+
+
+def test_scheduler_affinity_wait_is_bounded(manager, monkeypatch):
+    # A cold job that waited longer than MAX_AFFINITY_WAIT is dispatched in arrival order
+    monkeypatch.setattr(scheduler_module, "MAX_AFFINITY_WAIT", -1.0)
+    assert _run_cold_then_warm(manager) == ["busy", "cold", "warm"]
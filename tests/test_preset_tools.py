@@ -0,0 +1,54 @@
+import threading
+import time
+
+from ollama import ChatResponse, Message
+
+from dashboard.services.model import preset as preset_module
+from dashboard.services.model.preset import Preset
+from dashboard.services.model.request.tool import Tool
+
+
+def _call(name: str) -> Message.ToolCall:
+    return Message.ToolCall(function=Message.ToolCall.Function(name=name, arguments={}))
+
+
+class ToolCallingClient:
+    """An Ollama client whose model calls the same tool in every turn."""
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self.turns = 0
+
+    def chat(self, model, messages, tools, **kwargs):
+        self.turns += 1
+        return ChatResponse(model=model, message=Message(role="assistant", content="", tool_calls=[_call(self.tool_name)]))
+
+
+def test_hung_tool_does_not_hold_up_other_tools():
+    release = threading.Event()
+    hung = Tool("hang", "Never returns in time", func=lambda: release.wait(10), timeout=0.1)
+    quick = Tool("quick", "Returns right away", func=lambda: "ok")
+    preset = Preset("test", "stub", [hung, quick])
+    try:
+        # More hung calls than the shared pool has threads
+        for _ in range(preset_module._tool_pool._max_workers + 2):
+            preset._Preset__handle_tools([_call("hang")])
+        start = time.monotonic()
+        preset._Preset__handle_tools([_call("quick")])
+        assert time.monotonic() - start < 1
+        assert preset.history[-1].content == "ok"
+        assert "timed out" in preset.history[-2].content
+    finally:
+        release.set()
+
+
+def test_calls_past_the_round_cap_get_tool_messages():
+    tool = Tool("lookup", "Looks something up", func=lambda: "found")
+    preset = Preset("test", "stub", [tool], max_tool_rounds=2)
+    preset.client = ToolCallingClient("lookup")
+    preset.prompt("hi")
+    assert preset.client.turns == 3
+    # Every assistant message with tool calls is followed by one tool message per call
+    for i, message in enumerate(preset.history):
+        if message.role == "assistant":
+            assert preset.history[i + 1].role == "tool"
+    assert "limit of 2 tool rounds" in preset.history[-1].content
@@ -0,0 +1,67 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import Flask
+
+from dashboard.routes.instance_routes import instance_bp
+from dashboard.services import cluster, instance_controller
+
+INSTANCE_ID = 7
+
+
+@pytest.fixture
+def worker():
+    """A fake worker that answers every request with the path it received."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    info = cluster.workers.register(f"http://127.0.0.1:{server.server_port}", None, 1)
+    instance_controller.remote_instances[INSTANCE_ID] = info.id
+    yield info
+    instance_controller.remote_instances.pop(INSTANCE_ID, None)
+    cluster.workers.workers.pop(info.id, None)
+    server.shutdown()
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(instance_bp, url_prefix='/instance')
+    return app.test_client()
+
+
+@pytest.mark.parametrize("path", [
+    "/instance/prompt/7/what%20time%20is%20it",
+    "/instance/prompt/7/caf%C3%A9",
+    "/instance/prompt/7/caf%C3%A9?x=%C3%A9&y=1",
+])
+def test_forwards_encoded_path(worker, client, path):
+    res = client.get(path)
+    assert res.status_code == 200
+    assert res.get_data(as_text=True) == path
+
+
+def test_unreachable_worker_is_bad_gateway(worker, client):
+    worker.url = "http://127.0.0.1:1"
+    res = client.get("/instance/prompt/7/caf%C3%A9")
+    assert res.status_code == 502
+
+
+def test_forwards_path_without_raw_uri(worker, client):
+    # Servers that do not pass the raw request line (e.g. waitress)
+    res = client.get("/instance/prompt/7/what%20time%20is%20caf%C3%A9",
+                     environ_overrides={"RAW_URI": "", "REQUEST_URI": ""})
+    assert res.status_code == 200
+    assert res.get_data(as_text=True) == "/instance/prompt/7/what%20time%20is%20caf%C3%A9"
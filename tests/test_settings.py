@@ -0,0 +1,23 @@
+import threading
+
+from dashboard.services.settings import SettingsService
+
+
+def test_watcher_notifies_subscribers_of_edits_to_the_file(tmp_path):
+    path = tmp_path / "user_settings.cfg"
+    path.write_text("silence_timeout=1.5\n")
+    service = SettingsService(str(path), reload_interval=0.05)
+    changes = []
+    notified = threading.Event()
+
+    def on_change(settings, changed):
+        changes.append((settings.silence_timeout, changed))
+        if settings.silence_timeout == 2.0:
+            notified.set()
+
+    service.subscribe(on_change)
+    service.start_watcher()
+    path.write_text("silence_timeout=2.0\n")
+    # Nothing calls get(): the watcher has to pick up the edit
+    assert notified.wait(5)
+    assert changes[-1] == (2.0, {"silence_timeout"})
@@ -0,0 +1,57 @@
+"""A Jarvisnet worker: runs instances placed on it by a coordinator (main.py), against its own Ollama server.
+
+The coordinator proxies /instance/* requests for these instances here. Several workers can run on one machine:
+    python worker.py --port 5101 --ollama http://127.0.0.1:11434 --coordinator http://127.0.0.1:5000
+    python worker.py --port 5102 --ollama http://127.0.0.1:11435 --coordinator http://127.0.0.1:5000
+"""
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--coordinator", required=True, help="Base URL of the coordinator")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=5101)
+    parser.add_argument("--url", help="URL under which the coordinator reaches this worker (default http://127.0.0.1:PORT)")
+    parser.add_argument("--ollama", help="Ollama server of this worker (default OLLAMA_HOST)")
+    parser.add_argument("--db", help="SQLite database of this worker (default worker-PORT.db); must not be the "
+                                     "coordinator's, which keeps its own instance records")
+    args = parser.parse_args()
+
+    # The model manager and every preset read OLLAMA_HOST when they are created, so set it before importing them
+    if args.ollama:
+        os.environ["OLLAMA_HOST"] = args.ollama
+
+    from flask import Flask
+    from dashboard.repository.sqlite import db
+    from dashboard.repository.sqlite.db import create_tables
+    from dashboard.routes.instance_routes import instance_bp
+    from dashboard.services import instance_controller
+    from dashboard.services.cluster import WorkerAgent
+    from dashboard.services.model.model_manager import model_manager
+    from dashboard.services.settings import user_settings
+    from main import serve
+
+    db.path = args.db or f"worker-{args.port}.db"
+    create_tables()
+    instance_controller.check_storage()
+    model_manager.preload_presets(instance_controller.instance_presets)
+    user_settings.start_watcher()
+
+    app = Flask(__name__)
+    app.register_blueprint(instance_bp, url_prefix='/instance')
+
+    agent = WorkerAgent(args.coordinator, args.url or f"http://127.0.0.1:{args.port}", os.environ.get("OLLAMA_HOST"),
+                        instance_controller.scheduler.max_workers, instance_controller.load_status,
+                        # After registering again the coordinator no longer routes to the old instances
+                        on_register=instance_controller.clear_instances)
+    agent.start()
+    try:
+        serve(app, args.host, args.port)
+    finally:
+        agent.stop()
+
+
+if __name__ == "__main__":
+    main()